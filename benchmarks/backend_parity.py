@@ -0,0 +1,82 @@
+"""
+Check that an exported inference backend finds the same boxes as the ultralytics reference, and compare their speed.
+
+Every reference box must be matched by a box of the candidate backend with at least `--min-iou` IoU and a confidence
+within `--conf-tolerance`, and vice versa. Exits with status 1 when the backends disagree.
+
+Usage:
+    python benchmarks/backend_parity.py models/rgb/best.pt images/ [--backend onnxruntime] [--conf 0.3]
+"""
+import argparse
+import sys
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from advanced_pest_detection.detection.backends import create_backend
+from advanced_pest_detection.detection.frame import Frame
+from advanced_pest_detection.fusion.fusion_module import box_iou, xywh_to_xyxy
+from advanced_pest_detection.image_capture.ingest import iter_image_paths
+
+
+def unmatched(reference: np.ndarray, candidate: np.ndarray, min_iou: float, conf_tolerance: float) -> int:
+    """Number of reference boxes without a candidate box of at least `min_iou` IoU and a close enough confidence."""
+    if not len(reference):
+        return 0
+    if not len(candidate):
+        return len(reference)
+    iou = box_iou(xywh_to_xyxy(reference[:, :4]), xywh_to_xyxy(candidate[:, :4]))
+    close = np.abs(reference[:, 4:5] - candidate[None, :, 4]) <= conf_tolerance
+    return int(np.sum(~np.any((iou >= min_iou) & close, axis=1)))
+
+
+def timed_predict(backend, images: List[np.ndarray], conf: float) -> Tuple[List[np.ndarray], float]:
+    start = time.perf_counter()
+    predictions = backend.predict(images, conf)
+    return predictions, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare an exported inference backend against ultralytics")
+    parser.add_argument("model_path", help="YOLO model file (.pt)")
+    parser.add_argument("source", help="Image directory, glob pattern or single image")
+    parser.add_argument("--backend", default="onnxruntime", help="Backend to check: onnxruntime or openvino")
+    parser.add_argument("--conf", type=float, default=0.3, help="Confidence threshold")
+    parser.add_argument("--min-iou", type=float, default=0.9, help="IoU at which two boxes count as the same")
+    parser.add_argument("--conf-tolerance", type=float, default=0.05, help="Allowed confidence difference")
+    parser.add_argument("--imgsz", type=int, default=640, help="Input size of the exported model")
+    parser.add_argument("--batch-size", type=int, default=8, help="Images per predict call")
+    args = parser.parse_args()
+
+    reference = create_backend("ultralytics", args.model_path)
+    candidate = create_backend(args.backend, args.model_path, {"imgsz": args.imgsz})
+
+    paths = list(iter_image_paths(args.source))
+    totals = {"images": 0, "reference_boxes": 0, "missing": 0, "extra": 0, "reference_s": 0.0, "candidate_s": 0.0}
+    for start in range(0, len(paths), args.batch_size):
+        images = [Frame(path).image for path in paths[start:start + args.batch_size]]
+        reference_predictions, reference_seconds = timed_predict(reference, images, args.conf)
+        candidate_predictions, candidate_seconds = timed_predict(candidate, images, args.conf)
+        totals["images"] += len(images)
+        totals["reference_s"] += reference_seconds
+        totals["candidate_s"] += candidate_seconds
+        for path, expected, actual in zip(paths[start:], reference_predictions, candidate_predictions):
+            missing = unmatched(expected, actual, args.min_iou, args.conf_tolerance)
+            extra = unmatched(actual, expected, args.min_iou, args.conf_tolerance)
+            totals["reference_boxes"] += len(expected)
+            totals["missing"] += missing
+            totals["extra"] += extra
+            if missing or extra:
+                print(f"{path}: {len(expected)} reference boxes, {missing} missing, {extra} extra")
+
+    images = max(totals["images"], 1)
+    print(f"{totals['images']} images, {totals['reference_boxes']} reference boxes, "
+          f"{totals['missing']} missing and {totals['extra']} extra in {args.backend}")
+    print(f"ultralytics: {1000 * totals['reference_s'] / images:.1f} ms/image, "
+          f"{args.backend}: {1000 * totals['candidate_s'] / images:.1f} ms/image")
+    sys.exit(1 if totals["missing"] or totals["extra"] else 0)
+
+
+if __name__ == "__main__":
+    main()
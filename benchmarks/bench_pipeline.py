@@ -0,0 +1,304 @@
+"""
+Reproducible benchmark of the detection pipeline stages on synthetic frames.
+
+Every stage of a capture is timed on its own: RGB detection, Thermal detection, coordinate fusion, annotated image
+saving, and metadata persistence (per-inference JSON files and the results store). The report covers latency
+percentiles, frames per second, peak RSS, and throughput scaling with the batch size and the number of threads.
+
+By default the models are replaced by a small numpy stand-in registered as the "synthetic" backend, so the suite runs
+offline and without model weights; pass --backend and --model to benchmark a real model instead. Results can be saved
+as JSON and compared against a previous run to catch regressions.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--resolution 1280x720] [--frames 50] [--batch-sizes 1 4 16]
+                                        [--threads 1 2 4] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from advanced_pest_detection.data_handling.results_store import ResultsStore
+from advanced_pest_detection.detection.backends import BACKENDS, InferenceBackend, letterbox
+from advanced_pest_detection.detection.frame import Frame
+from advanced_pest_detection.detection.pest_detector import PestDetector
+from advanced_pest_detection.utils import build_inference_metadata, prepare_inference_results, save_inference_metadata
+
+# Relative slowdown of a metric over the baseline that counts as a regression
+DEFAULT_TOLERANCE = 0.10
+
+
+class SyntheticBackend(InferenceBackend):
+    name = "synthetic"
+
+    def __init__(self, model_path: str, imgsz: int = 640, grid: int = 20, seed: int = 0):
+        """
+        Deterministic stand-in for a YOLO model. It letterboxes the frames like an exported model, runs one random
+        3x3 convolution layer over a downsampled copy of each frame and reports the brightest grid cells as boxes,
+        so its cost grows with the batch and the resolution the way a real model's does.
+
+        :param model_path: Ignored; only used as the registry key.
+        :param imgsz: Square input size.
+        :param grid: Cells per side of the detection grid.
+        :param seed: Seed of the convolution weights.
+        """
+        self.model_path = model_path
+        self.imgsz = imgsz
+        self.grid = grid
+        self.weights = np.random.default_rng(seed).normal(0, 0.1, size=(3, 3, 3, 8)).astype(np.float32)
+
+    def predict(self, images: List[np.ndarray], conf: float) -> List[np.ndarray]:
+        small = np.stack([letterbox(image, self.imgsz)[0][::4, ::4] for image in images]).astype(np.float32) / 255.0
+        height, width = small.shape[1] - 2, small.shape[2] - 2
+        features = np.zeros((len(images), height, width, self.weights.shape[-1]), dtype=np.float32)
+        for dy in range(3):
+            for dx in range(3):
+                features += small[:, dy:dy + height, dx:dx + width] @ self.weights[dy, dx]
+        activation = np.maximum(features, 0).mean(axis=-1)
+
+        cell_h, cell_w = height // self.grid, width // self.grid
+        cells = activation[:, :cell_h * self.grid, :cell_w * self.grid]
+        scores = cells.reshape(len(images), self.grid, cell_h, self.grid, cell_w).mean(axis=(2, 4))
+        scores = scores / (scores.max(axis=(1, 2), keepdims=True) + 1e-6)
+
+        predictions = []
+        for image_scores in scores:
+            rows, cols = np.nonzero(image_scores > max(conf, 0.5))
+            size = 1.0 / self.grid
+            predictions.append(np.column_stack([
+                (cols + 0.5) * size, (rows + 0.5) * size, np.full(len(rows), size), np.full(len(rows), size),
+                image_scores[rows, cols],
+            ]).reshape(-1, 5))
+        return predictions
+
+
+BACKENDS[SyntheticBackend.name] = SyntheticBackend
+
+
+def make_frames(count: int, width: int, height: int, seed: int) -> Tuple[List[Frame], List[Frame]]:
+    """Build RGB and Thermal frames of noise with a few bright rectangles standing in for pests."""
+    rng = np.random.default_rng(seed)
+    rgb_frames, thermal_frames = [], []
+    for _ in range(count):
+        rgb = rng.integers(0, 80, size=(height, width, 3), dtype=np.uint8)
+        for _ in range(5):
+            x, y = rng.integers(0, width - 40), rng.integers(0, height - 40)
+            rgb[y:y + 40, x:x + 40] = 230
+        thermal = np.repeat(rgb.mean(axis=2, keepdims=True).astype(np.uint8), 3, axis=2)
+        rgb_frames.append(Frame(image=rgb))
+        thermal_frames.append(Frame(image=thermal))
+    return rgb_frames, thermal_frames
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    """Percentiles and mean of latency samples given in seconds, in milliseconds."""
+    values = np.asarray(samples) * 1000
+    return {
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p90_ms": float(np.percentile(values, 90)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+def timed(samples: Dict[str, List[float]], stage: str, function: Callable, *args) -> Any:
+    start = time.perf_counter()
+    result = function(*args)
+    samples.setdefault(stage, []).append(time.perf_counter() - start)
+    return result
+
+
+def bench_stages(detector: PestDetector, rgb_frames: List[Frame], thermal_frames: List[Frame],
+                 output_dir: str, warmup: int) -> Dict[str, Any]:
+    """Run every capture through the pipeline stages one after the other, timing each stage."""
+    samples: Dict[str, List[float]] = {}
+    store = ResultsStore(os.path.join(output_dir, "results"), flush_records=1000)
+    location_info = {"latitude": 24.86, "longitude": 67.0}
+    image_dir = os.path.join(output_dir, "images")
+    metadata_dir = os.path.join(output_dir, "metadata")
+    os.makedirs(image_dir, exist_ok=True)
+    os.makedirs(metadata_dir, exist_ok=True)
+
+    for index, (rgb_frame, thermal_frame) in enumerate(zip(rgb_frames, thermal_frames)):
+        frame_samples: Dict[str, List[float]] = {}
+        start = time.perf_counter()
+        rgb = timed(frame_samples, "rgb_detect", detector.rgb_detect, rgb_frame)
+        thermal = timed(frame_samples, "thermal_detect", detector.thermal_detect, thermal_frame)
+        final = timed(frame_samples, "combine_coordinates", detector.combine_coordinates, rgb, thermal)
+        image_path = timed(frame_samples, "save_detected_image", detector.save_detected_image, rgb_frame, final, image_dir)
+        results = prepare_inference_results(rgb, thermal, final, "rgb.jpg", "thermal.jpg")
+        timed(frame_samples, "save_inference_metadata", save_inference_metadata, results, location_info, metadata_dir,
+              image_path)
+        timed(frame_samples, "results_store_append", store.append,
+              build_inference_metadata(results, location_info, image_path))
+        frame_samples["frame"] = [time.perf_counter() - start]
+        if index >= warmup:
+            for stage, values in frame_samples.items():
+                samples.setdefault(stage, []).extend(values)
+    store.close()
+
+    frame_seconds = sum(samples["frame"])
+    return {
+        "stages": {stage: latency_stats(values) for stage, values in samples.items()},
+        "fps": len(samples["frame"]) / frame_seconds,
+    }
+
+
+def bench_batch_sizes(detector: PestDetector, rgb_frames: List[Frame], thermal_frames: List[Frame],
+                      batch_sizes: List[int], repeats: int) -> Dict[str, float]:
+    """Detection throughput in frames per second for each batch size, best of `repeats` runs."""
+    throughput = {}
+    for batch_size in batch_sizes:
+        detector.batch_size = batch_size
+        detector.detect_batch(rgb_frames[:batch_size], thermal_frames[:batch_size])
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            detector.detect_batch(rgb_frames, thermal_frames)
+            best = min(best, time.perf_counter() - start)
+        throughput[str(batch_size)] = len(rgb_frames) / best
+    return throughput
+
+
+def bench_threads(detector: PestDetector, rgb_frames: List[Frame], thermal_frames: List[Frame],
+                  thread_counts: List[int], repeats: int) -> Dict[str, float]:
+    """Detection and fusion throughput in frames per second when `threads` captures are processed at once."""
+    def process(index: int) -> None:
+        rgb, thermal = detector.detect(rgb_frames[index], thermal_frames[index], with_confidence=True)
+        detector.combine_coordinates(rgb, thermal)
+
+    throughput = {}
+    for threads in thread_counts:
+        best = float("inf")
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for _ in range(repeats):
+                start = time.perf_counter()
+                list(executor.map(process, range(len(rgb_frames))))
+                best = min(best, time.perf_counter() - start)
+        throughput[str(threads)] = len(rgb_frames) / best
+    return throughput
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results: Dict[str, Any]) -> Dict[str, Tuple[float, bool]]:
+    """Comparable metrics of a results document as name -> (value, higher_is_better)."""
+    metrics = {"fps": (results["fps"], True), "peak_rss_mb": (results["peak_rss_mb"], False)}
+    for stage, stats in results["stages"].items():
+        for name in ("p50_ms", "p90_ms"):
+            metrics[f"{stage}.{name}"] = (stats[name], False)
+    for name in ("batch_size_fps", "thread_fps"):
+        for key, value in results.get(name, {}).items():
+            metrics[f"{name}.{key}"] = (value, True)
+    return metrics
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Print every metric next to its baseline value and return the names of the regressed ones."""
+    current, previous = flatten(results), flatten(baseline)
+    regressions = []
+    print(f"\nComparison against {baseline.get('commit') or 'baseline'} (tolerance {tolerance:.0%}):")
+    print(f"{'metric':<42} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, (value, higher_is_better) in current.items():
+        if name not in previous:
+            continue
+        old = previous[name][0]
+        change = (value - old) / old if old else 0.0
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<42} {old:>10.2f} {value:>10.2f} {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the detection pipeline stages on synthetic frames")
+    parser.add_argument("--resolution", default="1280x720", help="Frame size as WIDTHxHEIGHT")
+    parser.add_argument("--frames", type=int, default=50, help="Captures per measurement")
+    parser.add_argument("--warmup", type=int, default=3, help="Captures run before timing starts")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per scaling point; the best one is kept")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16], help="Batch sizes to scale over")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4], help="Thread counts to scale over")
+    parser.add_argument("--backend", default=SyntheticBackend.name, help="Inference backend")
+    parser.add_argument("--model", default=None, help="Model file for real backends; both modalities use it")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic frames")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="Compare against the results JSON of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative change that counts as a regression")
+    args = parser.parse_args()
+
+    width, height = (int(value) for value in args.resolution.lower().split("x"))
+    if args.backend != SyntheticBackend.name and not args.model:
+        parser.error("--model is required for real backends")
+    rgb_model = args.model or "synthetic-rgb"
+    thermal_model = args.model or "synthetic-thermal"
+
+    rgb_frames, thermal_frames = make_frames(args.frames + args.warmup, width, height, args.seed)
+    with tempfile.TemporaryDirectory() as output_dir, \
+            PestDetector(rgb_model, thermal_model, backend=args.backend) as detector:
+        stages = bench_stages(detector, rgb_frames, thermal_frames, output_dir, args.warmup)
+        frames, thermal = rgb_frames[args.warmup:], thermal_frames[args.warmup:]
+        batch_fps = bench_batch_sizes(detector, frames, thermal, args.batch_sizes, args.repeats)
+        thread_fps = bench_threads(detector, frames, thermal, args.threads, args.repeats)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "stages": stages["stages"],
+        "fps": stages["fps"],
+        "batch_size_fps": batch_fps,
+        "thread_fps": thread_fps,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    print(f"{'stage':<24} {'mean ms':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage, stats in results["stages"].items():
+        print(f"{stage:<24} {stats['mean_ms']:>9.2f} {stats['p50_ms']:>9.2f} {stats['p90_ms']:>9.2f} "
+              f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}")
+    print(f"\nEnd-to-end: {results['fps']:.1f} frames/s, peak RSS {results['peak_rss_mb']:.0f} MiB")
+    print("Batch size scaling (frames/s): " + ", ".join(f"{k}: {v:.1f}" for k, v in batch_fps.items()))
+    print("Thread scaling (frames/s):     " + ", ".join(f"{k}: {v:.1f}" for k, v in thread_fps.items()))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
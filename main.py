@@ -1,30 +1,64 @@
 import argparse
+import asyncio
 import logging
 from datetime import datetime
 import os
-import time
-from typing import Dict, Any
+import sys
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from advanced_pest_detection.startup_profile import StartupProfile
+
+# Import timing has to begin before the imports below, which pull in the heavier dependencies
+startup_profile = StartupProfile(enabled="--profile-startup" in sys.argv[1:]).start()
 
 from omegaconf import OmegaConf
 
 # Package
 from advanced_pest_detection.image_capture.icm import get_image_capture_module
-from advanced_pest_detection.detection.pest_detector import PestDetector
-from advanced_pest_detection.gps.gps_module import GPSLocator
-from advanced_pest_detection.utils import prepare_inference_results, save_inference_metadata
+from advanced_pest_detection.image_capture.ingest import batched, iter_image_paths, prefetch_frames, watch_directory
+from advanced_pest_detection.image_capture.supervisor import get_camera_supervisor
+from advanced_pest_detection.detection.pest_detector import get_pest_detector
+from advanced_pest_detection.detection.frame import FrameCache
+from advanced_pest_detection.detection.image_writer import get_image_writer
+from advanced_pest_detection.detection.change_gate import get_change_gate
+from advanced_pest_detection.gps.gps_module import get_gps_locator
+from advanced_pest_detection.data_handling.cloud_storage import get_cloud_storage
+from advanced_pest_detection.pipeline import CapturePipeline
+from advanced_pest_detection.tracking.tracker import PestTracker, get_tracker
+from advanced_pest_detection.metrics import default_metrics, get_metrics_service
+from advanced_pest_detection.data_handling.results_store import get_results_store
+from advanced_pest_detection.utils import (build_capture_metadata, build_inference_metadata, build_track_metadata,
+                                           prepare_inference_results)
 
 # Constants
 DEFAULT_CONFIG_PATH = "/Users/alirizvi/Desktop/Ali/advanced_pest_detection/config/config.yaml"
 DEFAULT_DATA_ROOT_DIR = "./data/"
 DEFAULT_SAVE_DIR = "./records"
 DEFAULT_BATCH_SIZE = 16
-MAIN_LOOP_INTERVAL = 5  # seconds
+DEFAULT_QUEUE_SIZE = 4
+DEFAULT_DECODE_WORKERS = 4
 
 def build_args() -> argparse.Namespace:
     """Parse and return command-line arguments."""
     parser = argparse.ArgumentParser(description="Advanced Pest Detection System")
     parser.add_argument("--config_path", type=str, default=DEFAULT_CONFIG_PATH, help="Path to the configuration file")
-    parser.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE, help="Batch size for processing")
+    parser.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE, help="Maximum number of frames per model forward pass")
+    parser.add_argument("--concurrent", action="store_true", help="Run RGB and thermal detection in parallel")
+    parser.add_argument("--queue_size", type=int, default=DEFAULT_QUEUE_SIZE, help="Captures buffered between pipeline stages")
+    parser.add_argument("--ingest", type=str, default=None,
+                        help="Process every image in a directory, glob pattern or file instead of running the capture schedule")
+    parser.add_argument("--watch", action="store_true", help="With --ingest DIR, keep processing images as they land in DIR")
+    parser.add_argument("--recursive", action="store_true", help="With --ingest DIR, also process sub-directories")
+    parser.add_argument("--cameras", action="store_true",
+                        help="Capture from every camera pair of the `cameras` configuration section, each camera in its own process")
+    parser.add_argument("--decode_workers", type=int, default=DEFAULT_DECODE_WORKERS, help="Threads decoding images ahead of inference")
+    parser.add_argument("--warmup", action="store_true",
+                        help="Load the models and run a dummy inference in the background instead of before the first capture")
+    parser.add_argument("--profile-startup", dest="profile_startup", action="store_true",
+                        help="Log per-import, per-stage and per-model-load start-up timings")
+    parser.add_argument("--log_level", type=str, default="INFO",
+                        help="Logging level; DEBUG adds per-frame detection details")
     parser.add_argument("--data_root_dir", type=str, default=DEFAULT_DATA_ROOT_DIR, help="Root directory for data")
     parser.add_argument("--save_dir", type=str, default=DEFAULT_SAVE_DIR, help="Directory to save output samples")
     return parser.parse_args()
@@ -32,67 +66,278 @@ def build_args() -> argparse.Namespace:
 def main(args: argparse.Namespace) -> None:
     """Main function to run the pest detection process."""
     logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    logging.getLogger().setLevel(args.log_level.upper())
     logging.info("Starting the pest detection process")
 
     # Load configuration
-    config = OmegaConf.load(args.config_path)
-    rgb_model_path = config.rgb_model.path
-    thermal_model_path = config.thermal_model.path
+    with startup_profile.stage("load configuration"):
+        config = OmegaConf.load(args.config_path)
     logging.info(f"Configuration loaded from {args.config_path}")
 
     # Initialize modules
-    pest_detector = PestDetector(rgb_model_path=rgb_model_path, thermal_model_path=thermal_model_path)
-    gps_locator = GPSLocator()
-    image_capture_module = get_image_capture_module(config, args.data_root_dir)
+    with startup_profile.stage("create PestDetector"):
+        pest_detector = get_pest_detector(
+            config, batch_size=args.batch_size, concurrent=args.concurrent,
+            lazy=True if args.warmup else None,
+            image_writer=get_image_writer(config)
+        )
+    with startup_profile.stage("start GPSLocator"):
+        gps_locator = get_gps_locator(config).start()
+    with startup_profile.stage("create ImageCaptureModule"):
+        image_capture_module = get_image_capture_module(config, args.data_root_dir)
+    with startup_profile.stage("start CloudStorage"):
+        cloud_storage = get_cloud_storage(config)
+        if cloud_storage is not None:
+            cloud_storage.start()
+    change_gate = get_change_gate(config)
+    metrics_service = get_metrics_service(config)
+    if metrics_service is not None:
+        metrics_service.start()
+    frames_processed = default_metrics.counter("frames_processed_total", "Captures fully processed and persisted")
+    frames_deduplicated = default_metrics.counter(
+        "frames_deduplicated_total",
+        "Captures persisted as a capture record only, because every pest in them was already tracked")
+    # One tracker per capture sequence: the scheduled capture or each camera pair
+    trackers: Dict[str, PestTracker] = {}
+    frame_records = (config.get("tracking") or {}).get("frame_records", "new_tracks")
     logging.info("PestDetector, GPSLocator, and ImageCaptureModule initialized")
+
+    def record_model_loads() -> None:
+        for backend in {pest_detector.rgb_detector.backend, pest_detector.thermal_detector.backend}:
+            startup_profile.record(f"load model {backend.model_path}", backend.load_seconds)
+
+    def warm_up() -> None:
+        """Load the models and run one dummy inference, so that the first capture does not pay for it."""
+        try:
+            with startup_profile.stage("model warm-up"):
+                pest_detector.warmup()
+            logging.info("Models loaded and warmed up")
+        except Exception as e:
+            logging.error(f"Model warm-up failed, models will load on the first capture: {e}")
+        record_model_loads()
+        startup_profile.report("Startup profile after model warm-up")
+        startup_profile.stop()
+
+    if args.warmup:
+        threading.Thread(target=warm_up, name="model-warmup", daemon=True).start()
     
     # Create directories for saving results if they don't exist
     image_save_dir = os.path.join(args.save_dir, "images")
-    metadata_save_dir = os.path.join(args.save_dir, "metadata")
     os.makedirs(image_save_dir, exist_ok=True)
-    os.makedirs(metadata_save_dir, exist_ok=True)
-
-    while True:
-            try:
-                should_run_inference, rgb_image_path, thermal_image_path = image_capture_module.run()
-                
-                if should_run_inference:
-                    # Get location information
-                    location_info = gps_locator.get_current_location()
-                    if not location_info:
-                        logging.warning("Unable to retrieve location information")
-                        location_info = {}  # Use an empty dict if location info is not available
-
-                    # Perform detections
-                    rgb_coordinates = pest_detector.rgb_detect(image=rgb_image_path)
-                    thermal_coordinates = pest_detector.thermal_detect(image=thermal_image_path)
-                    final_coordinates = pest_detector.combine_coordinates(rgb_coordinates, thermal_coordinates)
-
-                    logging.info(f"RGB detection completed. Coordinates: {rgb_coordinates}")
-                    logging.info(f"Thermal detection completed. Coordinates: {thermal_coordinates}")
-
-                    # Save the image with detections
-                    saved_image_path = pest_detector.save_detected_image(
-                        image=rgb_image_path, 
-                        final_coordinates=final_coordinates, 
-                        save_dir=image_save_dir
-                    )
-                    logging.info("Final coordinates displayed on the image")
-
-                    # Prepare inference results
-                    inference_results = prepare_inference_results(
-                        rgb_coordinates, thermal_coordinates, final_coordinates, 
-                        rgb_image_path, thermal_image_path
-                    )
-                    # Save complete metadata as JSON
-                    save_inference_metadata(
-                        inference_results, location_info, metadata_save_dir, saved_image_path
-                    )
-
-            except Exception as e:
-                logging.error(f"Error in main loop: {e}")
-
-            time.sleep(MAIN_LOOP_INTERVAL)
+
+    # Metadata goes to append-only results segments; sealed segments are queued for upload
+    def upload_segment(segment_path: str) -> None:
+        if cloud_storage is not None:
+            cloud_storage.upload_data(segment_path, f"results/{os.path.basename(segment_path)}")
+
+    with startup_profile.stage("start ResultsStore"):
+        results_store = get_results_store(
+            config, os.path.join(args.save_dir, "results"), on_segment_closed=upload_segment
+        ).start()
+
+    # With --warmup the models are still loading; the warm-up thread reports them and stops the profile
+    if not args.warmup:
+        record_model_loads()
+    startup_profile.report("Startup profile, ready for the first capture")
+    if not args.warmup:
+        startup_profile.stop()
+
+    def track(sequence: str, fused_coordinates: List[List[float]],
+              timestamp: Optional[datetime] = None) -> Tuple[Optional[List[int]], Dict[str, Any]]:
+        """
+        Tracking stage: assign the fused boxes of a capture to pest tracks; finished tracks are persisted as summaries.
+        With `tracking.frame_records: new_tracks`, the capture's image and full record are only persisted when it
+        confirms a new track; other captures leave a small capture record.
+
+        :return: The track of every fused box, or None when tracking is disabled, and the fields to add to the result.
+        """
+        if sequence not in trackers:
+            tracker = get_tracker(config)
+            if tracker is None:
+                return None, {}
+            trackers[sequence] = tracker
+        tracker = trackers[sequence]
+        with default_metrics.timer("tracking"):
+            track_ids, new_tracks = tracker.update(fused_coordinates, timestamp)
+        return track_ids, {
+            "persist_frame": bool(new_tracks) or frame_records == "all",
+            "finished_tracks": tracker.pop_finished(),
+        }
+
+    def run_inference(rgb_image_path: str, thermal_image_path: str) -> Dict[str, Any]:
+        """Inference stage: locate, detect and fuse one capture."""
+        # Get location information
+        location_info = gps_locator.get_current_location()
+        if not location_info:
+            logging.warning("Unable to retrieve location information")
+            location_info = {}  # Use an empty dict if location info is not available
+
+        # Decode each capture once; the frames are shared with the persistence stage and released there
+        frames = FrameCache()
+        try:
+            rgb_frame = frames.get(rgb_image_path)
+            thermal_frame = frames.get(thermal_image_path)
+
+            def detect() -> Tuple[List[List[float]], List[List[float]], List[List[float]]]:
+                rgb_coordinates, thermal_coordinates = pest_detector.detect(rgb_frame, thermal_frame, with_confidence=True)
+                return rgb_coordinates, thermal_coordinates, pest_detector.combine_coordinates(
+                    rgb_coordinates, thermal_coordinates, return_scores=True)
+
+            # Perform detections, unless the change gate finds the scene unchanged since the last inference
+            if change_gate is not None:
+                (rgb_coordinates, thermal_coordinates, fused_coordinates), reused = change_gate.run(
+                    [rgb_frame.image, thermal_frame.image], detect)
+            else:
+                (rgb_coordinates, thermal_coordinates, fused_coordinates), reused = detect(), False
+        except Exception:
+            frames.release()
+            raise
+
+        logging.debug("RGB detection completed. Coordinates: %s", rgb_coordinates)
+        logging.debug("Thermal detection completed. Coordinates: %s", thermal_coordinates)
+
+        track_ids, tracking = track("capture", fused_coordinates)
+        return {
+            "frames": frames,
+            "rgb_frame": rgb_frame,
+            "location_info": location_info,
+            "inference_results": prepare_inference_results(
+                rgb_coordinates, thermal_coordinates, [box[:4] for box in fused_coordinates],
+                rgb_image_path, thermal_image_path, reused_previous=reused, track_ids=track_ids
+            ),
+            **tracking,
+        }
+
+    def persist(result: Dict[str, Any]) -> None:
+        """Persistence stage: save the annotated image and the metadata of one capture, and of finished tracks."""
+        with default_metrics.timer("persist"):
+            if result.get("persist_frame", True):
+                save_result(result)
+            else:
+                result["frames"].release()
+                results_store.append(build_capture_metadata(result["inference_results"], result["location_info"],
+                                                            timestamp=result.get("timestamp")))
+                frames_deduplicated.inc()
+            for finished_track in result.get("finished_tracks", []):
+                results_store.append(build_track_metadata(finished_track, result["location_info"]))
+        frames_processed.inc()
+
+    def upload_image(image_path: str) -> None:
+        if cloud_storage is not None:
+            cloud_storage.upload_data(image_path, f"images/{os.path.basename(image_path)}")
+
+    def save_result(result: Dict[str, Any]) -> None:
+        inference_results = result["inference_results"]
+        with result["frames"]:
+            # Annotate and encode the image with detections in the background; the path is known right away
+            # and the image is queued for upload once it is on disk
+            saved_image_path = pest_detector.save_detected_image(
+                image=result["rgb_frame"],
+                final_coordinates=inference_results["final_coordinates"],
+                save_dir=image_save_dir,
+                on_saved=upload_image
+            )
+
+        # Append the complete metadata to the results store
+        results_store.append(
+            build_inference_metadata(inference_results, result["location_info"], saved_image_path,
+                                     timestamp=result.get("timestamp"))
+        )
+
+    def run_ingestion(source: str) -> None:
+        """
+        Stream every image of `source` through batched detection; each image is used as both RGB and thermal.
+        Ingested images are not tracked, since consecutive files need not show the same scene.
+        """
+        if args.watch:
+            paths = watch_directory(source, recursive=args.recursive)
+        else:
+            paths = iter_image_paths(source, recursive=args.recursive)
+        frames = prefetch_frames(paths, workers=args.decode_workers, prefetch=2 * args.batch_size)
+
+        processed = 0
+        for batch in batched(frames, args.batch_size):
+            location_info = gps_locator.get_current_location() or {}
+            rgb_batch, thermal_batch = pest_detector.detect_batch(batch, batch, with_confidence=True)
+            for frame, rgb_coordinates, thermal_coordinates in zip(batch, rgb_batch, thermal_batch):
+                fused_coordinates = pest_detector.combine_coordinates(rgb_coordinates, thermal_coordinates,
+                                                                      return_scores=True)
+                result = {
+                    "frames": frame,
+                    "rgb_frame": frame,
+                    "location_info": location_info,
+                    "inference_results": prepare_inference_results(
+                        rgb_coordinates, thermal_coordinates, [box[:4] for box in fused_coordinates],
+                        frame.path, frame.path
+                    ),
+                }
+                try:
+                    persist(result)
+                except Exception as e:
+                    logging.error(f"Error persisting results for {frame.path}: {e}")
+            processed += len(batch)
+            logging.debug(f"Ingested {processed} images from {source}")
+
+    def run_cameras() -> None:
+        """Batch the time-matched captures of every camera pair through detection as they arrive."""
+        supervisor = get_camera_supervisor(config, queue_size=args.queue_size)
+        if supervisor is None:
+            raise ValueError("--cameras needs at least one camera pair in the `cameras` configuration section")
+        with supervisor:
+            for batch in supervisor.batches(args.batch_size):
+                location_info = gps_locator.get_current_location() or {}
+                rgb_batch, thermal_batch = pest_detector.detect_batch(
+                    [capture.rgb for capture in batch], [capture.thermal for capture in batch], with_confidence=True)
+                for capture, rgb_coordinates, thermal_coordinates in zip(batch, rgb_batch, thermal_batch):
+                    # Hand the shared memory slots back to the cameras; the annotator keeps a private copy
+                    capture.thermal.release()
+                    capture.rgb.detach()
+                    fused_coordinates = pest_detector.combine_coordinates(rgb_coordinates, thermal_coordinates,
+                                                                          return_scores=True)
+                    timestamp = datetime.fromtimestamp(capture.timestamp)
+                    track_ids, tracking = track(capture.pair, fused_coordinates, timestamp)
+                    result = {
+                        "frames": capture,
+                        "rgb_frame": capture.rgb,
+                        "location_info": location_info,
+                        "timestamp": timestamp,
+                        "inference_results": prepare_inference_results(
+                            rgb_coordinates, thermal_coordinates, [box[:4] for box in fused_coordinates],
+                            capture.rgb.name, capture.thermal.name, track_ids=track_ids
+                        ),
+                        **tracking,
+                    }
+                    try:
+                        persist(result)
+                    except Exception as e:
+                        logging.error(f"Error persisting results for {capture.pair}: {e}")
+
+    try:
+        if args.ingest:
+            run_ingestion(args.ingest)
+        elif args.cameras:
+            run_cameras()
+        else:
+            pipeline = CapturePipeline(
+                image_capture_module, run_inference, persist,
+                inference_queue_size=args.queue_size, persistence_queue_size=args.queue_size
+            )
+            asyncio.run(pipeline.run())
+    finally:
+        if change_gate is not None:
+            logging.info(f"Change gate: {change_gate.skipped} of {change_gate.checked} captures reused earlier "
+                         f"results ({change_gate.skip_rate:.0%})")
+        pest_detector.close()
+        # Tracks still alive at shutdown are summarized as they stand
+        for tracker in trackers.values():
+            for finished_track in tracker.flush():
+                results_store.append(build_track_metadata(finished_track, gps_locator.get_current_location() or {}))
+        gps_locator.stop()
+        results_store.close()
+        if cloud_storage is not None:
+            cloud_storage.close()
+        if metrics_service is not None:
+            metrics_service.stop()
 
 if __name__ == "__main__":
     args = build_args()
@@ -30,6 +30,18 @@ setup(
         "opencv-python",
         "ultralytics",
         "omegaconf",
+        "requests",
+        "boto3",
         # Add other dependencies here
     ],
+    extras_require={
+        "onnxruntime": ["onnxruntime"],
+        "openvino": ["openvino"],
+        "test": ["pytest", "moto[s3]"],
+    },
+    entry_points={
+        "console_scripts": [
+            "advanced-pest-detect=advanced_pest_detection.cli:main",
+        ],
+    },
 )
\ No newline at end of file
@@ -0,0 +1,389 @@
+import argparse
+import glob
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+DEFAULT_CONFIG_PATH = "config/config.yaml"
+DEFAULT_OUTPUT_DIR = "./reprocessed"
+CHECKPOINT_PATTERN = "shard-*.done"
+
+
+def shard_of(path: str, shards: int) -> int:
+    """
+    Shard an image is assigned to. The hash of its path is stable across runs and processes, unlike `hash`.
+
+    :param path: Absolute path of the image.
+    :param shards: Number of shards.
+    """
+    return zlib.crc32(path.encode("utf-8", "surrogateescape")) % shards
+
+
+def checkpoint_path(checkpoint_dir: str, shard: int, shards: int) -> str:
+    return os.path.join(checkpoint_dir, f"shard-{shard:02d}-of-{shards:02d}.done")
+
+
+def load_checkpoints(checkpoint_dir: str) -> Set[str]:
+    """
+    Read the images every earlier run has completed, whatever number of workers it sharded them over.
+
+    :param checkpoint_dir: Directory of the `shard-*.done` files, one absolute image path per line.
+    :return: The set of completed image paths.
+    """
+    done = set()
+    for path in glob.glob(os.path.join(checkpoint_dir, CHECKPOINT_PATTERN)):
+        with open(path, "r", encoding="utf-8", errors="surrogateescape") as checkpoint:
+            # A line cut short by a crash has no newline and is not trusted
+            done.update(line[:-1] for line in checkpoint if line.endswith("\n"))
+    return done
+
+
+def _shard_paths(source: str, recursive: bool, shard: int, shards: int, done: Set[str],
+                 stats: Dict[str, Any]) -> Iterator[str]:
+    from advanced_pest_detection.image_capture.ingest import iter_image_paths
+
+    for path in iter_image_paths(source, recursive=recursive):
+        path = os.path.abspath(path)
+        if shard_of(path, shards) != shard:
+            continue
+        if path in done:
+            stats["skipped"] += 1
+            continue
+        yield path
+
+
+def _reprocess_worker(shard: int, shards: int, config: Dict[str, Any], options: Dict[str, Any],
+                      messages, stop_event) -> None:
+    """
+    Body of a reprocessing worker: preload a PestDetector, then run detection over the images of one shard
+    that no earlier run has completed, sending the metadata record of every image back to the parent.
+
+    Messages are `(kind, shard, payload)` tuples: "batch" with a list of `(image path, record)`,
+    then "done" with the shard statistics, or "error" with a description. Images that cannot be decoded or
+    whose inference fails are counted as failed and left out of the batches, so they are not checkpointed
+    and the next run retries them.
+    """
+    # The parent handles Ctrl-C and asks the workers to stop between batches
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=options["log_level"], format=f"%(asctime)s - shard {shard} - %(levelname)s - %(message)s")
+
+    from omegaconf import OmegaConf
+
+    from advanced_pest_detection.detection.image_writer import get_image_writer
+    from advanced_pest_detection.detection.pest_detector import get_pest_detector
+    from advanced_pest_detection.image_capture.ingest import batched, prefetch_frames
+    from advanced_pest_detection.utils import build_inference_metadata, prepare_inference_results
+    stats = {"processed": 0, "skipped": 0, "failed": 0, "detections": 0, "load_seconds": 0.0, "seconds": 0.0}
+    try:
+        config = OmegaConf.create(config)
+        # Images are written synchronously, so that an image is on disk before its record is checkpointed
+        OmegaConf.update(config, "image_output.workers", 0, force_add=True)
+        started = time.perf_counter()
+        pest_detector = get_pest_detector(config, batch_size=options["batch_size"], lazy=False,
+                                          image_writer=get_image_writer(config))
+        stats["load_seconds"] = time.perf_counter() - started
+
+        image_dir = None
+        if options["save_images"]:
+            image_dir = os.path.join(options["output"], "images", f"shard-{shard:02d}")
+            os.makedirs(image_dir, exist_ok=True)
+
+        done = load_checkpoints(options["checkpoint"])
+        paths = _shard_paths(options["source"], options["recursive"], shard, shards, done, stats)
+        decode_failures = []  # Appended to by the decode threads; list.append is atomic
+        frames = prefetch_frames(paths, workers=options["decode_workers"], prefetch=2 * options["batch_size"],
+                                 on_error=lambda path, error: decode_failures.append(path))
+
+        started = time.perf_counter()
+        with pest_detector:
+            for batch in batched(frames, options["batch_size"]):
+                try:
+                    coordinates = pest_detector.detect_batch(batch, batch, strict=True, with_confidence=True)
+                    detections = list(zip(batch, *coordinates))
+                except Exception as e:
+                    # Retry the images one at a time, so that one bad image does not fail the whole batch
+                    logging.warning(f"Detection failed on a batch of {len(batch)} images ({e}), retrying them one by one")
+                    detections = []
+                    for frame in batch:
+                        try:
+                            (rgb_coordinates,), (thermal_coordinates,) = pest_detector.detect_batch(
+                                [frame], [frame], strict=True, with_confidence=True)
+                            detections.append((frame, rgb_coordinates, thermal_coordinates))
+                        except Exception as e:
+                            logging.error(f"Detection failed on {frame.path}, leaving it for the next run: {e}")
+                            stats["failed"] += 1
+                            frame.release()
+                records = []
+                for frame, rgb_coordinates, thermal_coordinates in detections:
+                    final_coordinates = pest_detector.combine_coordinates(rgb_coordinates, thermal_coordinates)
+                    saved_image_path = None
+                    if image_dir is not None:
+                        saved_image_path = pest_detector.save_detected_image(frame, final_coordinates, image_dir)
+                    inference_results = prepare_inference_results(
+                        rgb_coordinates, thermal_coordinates, final_coordinates, frame.path, frame.path
+                    )
+                    # Records are timestamped with the capture, not with the reprocessing run
+                    timestamp = datetime.fromtimestamp(os.path.getmtime(frame.path))
+                    records.append((frame.path, build_inference_metadata(inference_results, {}, saved_image_path,
+                                                                         timestamp=timestamp)))
+                    stats["detections"] += len(final_coordinates)
+                    frame.release()
+                stats["processed"] += len(records)
+                messages.put(("batch", shard, records))
+                if stop_event.is_set():
+                    break
+        stats["seconds"] = time.perf_counter() - started
+        stats["failed"] += len(decode_failures)
+        messages.put(("done", shard, stats))
+    except Exception as e:
+        logging.exception(f"Reprocessing shard {shard} failed")
+        messages.put(("error", shard, f"{type(e).__name__}: {e}"))
+
+
+class Reprocessor:
+    def __init__(self, source: str, config, output: str, workers: int = 2, batch_size: int = 16,
+                 decode_workers: int = 2, recursive: bool = False, save_images: bool = False,
+                 checkpoint_dir: Optional[str] = None, checkpoint_interval: float = 10.0,
+                 start_method: str = "spawn", log_level: str = "INFO"):
+        """
+        Re-run detection over an archive of images on several worker processes, resuming where an
+        interrupted run stopped.
+
+        Images are sharded over the workers by a stable hash of their path. Each worker preloads its own
+        PestDetector and streams its shard through batched detection. The parent process is the only writer
+        of the results store: it appends the records it receives, and every `checkpoint_interval` seconds
+        flushes the store and only then appends the flushed images to the checkpoint of their shard. A crash
+        can therefore repeat the records written since the last checkpoint, but never lose one.
+
+        :param source: A directory, a glob pattern or a single image, as for `iter_image_paths`.
+        :param config: Configuration of the detector, the image writer and the results store.
+        :param output: Directory of the results store (`results`), the checkpoints and the annotated images.
+        :param workers: Worker processes, each holding its own models.
+        :param batch_size: Images per forward pass in every worker.
+        :param decode_workers: Decode threads in every worker.
+        :param recursive: Descend into sub-directories of `source`.
+        :param save_images: Also write annotated images, under `<output>/images/shard-NN`.
+        :param checkpoint_dir: Directory of the checkpoint files. Defaults to `<output>/checkpoint`.
+        :param checkpoint_interval: Maximum seconds between checkpoints.
+        :param start_method: multiprocessing start method of the workers.
+        :param log_level: Logging level of the workers.
+        """
+        if workers < 1:
+            raise ValueError(f"workers must be a positive integer, got {workers}")
+        self.source = source
+        self.config = config
+        self.output = output
+        self.workers = workers
+        self.batch_size = batch_size
+        self.decode_workers = decode_workers
+        self.recursive = recursive
+        self.save_images = save_images
+        self.checkpoint_dir = checkpoint_dir or os.path.join(output, "checkpoint")
+        self.checkpoint_interval = checkpoint_interval
+        self.log_level = log_level
+        self._context = multiprocessing.get_context(start_method)
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Reprocess every image not completed by an earlier run, then return the statistics of the run.
+
+        On Ctrl-C the workers finish their current batch, and everything received is written and checkpointed.
+        """
+        from omegaconf import OmegaConf
+
+        from advanced_pest_detection.data_handling.results_store import get_results_store
+
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        config = OmegaConf.to_container(self.config, resolve=True) if OmegaConf.is_config(self.config) else self.config
+        options = {
+            "source": self.source,
+            "output": self.output,
+            "checkpoint": self.checkpoint_dir,
+            "batch_size": self.batch_size,
+            "decode_workers": self.decode_workers,
+            "recursive": self.recursive,
+            "save_images": self.save_images,
+            "log_level": self.log_level,
+        }
+        # Bounded, so that workers wait for the writer instead of piling up records in memory
+        messages = self._context.Queue(maxsize=4 * self.workers)
+        stop_event = self._context.Event()
+        processes = {
+            shard: self._context.Process(target=_reprocess_worker, name=f"reprocess-{shard:02d}",
+                                         args=(shard, self.workers, config, options, messages, stop_event),
+                                         daemon=True)
+            for shard in range(self.workers)
+        }
+        shard_stats: Dict[int, Dict[str, Any]] = {}
+        errors: Dict[int, str] = {}
+        finished: Set[int] = set()
+        exited: Set[int] = set()
+        pending: Dict[int, List[str]] = {shard: [] for shard in processes}
+        interrupted = False
+
+        started = time.perf_counter()
+        store = get_results_store(self.config, os.path.join(self.output, "results"))
+        try:
+            for process in processes.values():
+                process.start()
+            logging.info(f"Reprocessing {self.source} on {self.workers} workers")
+            last_checkpoint = time.monotonic()
+            while len(finished) < len(processes):
+                try:
+                    try:
+                        kind, shard, payload = messages.get(timeout=1.0)
+                    except queue.Empty:
+                        for shard, process in processes.items():
+                            if shard in finished or process.is_alive():
+                                continue
+                            # The last messages of a worker can arrive just after it exits, so it only counts
+                            # as failed once the queue has also come up empty after its exit was seen
+                            if shard in exited:
+                                errors[shard] = f"worker exited with code {process.exitcode}"
+                                finished.add(shard)
+                                logging.error(f"Reprocessing shard {shard} failed: {errors[shard]}")
+                            else:
+                                exited.add(shard)
+                        kind = None
+                    if kind == "batch":
+                        for path, record in payload:
+                            store.append(record)
+                            pending[shard].append(path)
+                    elif kind == "done":
+                        shard_stats[shard] = payload
+                        finished.add(shard)
+                    elif kind == "error":
+                        errors[shard] = payload
+                        finished.add(shard)
+                    if time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                        self._checkpoint(store, pending)
+                        last_checkpoint = time.monotonic()
+                except KeyboardInterrupt:
+                    if interrupted:
+                        raise
+                    interrupted = True
+                    logging.info("Interrupted, finishing the current batches; press Ctrl-C again to stop right away")
+                    stop_event.set()
+        finally:
+            self._checkpoint(store, pending)
+            store.close()
+            for process in processes.values():
+                process.join(timeout=5.0)
+                if process.is_alive():
+                    process.terminate()
+        elapsed = time.perf_counter() - started
+
+        processed = sum(stats["processed"] for stats in shard_stats.values())
+        return {
+            "processed": processed,
+            "skipped": sum(stats["skipped"] for stats in shard_stats.values()),
+            "failed": sum(stats["failed"] for stats in shard_stats.values()),
+            "detections": sum(stats["detections"] for stats in shard_stats.values()),
+            "seconds": elapsed,
+            "images_per_second": processed / elapsed if elapsed > 0 else 0.0,
+            "shards": shard_stats,
+            "errors": errors,
+            "interrupted": interrupted,
+        }
+
+    def _checkpoint(self, store, pending: Dict[int, List[str]]) -> None:
+        """Flush the results store, then record the images whose records it has written as done."""
+        store.flush()
+        for shard, paths in pending.items():
+            if not paths:
+                continue
+            with open(checkpoint_path(self.checkpoint_dir, shard, self.workers), "a", encoding="utf-8",
+                      errors="surrogateescape") as checkpoint:
+                checkpoint.write("".join(f"{path}\n" for path in paths))
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
+            paths.clear()
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Human-readable summary of the statistics returned by `Reprocessor.run`."""
+    lines = [
+        f"Reprocessed {report['processed']} images ({report['skipped']} already done) with "
+        f"{report['detections']} detections in {report['seconds']:.1f} s: {report['images_per_second']:.2f} images/s"
+    ]
+    for shard, stats in sorted(report["shards"].items()):
+        rate = stats["processed"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+        lines.append(
+            f"  shard {shard:02d}: {stats['processed']} images, {stats['skipped']} skipped, {stats['failed']} failed, "
+            f"{stats['detections']} detections, models loaded in {stats['load_seconds']:.1f} s, {rate:.2f} images/s"
+        )
+    for shard, error in sorted(report["errors"].items()):
+        lines.append(f"  shard {shard:02d}: failed ({error})")
+    if report["failed"]:
+        lines.append(f"Decoding or detection failed on {report['failed']} images; run the same command again to retry them.")
+    if report["interrupted"]:
+        lines.append("Interrupted; run the same command again to resume.")
+    return "\n".join(lines)
+
+
+def reprocess(args: argparse.Namespace) -> int:
+    from omegaconf import OmegaConf
+
+    config = OmegaConf.load(args.config_path)
+    if args.rgb_model:
+        OmegaConf.update(config, "rgb_model.path", args.rgb_model, force_add=True)
+    if args.thermal_model:
+        OmegaConf.update(config, "thermal_model.path", args.thermal_model, force_add=True)
+    if args.backend:
+        OmegaConf.update(config, "inference.backend", args.backend, force_add=True)
+
+    reprocessor = Reprocessor(
+        args.source, config, args.output, workers=args.workers, batch_size=args.batch_size,
+        decode_workers=args.decode_workers, recursive=args.recursive, save_images=args.save_images,
+        checkpoint_dir=args.checkpoint, checkpoint_interval=args.checkpoint_interval,
+        log_level=args.log_level.upper()
+    )
+    report = reprocessor.run()
+    print(format_report(report))
+    if report["errors"] or report["failed"]:
+        return 1
+    return 130 if report["interrupted"] else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="advanced-pest-detect", description="Advanced pest detection tools")
+    parser.add_argument("--log_level", type=str, default="INFO", help="Logging level")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    reprocess_parser = subparsers.add_parser(
+        "reprocess", help="Re-run detection over an image archive on several processes, resuming interrupted runs")
+    reprocess_parser.add_argument("source", type=str, help="Directory, glob pattern or image file to reprocess")
+    reprocess_parser.add_argument("--config_path", type=str, default=DEFAULT_CONFIG_PATH, help="Path to the configuration file")
+    reprocess_parser.add_argument("--output", type=str, default=DEFAULT_OUTPUT_DIR,
+                                  help="Directory of the results store, the checkpoints and the annotated images")
+    reprocess_parser.add_argument("--workers", type=int, default=max((os.cpu_count() or 2) // 2, 1),
+                                  help="Worker processes, each with its own models")
+    reprocess_parser.add_argument("--batch_size", type=int, default=16, help="Images per forward pass in every worker")
+    reprocess_parser.add_argument("--decode_workers", type=int, default=2, help="Image decoding threads in every worker")
+    reprocess_parser.add_argument("--recursive", action="store_true", help="Descend into sub-directories of the source")
+    reprocess_parser.add_argument("--save_images", action="store_true", help="Also write annotated images")
+    reprocess_parser.add_argument("--checkpoint", type=str, default=None,
+                                  help="Directory of the progress checkpoints (default: <output>/checkpoint)")
+    reprocess_parser.add_argument("--checkpoint_interval", type=float, default=10.0,
+                                  help="Maximum seconds between checkpoints")
+    reprocess_parser.add_argument("--rgb_model", type=str, default=None, help="Override the RGB model path")
+    reprocess_parser.add_argument("--thermal_model", type=str, default=None, help="Override the thermal model path")
+    reprocess_parser.add_argument("--backend", type=str, default=None,
+                                  help="Override the inference backend: ultralytics, onnxruntime or openvino")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.command == "reprocess":
+        return reprocess(args)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,223 @@
-import boto3
+import io
+import logging
+import os
+import random
+import tarfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional
+
+from .upload_queue import UploadJob, UploadQueue
+
+MB = 1024 * 1024
+
 
 class CloudStorage:
-    def __init__(self, bucket_name):
-        self.s3 = boto3.client('s3')
+    def __init__(self, bucket_name, queue_path: str = "./records/upload_queue.sqlite3", client=None,
+                 endpoint_url: Optional[str] = None, workers: int = 4, prefix: str = "",
+                 multipart_threshold: int = 8 * MB, multipart_chunksize: int = 8 * MB,
+                 bundle_max_size: int = 256 * 1024, bundle_max_files: int = 100, bundle_max_age: float = 60.0,
+                 base_backoff: float = 2.0, max_backoff: float = 900.0, poll_interval: float = 1.0):
+        """
+        Background uploader to S3 backed by a persistent on-disk queue.
+
+        `upload_data` only records the file in the queue and returns; uploads happen on worker threads
+        that share one boto3 client, so the detection loop is never blocked on the network. Files above
+        `multipart_threshold` are sent as multipart uploads. Small files (such as metadata JSONs) are
+        collected into gzip-compressed tar bundles of up to `bundle_max_files` members, sent once a
+        bundle is full or its oldest member has waited `bundle_max_age` seconds. Failed uploads are
+        retried with exponential backoff and jitter, capped at `max_backoff` seconds.
+
+        :param bucket_name: Destination S3 bucket.
+        :param queue_path: SQLite file holding the upload queue.
+        :param client: An existing S3 client, for instance one pointed at a local S3 stand-in.
+        :param endpoint_url: Custom S3 endpoint used when no client is given (e.g. a local moto server).
+        :param workers: Number of upload threads.
+        :param prefix: Key prefix prepended to every object name.
+        :param multipart_threshold: Size in bytes from which files are uploaded in parts.
+        :param multipart_chunksize: Size in bytes of each multipart part.
+        :param bundle_max_size: Files of at most this many bytes are bundled instead of uploaded one by one.
+        :param bundle_max_files: Maximum number of files per bundle.
+        :param bundle_max_age: Seconds a small file may wait for its bundle to fill up.
+        :param base_backoff: Delay in seconds before the first retry; doubled on every further attempt.
+        :param max_backoff: Upper bound for the retry delay, in seconds.
+        :param poll_interval: Seconds the dispatcher waits when there is nothing to upload.
+        """
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        self.s3 = client or boto3.client('s3', endpoint_url=endpoint_url)
         self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.queue = UploadQueue(queue_path)
+        self.workers = workers
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold, multipart_chunksize=multipart_chunksize, use_threads=False
+        )
+        self.bundle_max_size = bundle_max_size
+        self.bundle_max_files = bundle_max_files
+        self.bundle_max_age = bundle_max_age
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._dispatcher: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._in_flight = threading.Semaphore(workers)
+
+    def upload_data(self, file_path, object_name=None):
+        """
+        Queue a file for upload and return immediately.
+
+        :param file_path: Local path of the file to upload.
+        :param object_name: Object key, relative to the configured prefix. Defaults to the file name.
+        :return: The queue job id.
+        """
+        object_name = self.prefix + (object_name or os.path.basename(file_path))
+        job_id = self.queue.put(file_path, object_name)
+        self._wake_event.set()
+        return job_id
+
+    def upload_now(self, file_path, object_name):
+        """
+        Upload one file synchronously, in parts if it is larger than the multipart threshold.
+
+        :param file_path: Local path of the file to upload.
+        :param object_name: Full object key.
+        """
+        self.s3.upload_file(file_path, self.bucket_name, object_name, Config=self.transfer_config)
+
+    def start(self) -> "CloudStorage":
+        """
+        Start the upload workers. Uploads left over from a previous run are picked up again.
+        """
+        if self._dispatcher is None:
+            self.queue.release_leases()
+            self._stop_event.clear()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="s3-upload")
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="s3-dispatcher", daemon=True)
+            self._dispatcher.start()
+        return self
+
+    def stop(self, wait: bool = True) -> None:
+        """
+        Stop dispatching uploads. Queued uploads that have not started stay on disk for the next run.
+
+        :param wait: Wait for uploads already in progress to finish.
+        """
+        if self._dispatcher is not None:
+            self._stop_event.set()
+            self._wake_event.set()
+            self._dispatcher.join()
+            self._dispatcher = None
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def close(self) -> None:
+        self.stop()
+        self.queue.close()
+
+    def pending(self) -> int:
+        """Number of files still waiting to be uploaded."""
+        return len(self.queue)
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempts))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _dispatch_loop(self) -> None:
+        while not self._stop_event.is_set():
+            dispatched = self._dispatch_bundle() + self._dispatch_files()
+            if not dispatched:
+                self._wake_event.wait(self.poll_interval)
+                self._wake_event.clear()
+
+    def _dispatch_files(self) -> int:
+        """Hand large files, one per job, to the upload workers."""
+        dispatched = 0
+        while self._in_flight.acquire(blocking=False):
+            jobs = self.queue.claim(1, min_size=self.bundle_max_size)
+            if not jobs:
+                self._in_flight.release()
+                break
+            self._executor.submit(self._upload_file, jobs[0])
+            dispatched += 1
+        return dispatched
+
+    def _dispatch_bundle(self) -> int:
+        """Hand a bundle of small files to the upload workers once it is full or old enough."""
+        due = self.queue.count_due(max_size=self.bundle_max_size)
+        if not due:
+            return 0
+        oldest_age = self.queue.oldest_due_age(max_size=self.bundle_max_size) or 0.0
+        if due < self.bundle_max_files and oldest_age < self.bundle_max_age:
+            return 0
+        if not self._in_flight.acquire(blocking=False):
+            return 0
+        jobs = self.queue.claim(self.bundle_max_files, max_size=self.bundle_max_size)
+        if not jobs:
+            self._in_flight.release()
+            return 0
+        self._executor.submit(self._upload_bundle, jobs)
+        return 1
+
+    def _upload_file(self, job: UploadJob) -> None:
+        job_id, file_path, object_name, attempts = job
+        try:
+            self.upload_now(file_path, object_name)
+            self.queue.complete([job_id])
+            logging.info(f"Uploaded {file_path} to s3://{self.bucket_name}/{object_name}")
+        except FileNotFoundError:
+            logging.error(f"Dropping upload of {file_path}: file no longer exists")
+            self.queue.complete([job_id])
+        except Exception as e:
+            delay = self._backoff(attempts)
+            logging.warning(f"Upload of {file_path} failed (attempt {attempts + 1}), retrying in {delay:.0f}s: {e}")
+            self.queue.retry([job_id], delay, str(e))
+        finally:
+            self._in_flight.release()
+            self._wake_event.set()
+
+    def _upload_bundle(self, jobs: List[UploadJob]) -> None:
+        job_ids = [job[0] for job in jobs]
+        try:
+            buffer = io.BytesIO()
+            missing = []
+            with tarfile.open(fileobj=buffer, mode="w:gz") as bundle:
+                for job_id, file_path, object_name, _ in jobs:
+                    try:
+                        bundle.add(file_path, arcname=object_name)
+                    except FileNotFoundError:
+                        logging.error(f"Dropping upload of {file_path}: file no longer exists")
+                        missing.append(job_id)
+            buffer.seek(0)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            bundle_name = f"{self.prefix}bundles/bundle_{timestamp}_{uuid.uuid4().hex[:8]}.tar.gz"
+            self.s3.upload_fileobj(buffer, self.bucket_name, bundle_name, Config=self.transfer_config)
+            self.queue.complete(job_ids)
+            logging.info(f"Uploaded bundle of {len(jobs) - len(missing)} files to s3://{self.bucket_name}/{bundle_name}")
+        except Exception as e:
+            delay = self._backoff(max(job[3] for job in jobs))
+            logging.warning(f"Upload of a bundle of {len(jobs)} files failed, retrying in {delay:.0f}s: {e}")
+            self.queue.retry(job_ids, delay, str(e))
+        finally:
+            self._in_flight.release()
+            self._wake_event.set()
+
 
-    def upload_data(self, file_path, object_name):
-        # TODO: To be implemented.
-        # Implement S3 upload logic
-        pass
\ No newline at end of file
+def get_cloud_storage(config) -> Optional[CloudStorage]:
+    """Factory function to create the background uploader configured by the `cloud_storage` section, if enabled."""
+    storage_config = config.get("cloud_storage") or {}
+    if not storage_config.get("enabled", False):
+        return None
+    return CloudStorage(
+        storage_config["bucket_name"],
+        queue_path=storage_config.get("queue_path", "./records/upload_queue.sqlite3"),
+        endpoint_url=storage_config.get("endpoint_url"),
+        workers=storage_config.get("workers", 4),
+        prefix=storage_config.get("prefix", ""),
+    )
@@ -0,0 +1,428 @@
+import argparse
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # No advisory locks, e.g. on Windows: one writer per store is assumed
+    fcntl = None
+
+MB = 1024 * 1024
+SEGMENT_TIME_FORMAT = "%Y%m%dT%H%M%S"
+OPEN_SEGMENT_NAME = "results_open.jsonl"
+OPEN_SEGMENT_PATTERN = re.compile(r"^results_open(_\d+)?\.jsonl$")
+LOCK_SUFFIX = ".lock"
+SEAL_LOCK_NAME = "seal.lock"
+SEGMENT_PATTERN = re.compile(r"^results_(\d{8}T\d{6})_(\d{8}T\d{6})_(\d{6})\.jsonl(\.gz)?$")
+EARTH_RADIUS_KM = 6371.0
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """
+    Parse the timestamp of a metadata record, as written by `save_inference_metadata` ("%Y%m%d_%H%M%S",
+    optionally followed by "_%f") or in ISO 8601 format.
+    """
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        return None
+    for time_format in ("%Y%m%d_%H%M%S", "%Y%m%d_%H%M%S_%f"):
+        try:
+            return datetime.strptime(value, time_format)
+        except ValueError:
+            pass
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _try_lock(path: str) -> Optional[int]:
+    """
+    Open a lock file and take an exclusive advisory lock on it without waiting.
+
+    :return: The descriptor holding the lock, or None if another process holds it.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+    return fd
+
+
+def _haversine_km(latitude_a: float, longitude_a: float, latitude_b: float, longitude_b: float) -> float:
+    latitude_a, longitude_a, latitude_b, longitude_b = map(math.radians, (latitude_a, longitude_a, latitude_b, longitude_b))
+    a = (math.sin((latitude_b - latitude_a) / 2) ** 2
+         + math.cos(latitude_a) * math.cos(latitude_b) * math.sin((longitude_b - longitude_a) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class ResultsStore:
+    def __init__(self, root_dir: str, segment_max_bytes: int = 16 * MB, flush_interval: float = 10.0,
+                 flush_records: int = 100, compress_segments: bool = True,
+                 on_segment_closed: Optional[Callable[[str], None]] = None, read_only: bool = False):
+        """
+        Append-only store of inference metadata records in rotating JSON Lines segments.
+
+        Records are buffered in memory and appended to the open segment every `flush_records` records or
+        `flush_interval` seconds, whichever comes first. Once the open segment reaches `segment_max_bytes`
+        it is sealed: renamed after the time range of its records and, optionally, gzip-compressed.
+        The time range in the name lets queries skip whole segments.
+
+        :param root_dir: Directory holding the segments.
+        :param segment_max_bytes: Size at which the open segment is sealed and a new one started.
+        :param flush_interval: Maximum seconds a record stays buffered in memory.
+        :param flush_records: Number of buffered records that triggers a flush.
+        :param compress_segments: Gzip segments when they are sealed.
+        :param on_segment_closed: Called with the path of every sealed segment, e.g. to queue it for upload.
+        :param read_only: Only query the store, e.g. while another process is writing to it.
+
+        Every writer holds a lock on its open segment. When the store already has a live writer, such as the
+        detector while the `import` command runs, a second writer appends to an open segment of its own
+        instead of sealing the first one's from under it.
+        """
+        self.root_dir = root_dir
+        self.segment_max_bytes = segment_max_bytes
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.compress_segments = compress_segments
+        self.on_segment_closed = on_segment_closed
+        self.read_only = read_only
+        if not read_only:
+            os.makedirs(root_dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._buffer: List[str] = []
+        self._buffer_range: Optional[Tuple[datetime, datetime]] = None
+        self._open_range: Optional[Tuple[datetime, datetime]] = None
+        self._last_flush = time.monotonic()
+        self._stop_event = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._open_name = OPEN_SEGMENT_NAME
+        self._open_lock: Optional[int] = None
+
+        if not read_only:
+            self._open_lock = _try_lock(self._open_path + LOCK_SUFFIX)
+            if self._open_lock is None:
+                self._open_name = f"results_open_{os.getpid()}.jsonl"
+                self._open_lock = _try_lock(self._open_path + LOCK_SUFFIX)
+                logging.info(f"Results store {root_dir} has another writer, writing to {self._open_name}")
+            self._seal_abandoned()
+
+    @property
+    def _open_path(self) -> str:
+        return os.path.join(self.root_dir, self._open_name)
+
+    def _open_segments(self) -> List[str]:
+        with os.scandir(self.root_dir) as entries:
+            return sorted(entry.path for entry in entries if OPEN_SEGMENT_PATTERN.match(entry.name))
+
+    def _seal_abandoned(self) -> None:
+        """Seal the segments left open by unclean shutdowns, i.e. those no live writer holds the lock of."""
+        for path in self._open_segments():
+            if path == self._open_path:
+                self._open_range = self._scan_range(path)
+                self._seal()
+                continue
+            lock = _try_lock(path + LOCK_SUFFIX)
+            if lock is None:
+                continue  # Owned by a live writer
+            try:
+                if os.path.exists(path):
+                    self._seal_segment(path, self._scan_range(path))
+            finally:
+                if os.path.basename(path) != OPEN_SEGMENT_NAME:
+                    os.remove(path + LOCK_SUFFIX)
+                os.close(lock)
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """
+        Buffer one metadata record for writing.
+
+        :param record: The record, typically from `build_inference_metadata`.
+        """
+        if self.read_only:
+            raise RuntimeError("Cannot append to a results store opened read-only.")
+        timestamp = parse_timestamp(record.get("timestamp")) or datetime.now()
+        line = json.dumps(record, separators=(",", ":"))
+        with self._lock:
+            self._buffer.append(line)
+            self._buffer_range = self._extend_range(self._buffer_range, timestamp, timestamp)
+            if (len(self._buffer) >= self.flush_records
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self.flush()
+
+    def flush(self) -> None:
+        """
+        Write buffered records to the open segment, sealing it if it has grown past the size limit.
+        """
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if self.read_only or not self._buffer:
+                return
+            with open(self._open_path, "a") as segment:
+                segment.write("\n".join(self._buffer) + "\n")
+            self._open_range = self._extend_range(self._open_range, *self._buffer_range)
+            self._buffer = []
+            self._buffer_range = None
+            if os.path.getsize(self._open_path) >= self.segment_max_bytes:
+                self._seal()
+
+    def start(self) -> "ResultsStore":
+        """
+        Flush on a background thread every `flush_interval` seconds, so records are written even when appends stop.
+        """
+        if self._flusher is None:
+            self._stop_event.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, name="results-flusher", daemon=True)
+            self._flusher.start()
+        return self
+
+    def close(self) -> None:
+        """
+        Stop the background flusher, write any buffered records and seal the open segment.
+        """
+        if self._flusher is not None:
+            self._stop_event.set()
+            self._flusher.join()
+            self._flusher = None
+        if self.read_only:
+            return
+        with self._lock:
+            self.flush()
+            self._seal()
+            if self._open_lock is not None:
+                if self._open_name != OPEN_SEGMENT_NAME:
+                    os.remove(self._open_path + LOCK_SUFFIX)
+                os.close(self._open_lock)
+                self._open_lock = None
+
+    def __enter__(self) -> "ResultsStore":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def segments(self) -> List[str]:
+        """
+        Paths of all segments, sealed ones in order of their earliest record, then the open segments.
+        """
+        sealed = sorted(self._sealed_segments(), key=lambda segment: (segment[1][0], segment[2].group(3)))
+        return [path for path, _, _ in sealed] + self._open_segments()
+
+    def iter_records(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                     bbox: Optional[Tuple[float, float, float, float]] = None,
+                     near: Optional[Tuple[float, float, float]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the stored records that match every given filter. Buffered records are flushed first.
+
+        :param start: Only records at or after this time.
+        :param end: Only records at or before this time.
+        :param bbox: Only records located inside (min_latitude, min_longitude, max_latitude, max_longitude).
+        :param near: Only records within (latitude, longitude, radius_km) of a point.
+        :return: An iterator over matching records.
+        """
+        self.flush()
+        with self._lock:
+            candidates = [(path, time_range) for path, time_range, _ in self._sealed_segments()]
+            for path in self._open_segments():
+                # Other processes may own open segments, so their time range is only known to their writer
+                own = not self.read_only and path == self._open_path
+                candidates.append((path, self._open_range if own else None))
+
+        for path, time_range in sorted(candidates, key=lambda candidate: candidate[1] or (datetime.min,)):
+            if time_range is not None:
+                if start is not None and time_range[1] < start.replace(microsecond=0):
+                    continue
+                if end is not None and time_range[0] > end:
+                    continue
+            for record in self._read_segment(path):
+                if self._matches(record, start, end, bbox, near):
+                    yield record
+
+    @staticmethod
+    def _matches(record: Dict[str, Any], start: Optional[datetime], end: Optional[datetime],
+                 bbox: Optional[Tuple[float, float, float, float]], near: Optional[Tuple[float, float, float]]) -> bool:
+        if start is not None or end is not None:
+            timestamp = parse_timestamp(record.get("timestamp"))
+            if timestamp is None or (start is not None and timestamp < start) or (end is not None and timestamp > end):
+                return False
+        if bbox is not None or near is not None:
+            location_info = record.get("location_info") or {}
+            latitude, longitude = location_info.get("latitude"), location_info.get("longitude")
+            if latitude is None or longitude is None:
+                return False
+            if bbox is not None and not (bbox[0] <= latitude <= bbox[2] and bbox[1] <= longitude <= bbox[3]):
+                return False
+            if near is not None and _haversine_km(near[0], near[1], latitude, longitude) > near[2]:
+                return False
+        return True
+
+    @staticmethod
+    def _read_segment(path: str) -> Iterator[Dict[str, Any]]:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt") as segment:
+            for line in segment:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line torn by a power cut
+
+    def _sealed_segments(self) -> Iterator[Tuple[str, Tuple[datetime, datetime], Any]]:
+        with os.scandir(self.root_dir) as entries:
+            for entry in entries:
+                match = SEGMENT_PATTERN.match(entry.name)
+                if match:
+                    time_range = (datetime.strptime(match.group(1), SEGMENT_TIME_FORMAT),
+                                  datetime.strptime(match.group(2), SEGMENT_TIME_FORMAT))
+                    yield entry.path, time_range, match
+
+    def _scan_range(self, path: str) -> Optional[Tuple[datetime, datetime]]:
+        time_range = None
+        for record in self._read_segment(path):
+            timestamp = parse_timestamp(record.get("timestamp"))
+            if timestamp is not None:
+                time_range = self._extend_range(time_range, timestamp, timestamp)
+        return time_range
+
+    @staticmethod
+    def _extend_range(time_range: Optional[Tuple[datetime, datetime]], first: datetime,
+                      last: datetime) -> Tuple[datetime, datetime]:
+        if time_range is None:
+            return first, last
+        return min(time_range[0], first), max(time_range[1], last)
+
+    def _seal(self) -> None:
+        if os.path.exists(self._open_path):
+            self._seal_segment(self._open_path, self._open_range)
+        self._open_range = None
+
+    def _seal_segment(self, path: str, time_range: Optional[Tuple[datetime, datetime]]) -> None:
+        if os.path.getsize(path) == 0:
+            os.remove(path)
+            return
+
+        first, last = time_range or (datetime.now(), datetime.now())
+        # Writers sharing the store take turns, so that no two sealed segments get the same sequence number
+        seal_lock = os.open(os.path.join(self.root_dir, SEAL_LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(seal_lock, fcntl.LOCK_EX)
+            sequence = 1 + max((int(match.group(3)) for _, _, match in self._sealed_segments()), default=0)
+            name = (f"results_{first.strftime(SEGMENT_TIME_FORMAT)}_{last.strftime(SEGMENT_TIME_FORMAT)}"
+                    f"_{sequence:06d}.jsonl")
+            sealed_path = os.path.join(self.root_dir, name)
+            if self.compress_segments:
+                sealed_path += ".gz"
+                with open(path, "rb") as source, gzip.open(sealed_path + ".tmp", "wb") as target:
+                    shutil.copyfileobj(source, target)
+                os.replace(sealed_path + ".tmp", sealed_path)
+                os.remove(path)
+            else:
+                os.replace(path, sealed_path)
+        finally:
+            os.close(seal_lock)
+        logging.info(f"Results segment sealed: {sealed_path}")
+        if self.on_segment_closed is not None:
+            self.on_segment_closed(sealed_path)
+
+    def _flush_loop(self) -> None:
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error flushing results: {e}")
+
+
+def import_metadata_dir(store: ResultsStore, metadata_dir: str, delete: bool = False) -> int:
+    """
+    Import the per-inference JSON files written by `save_inference_metadata` into a results store.
+
+    :param store: The destination store.
+    :param metadata_dir: Directory of inference_metadata_*.json files, such as records/metadata.
+    :param delete: Remove each JSON file once its record has been written to the store.
+    :return: The number of imported records.
+    """
+    imported = 0
+    pending_deletes = []
+    with os.scandir(metadata_dir) as entries:
+        for entry in entries:
+            if not (entry.is_file() and entry.name.endswith(".json")):
+                continue
+            try:
+                with open(entry.path) as json_file:
+                    store.append(json.load(json_file))
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Skipping {entry.path}: {e}")
+                continue
+            imported += 1
+            if delete:
+                pending_deletes.append(entry.path)
+                if len(pending_deletes) >= store.flush_records:
+                    store.flush()
+                    for path in pending_deletes:
+                        os.remove(path)
+                    pending_deletes = []
+    store.flush()
+    for path in pending_deletes:
+        os.remove(path)
+    return imported
+
+
+def get_results_store(config, root_dir: str, on_segment_closed: Optional[Callable[[str], None]] = None) -> ResultsStore:
+    """Factory function to create a ResultsStore configured by the `results_store` section of the configuration."""
+    store_config = config.get("results_store") or {}
+    return ResultsStore(
+        root_dir,
+        segment_max_bytes=int(store_config.get("segment_max_mb", 16) * MB),
+        flush_interval=store_config.get("flush_interval", 10.0),
+        flush_records=store_config.get("flush_records", 100),
+        compress_segments=store_config.get("compress_segments", True),
+        on_segment_closed=on_segment_closed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect and maintain an inference results store")
+    parser.add_argument("--store", type=str, default="./records/results", help="Directory of the results store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Import a directory of per-inference metadata JSON files")
+    import_parser.add_argument("metadata_dir", type=str, help="Directory such as ./records/metadata")
+    import_parser.add_argument("--delete", action="store_true", help="Delete JSON files once imported")
+
+    query_parser = subparsers.add_parser("query", help="Print matching records as JSON Lines")
+    query_parser.add_argument("--start", type=datetime.fromisoformat, default=None, help="ISO 8601 start time")
+    query_parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="ISO 8601 end time")
+    query_parser.add_argument("--bbox", type=float, nargs=4, default=None,
+                              metavar=("MIN_LAT", "MIN_LON", "MAX_LAT", "MAX_LON"), help="Bounding box")
+    query_parser.add_argument("--near", type=float, nargs=3, default=None,
+                              metavar=("LAT", "LON", "RADIUS_KM"), help="Radius around a point")
+    args = parser.parse_args()
+
+    with ResultsStore(args.store, read_only=args.command == "query") as store:
+        if args.command == "import":
+            imported = import_metadata_dir(store, args.metadata_dir, delete=args.delete)
+            print(f"Imported {imported} records from {args.metadata_dir} into {args.store}")
+        else:
+            for record in store.iter_records(args.start, args.end, args.bbox, args.near):
+                print(json.dumps(record))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+# (id, file_path, object_name, attempts)
+UploadJob = Tuple[int, str, str, int]
+
+
+class UploadQueue:
+    def __init__(self, db_path: str, lease_timeout: float = 600.0):
+        """
+        Persistent queue of pending uploads, stored in SQLite so that it survives restarts and power loss.
+
+        Claimed jobs are leased rather than removed: a job whose upload never completes (for example because
+        the process died mid-upload) becomes due again once its lease expires.
+
+        :param db_path: Path of the SQLite database file. Parent directories are created as needed.
+        :param lease_timeout: Seconds a claimed job stays hidden from other claims.
+        """
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.lease_timeout = lease_timeout
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS uploads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_path TEXT NOT NULL,
+                object_name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                due_at REAL NOT NULL,
+                leased_until REAL NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_error TEXT
+            )
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS uploads_due ON uploads (due_at)")
+
+    def put(self, file_path: str, object_name: str) -> int:
+        """
+        Add a file to the queue.
+
+        :param file_path: Local path of the file to upload.
+        :param object_name: Destination object key.
+        :return: The job id.
+        """
+        now = time.time()
+        size = os.path.getsize(file_path)
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT INTO uploads (file_path, object_name, size, due_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                (file_path, object_name, size, now, now),
+            )
+            return cursor.lastrowid
+
+    def claim(self, limit: int, max_size: Optional[int] = None, min_size: Optional[int] = None) -> List[UploadJob]:
+        """
+        Lease up to `limit` due jobs, oldest first.
+
+        :param limit: Maximum number of jobs to claim.
+        :param max_size: Only claim files of at most this many bytes.
+        :param min_size: Only claim files larger than this many bytes.
+        :return: The claimed jobs as (id, file_path, object_name, attempts) tuples.
+        """
+        now = time.time()
+        conditions = ["due_at <= ?", "leased_until <= ?"]
+        parameters: list = [now, now]
+        if max_size is not None:
+            conditions.append("size <= ?")
+            parameters.append(max_size)
+        if min_size is not None:
+            conditions.append("size > ?")
+            parameters.append(min_size)
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                jobs = self._connection.execute(
+                    f"SELECT id, file_path, object_name, attempts FROM uploads WHERE {' AND '.join(conditions)} "
+                    "ORDER BY due_at LIMIT ?",
+                    parameters + [limit],
+                ).fetchall()
+                self._connection.executemany(
+                    "UPDATE uploads SET leased_until = ? WHERE id = ?",
+                    [(now + self.lease_timeout, job[0]) for job in jobs],
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return jobs
+
+    def oldest_due_age(self, max_size: Optional[int] = None) -> Optional[float]:
+        """
+        Seconds since the oldest due, unleased job (optionally of at most `max_size` bytes) was queued.
+        """
+        now = time.time()
+        query = "SELECT MIN(created_at) FROM uploads WHERE due_at <= ? AND leased_until <= ?"
+        parameters: list = [now, now]
+        if max_size is not None:
+            query += " AND size <= ?"
+            parameters.append(max_size)
+        with self._lock:
+            oldest = self._connection.execute(query, parameters).fetchone()[0]
+        return None if oldest is None else now - oldest
+
+    def count_due(self, max_size: Optional[int] = None) -> int:
+        """Number of due, unleased jobs, optionally only counting files of at most `max_size` bytes."""
+        now = time.time()
+        query = "SELECT COUNT(*) FROM uploads WHERE due_at <= ? AND leased_until <= ?"
+        parameters: list = [now, now]
+        if max_size is not None:
+            query += " AND size <= ?"
+            parameters.append(max_size)
+        with self._lock:
+            return self._connection.execute(query, parameters).fetchone()[0]
+
+    def complete(self, job_ids: List[int]) -> None:
+        """Remove finished jobs from the queue."""
+        with self._lock:
+            self._connection.executemany("DELETE FROM uploads WHERE id = ?", [(job_id,) for job_id in job_ids])
+
+    def retry(self, job_ids: List[int], delay: float, error: str) -> None:
+        """Release failed jobs so they become due again after `delay` seconds."""
+        due_at = time.time() + delay
+        with self._lock:
+            self._connection.executemany(
+                "UPDATE uploads SET attempts = attempts + 1, due_at = ?, leased_until = 0, last_error = ? WHERE id = ?",
+                [(due_at, error, job_id) for job_id in job_ids],
+            )
+
+    def release_leases(self) -> None:
+        """Make every leased job claimable again. Called at start-up, when no upload can be in flight."""
+        with self._lock:
+            self._connection.execute("UPDATE uploads SET leased_until = 0")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM uploads").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,255 @@
+import hashlib
+import logging
+import os
+import shutil
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..fusion.fusion_module import greedy_cluster, overlapping_pairs, xywh_to_xyxy
+
+DEFAULT_CACHE_DIR = "./models/.cache"
+
+
+def file_digest(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Compute the SHA-256 hex digest of a file, reading it in chunks.
+
+    :param path: Path to the file.
+    :param chunk_size: Bytes read per chunk.
+    :return: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class InferenceBackend:
+    """
+    Runs a YOLO detection model on a batch of BGR images.
+
+    `predict` returns one array per image of shape (N, 5): normalized [x_center, y_center, width, height]
+    followed by the detection confidence.
+    """
+
+    name = "base"
+
+    def predict(self, images: List[np.ndarray], conf: float) -> List[np.ndarray]:
+        raise NotImplementedError
+
+
+class UltralyticsBackend(InferenceBackend):
+    name = "ultralytics"
+
+    def __init__(self, model_path: str):
+        """
+        PyTorch inference through ultralytics.
+
+        :param model_path: Path to the YOLO model file.
+        """
+        from ultralytics import YOLO
+
+        self.model_path = model_path
+        self.model = YOLO(model_path)
+
+    def predict(self, images: List[np.ndarray], conf: float) -> List[np.ndarray]:
+        results = self.model.predict(source=list(images), conf=conf, verbose=False)
+        return [
+            np.column_stack([result.boxes.xywhn.cpu().numpy(), result.boxes.conf.cpu().numpy()]).reshape(-1, 5)
+            for result in results
+        ]
+
+
+def export_model(model_path: str, export_format: str = "onnx", imgsz: int = 640,
+                 cache_dir: str = DEFAULT_CACHE_DIR) -> str:
+    """
+    Export a YOLO model once and cache the artifact under a name derived from the weights' content hash,
+    so that changed weights are re-exported and unchanged ones never are.
+
+    :param model_path: Path to the YOLO model file. ONNX files are returned unchanged.
+    :param export_format: Ultralytics export format; only "onnx" is cached as a single file.
+    :param imgsz: Square input size the model is exported for.
+    :param cache_dir: Directory holding exported artifacts.
+    :return: Path to the exported artifact.
+    """
+    if model_path.endswith(".onnx"):
+        return model_path
+
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    artifact = os.path.join(cache_dir, f"{stem}-{file_digest(model_path)[:16]}-{imgsz}.{export_format}")
+    if os.path.exists(artifact):
+        return artifact
+
+    from ultralytics import YOLO
+
+    logging.info(f"Exporting {model_path} to {export_format}, this only happens once per set of weights...")
+    exported = YOLO(model_path).export(format=export_format, imgsz=imgsz, dynamic=True)
+    os.makedirs(cache_dir, exist_ok=True)
+    shutil.move(exported, artifact + ".tmp")
+    os.replace(artifact + ".tmp", artifact)
+    logging.info(f"Exported model cached at {artifact}")
+    return artifact
+
+
+def letterbox(image: np.ndarray, size: int) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+    """
+    Resize an image to fit a size x size square, keeping its aspect ratio and padding with gray,
+    the way YOLO models are trained.
+
+    :return: The padded image, the scale factor and the (left, top) padding.
+    """
+    import cv2
+
+    height, width = image.shape[:2]
+    scale = min(size / height, size / width)
+    new_width, new_height = int(round(width * scale)), int(round(height * scale))
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (size - new_width) / 2, (size - new_height) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    padded = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return padded, scale, (left, top)
+
+
+class ExportedModelBackend(InferenceBackend):
+    """
+    Shared pre- and post-processing for YOLOv8 models exported to ONNX and run without PyTorch:
+    letterboxing, per-class non-maximum suppression, and mapping boxes back to the input image.
+    """
+
+    def __init__(self, imgsz: int = 640, iou_threshold: float = 0.7, max_det: int = 300):
+        self.imgsz = imgsz
+        self.iou_threshold = iou_threshold
+        self.max_det = max_det
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        """Run the model on a (B, 3, imgsz, imgsz) float32 batch, returning its (B, 4 + classes, anchors) output."""
+        raise NotImplementedError
+
+    def predict(self, images: List[np.ndarray], conf: float) -> List[np.ndarray]:
+        if not len(images):
+            return []
+        letterboxed = [letterbox(image, self.imgsz) for image in images]
+        batch = np.stack([padded for padded, _, _ in letterboxed])
+        batch = np.ascontiguousarray(batch[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32) / 255.0
+        output = self._run(batch)
+        return [
+            self._postprocess(prediction, conf, scale, padding, image.shape[:2])
+            for prediction, image, (_, scale, padding) in zip(output, images, letterboxed)
+        ]
+
+    def _postprocess(self, prediction: np.ndarray, conf: float, scale: float, padding: Tuple[float, float],
+                     image_shape: Tuple[int, int]) -> np.ndarray:
+        prediction = prediction.T
+        class_scores = prediction[:, 4:]
+        classes = class_scores.argmax(axis=1)
+        confidences = class_scores[np.arange(len(prediction)), classes]
+        keep = confidences > conf
+        boxes, classes, confidences = prediction[keep, :4], classes[keep], confidences[keep]
+
+        order = np.argsort(-confidences, kind="stable")
+        boxes, classes, confidences = boxes[order].astype(np.float64), classes[order], confidences[order]
+
+        # Per-class NMS: offset each class far apart so boxes of different classes never overlap
+        corners = xywh_to_xyxy(boxes)
+        offset_corners = corners + (classes * 4 * self.imgsz)[:, None]
+        first, second = overlapping_pairs(offset_corners, self.iou_threshold)
+        leaders = greedy_cluster(len(corners), first, second)
+        kept = np.flatnonzero(leaders == np.arange(len(corners)))[:self.max_det]
+        corners, confidences = corners[kept], confidences[kept]
+
+        height, width = image_shape
+        corners[:, [0, 2]] = np.clip((corners[:, [0, 2]] - padding[0]) / scale, 0, width)
+        corners[:, [1, 3]] = np.clip((corners[:, [1, 3]] - padding[1]) / scale, 0, height)
+        xywhn = np.column_stack([
+            (corners[:, 0] + corners[:, 2]) / 2 / width,
+            (corners[:, 1] + corners[:, 3]) / 2 / height,
+            (corners[:, 2] - corners[:, 0]) / width,
+            (corners[:, 3] - corners[:, 1]) / height,
+        ])
+        return np.column_stack([xywhn, confidences]).reshape(-1, 5)
+
+
+class ONNXRuntimeBackend(ExportedModelBackend):
+    name = "onnxruntime"
+
+    def __init__(self, model_path: str, imgsz: int = 640, intra_op_threads: int = 0, inter_op_threads: int = 0,
+                 cache_dir: str = DEFAULT_CACHE_DIR, iou_threshold: float = 0.7, max_det: int = 300):
+        """
+        CPU inference through ONNX Runtime. Non-ONNX weights are exported to ONNX once and cached.
+
+        :param model_path: Path to the YOLO model file (.pt) or an exported .onnx file.
+        :param imgsz: Square input size of the model.
+        :param intra_op_threads: Threads used inside an operator. 0 lets ONNX Runtime choose.
+        :param inter_op_threads: Threads used to run independent operators in parallel. 0 lets ONNX Runtime choose.
+        :param cache_dir: Directory holding exported models.
+        :param iou_threshold: IoU threshold of the non-maximum suppression.
+        :param max_det: Maximum number of detections per image.
+        """
+        super().__init__(imgsz=imgsz, iou_threshold=iou_threshold, max_det=max_det)
+        import onnxruntime
+
+        self.model_path = export_model(model_path, "onnx", imgsz, cache_dir)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        if inter_op_threads > 1:
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+        self.session = onnxruntime.InferenceSession(
+            self.model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVINOBackend(ExportedModelBackend):
+    name = "openvino"
+
+    def __init__(self, model_path: str, imgsz: int = 640, num_threads: int = 0,
+                 cache_dir: str = DEFAULT_CACHE_DIR, iou_threshold: float = 0.7, max_det: int = 300):
+        """
+        CPU inference through OpenVINO, which reads the same cached ONNX export as ONNXRuntimeBackend.
+
+        :param model_path: Path to the YOLO model file (.pt) or an exported .onnx file.
+        :param imgsz: Square input size of the model.
+        :param num_threads: Inference threads. 0 lets OpenVINO choose.
+        :param cache_dir: Directory holding exported models.
+        :param iou_threshold: IoU threshold of the non-maximum suppression.
+        :param max_det: Maximum number of detections per image.
+        """
+        super().__init__(imgsz=imgsz, iou_threshold=iou_threshold, max_det=max_det)
+        import openvino
+
+        self.model_path = export_model(model_path, "onnx", imgsz, cache_dir)
+        config = {"INFERENCE_NUM_THREADS": num_threads} if num_threads else {}
+        self.compiled_model = openvino.Core().compile_model(self.model_path, "CPU", config)
+        self.output = self.compiled_model.output(0)
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        return self.compiled_model([batch])[self.output]
+
+
+BACKENDS = {
+    UltralyticsBackend.name: UltralyticsBackend,
+    ONNXRuntimeBackend.name: ONNXRuntimeBackend,
+    OpenVINOBackend.name: OpenVINOBackend,
+}
+
+
+def create_backend(name: str, model_path: str, options: Optional[Dict[str, Any]] = None) -> InferenceBackend:
+    """
+    Create an inference backend by name.
+
+    :param name: One of "ultralytics", "onnxruntime" or "openvino".
+    :param model_path: Path to the YOLO model file.
+    :param options: Backend-specific keyword arguments, such as intra_op_threads for onnxruntime.
+    :return: The backend.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {name!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](model_path, **(options or {}))
@@ -0,0 +1,146 @@
+import logging
+import time
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..metrics import default_metrics
+
+GATE_METHODS = ("difference", "dhash")
+
+
+def difference_signature(image: np.ndarray, size: Tuple[int, int] = (64, 48)) -> np.ndarray:
+    """
+    Downsampled grayscale copy of an image. Area interpolation averages away sensor noise and small jitter.
+
+    :param image: A BGR or grayscale image.
+    :param size: (width, height) of the signature.
+    """
+    import cv2
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+def dhash_signature(image: np.ndarray, hash_size: int = 8) -> np.ndarray:
+    """
+    Difference hash of an image: whether each pixel of a (hash_size + 1) x hash_size thumbnail is brighter
+    than its right neighbour, as a flat boolean array of hash_size ** 2 bits.
+    """
+    thumbnail = difference_signature(image, (hash_size + 1, hash_size))
+    return (thumbnail[:, 1:] > thumbnail[:, :-1]).ravel()
+
+
+class ChangeGate:
+    def __init__(self, method: str = "difference", pixel_threshold: int = 12, change_threshold: float = 0.01,
+                 hash_threshold: int = 4, hash_size: int = 8, size: Tuple[int, int] = (64, 48), max_skips: int = 30,
+                 max_age: float = 600.0):
+        """
+        Pre-inference gate that skips inference on captures that did not change and reuses the previous results.
+
+        A capture is compared with the last capture that went through inference rather than with the one just
+        before it, so a slow drift (like the light changing through the day) eventually triggers inference.
+        Inference also runs at least every `max_skips` captures and every `max_age` seconds.
+
+        :param method: "difference" compares downsampled grayscale frames; "dhash" compares perceptual hashes,
+            which ignore global brightness changes.
+        :param pixel_threshold: difference: grey levels a downsampled pixel must change by to count as changed.
+        :param change_threshold: difference: fraction of changed pixels above which a frame counts as changed.
+        :param hash_threshold: dhash: number of differing hash bits above which a frame counts as changed.
+        :param hash_size: dhash: side of the hash grid; larger hashes notice smaller changes.
+        :param size: difference: (width, height) of the downsampled frames.
+        :param max_skips: Maximum number of consecutive captures that reuse earlier results.
+        :param max_age: Maximum age in seconds of reused results.
+        """
+        if method not in GATE_METHODS:
+            raise ValueError(f"Unknown change gate method {method!r}, expected one of {GATE_METHODS}")
+        self.method = method
+        self.pixel_threshold = pixel_threshold
+        self.change_threshold = change_threshold
+        self.hash_threshold = hash_threshold
+        self.hash_size = hash_size
+        self.size = size
+        self.max_skips = max_skips
+        self.max_age = max_age
+
+        self.checked = 0
+        self.skipped = 0
+        self._reference: Optional[List[np.ndarray]] = None
+        self._results: Any = None
+        self._results_time = float("-inf")
+        self._consecutive_skips = 0
+        self._skipped_counter = default_metrics.counter(
+            "frames_unchanged_total", "Captures whose inference was skipped because they did not change")
+        self._skipped_counter.inc(0)
+
+    def signature(self, image: np.ndarray) -> np.ndarray:
+        if self.method == "dhash":
+            return dhash_signature(image, self.hash_size)
+        return difference_signature(image, self.size)
+
+    def is_changed(self, previous: np.ndarray, current: np.ndarray) -> bool:
+        """Whether two signatures differ by more than the configured threshold."""
+        if previous.shape != current.shape:
+            return True
+        if self.method == "dhash":
+            return int(np.count_nonzero(previous != current)) > self.hash_threshold
+        changed = np.abs(current - previous) > self.pixel_threshold
+        return changed.mean() > self.change_threshold
+
+    def run(self, images: Sequence[np.ndarray], infer_fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Return the results of `infer_fn`, or the previous results if none of `images` changed.
+
+        :param images: The images of one capture, such as its RGB and Thermal frames.
+        :param infer_fn: Runs inference on the capture.
+        :return: The results, and whether they were reused from an earlier capture.
+        """
+        self.checked += 1
+        with default_metrics.timer("change_gate"):
+            signatures = [self.signature(image) for image in images]
+            unchanged = (
+                self._reference is not None
+                and len(self._reference) == len(signatures)
+                and self._consecutive_skips < self.max_skips
+                and time.monotonic() - self._results_time < self.max_age
+                and not any(self.is_changed(previous, current)
+                            for previous, current in zip(self._reference, signatures))
+            )
+        if unchanged:
+            self.skipped += 1
+            self._consecutive_skips += 1
+            self._skipped_counter.inc()
+            logging.debug(f"Capture unchanged, reusing previous results ({self.skipped}/{self.checked} skipped)")
+            return self._results, True
+
+        results = infer_fn()
+        self._reference = signatures
+        self._results = results
+        self._results_time = time.monotonic()
+        self._consecutive_skips = 0
+        return results, False
+
+    def reset(self) -> None:
+        """Forget the reference capture, so that the next capture always goes through inference."""
+        self._reference = None
+        self._results = None
+
+    @property
+    def skip_rate(self) -> float:
+        return self.skipped / self.checked if self.checked else 0.0
+
+
+def get_change_gate(config) -> Optional[ChangeGate]:
+    """Factory function to create the change gate configured by the `change_gate` section, if enabled."""
+    gate_config = config.get("change_gate") or {}
+    if not gate_config.get("enabled", False):
+        return None
+    return ChangeGate(
+        method=gate_config.get("method", "difference"),
+        pixel_threshold=gate_config.get("pixel_threshold", 12),
+        change_threshold=gate_config.get("change_threshold", 0.01),
+        hash_threshold=gate_config.get("hash_threshold", 4),
+        hash_size=gate_config.get("hash_size", 8),
+        max_skips=gate_config.get("max_skips", 30),
+        max_age=gate_config.get("max_age", 600.0),
+    )
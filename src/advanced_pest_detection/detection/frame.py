@@ -0,0 +1,112 @@
+import os
+import threading
+from typing import Dict, Optional, Union
+
+import numpy as np
+
+from ..metrics import default_metrics
+
+
+class Frame:
+    def __init__(self, path: Optional[str] = None, image: Optional[np.ndarray] = None):
+        """
+        A single decoded capture that is shared by the detectors and the annotator.
+
+        The image is decoded from `path` at most once, on first access, and handed out as a read-only view
+        so that every consumer sees the same pixels without copying them. Concurrent first accesses, such as the
+        RGB and Thermal detectors reading the same file in concurrent mode, wait for a single decode.
+
+        :param path: Path to the image file. Optional when `image` is given.
+        :param image: An already decoded image array. Takes precedence over `path`.
+        """
+        if path is None and image is None:
+            raise ValueError("Frame needs either a path or an image array.")
+        self.path = path
+        self._image = image
+        self._decode_lock = threading.Lock()
+
+    @property
+    def image(self) -> np.ndarray:
+        """
+        The decoded image as a read-only view. Decodes the file on first access.
+        """
+        image = self._image
+        if image is None:
+            with self._decode_lock:
+                image = self._image
+                if image is None:
+                    if self.path is None:
+                        raise ValueError("Frame has been released.")
+                    import cv2
+
+                    with default_metrics.timer("decode"):
+                        image = cv2.imread(self.path)
+                    if image is None:
+                        raise ValueError(f"Image at path {self.path} could not be loaded.")
+                    self._image = image
+        view = image.view()
+        view.flags.writeable = False
+        return view
+
+    @property
+    def is_decoded(self) -> bool:
+        return self._image is not None
+
+    def release(self) -> None:
+        """
+        Drop the reference to the decoded pixels. The frame decodes again if it is accessed afterwards.
+        """
+        self._image = None
+
+    def __enter__(self) -> "Frame":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.release()
+
+
+class FrameCache:
+    def __init__(self):
+        """
+        Per-capture decode cache keyed by absolute file path.
+
+        Use one cache per capture: the RGB and Thermal images (which are the same file in the simulated capture)
+        are decoded once, and every decoded frame is released when the cache is closed.
+        """
+        self._frames: Dict[str, Frame] = {}
+
+    def get(self, image: Union[str, np.ndarray, Frame]) -> Frame:
+        """
+        Return the frame for an image, decoding a file path at most once per cache.
+
+        :param image: The input image, either as a file path, a NumPy array or an existing Frame.
+        :return: The shared Frame.
+        """
+        if isinstance(image, Frame):
+            return image
+        if isinstance(image, np.ndarray):
+            return Frame(image=image)
+
+        key = os.path.abspath(image)
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = Frame(path=image)
+            self._frames[key] = frame
+        return frame
+
+    def release(self) -> None:
+        """
+        Release every decoded frame held by the cache.
+        """
+        for frame in self._frames.values():
+            frame.release()
+        self._frames.clear()
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def __enter__(self) -> "FrameCache":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.release()
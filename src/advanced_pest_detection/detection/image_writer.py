@@ -0,0 +1,186 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+from ..metrics import default_metrics
+from ..utils import TIMESTAMP_FORMAT
+
+IMAGE_FORMATS = ("jpg", "webp", "png")
+
+BOX_COLOR = (0, 255, 0)
+
+
+def draw_detections(image: np.ndarray, coordinates: Sequence[Sequence[float]]) -> np.ndarray:
+    """
+    Draw normalized [x_center, y_center, width, height] boxes and their centers on a copy of an image.
+
+    :param image: The image to annotate. It is not modified.
+    :param coordinates: Boxes in YOLO xywhn format.
+    :return: The annotated copy.
+    """
+    import cv2
+
+    image = image.copy()
+    if not len(coordinates):
+        return image
+
+    height, width = image.shape[:2]
+    boxes = np.asarray(coordinates, dtype=np.float64)[:, :4]
+    origins = np.column_stack([(boxes[:, 0] - boxes[:, 2] / 2) * width, (boxes[:, 1] - boxes[:, 3] / 2) * height])
+    sizes = np.column_stack([boxes[:, 2] * width, boxes[:, 3] * height])
+    origins, sizes = origins.astype(np.int32), sizes.astype(np.int32)
+    corners = np.column_stack([origins, origins + sizes])
+    # All rectangles in one call, as closed four-point polygons
+    polygons = corners[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 1, 2)
+    cv2.polylines(image, list(polygons), True, BOX_COLOR, 2)
+    for (x_center, y_center), (x, y) in zip(boxes[:, :2], corners[:, :2]):
+        cv2.putText(image, f"({x_center:.2f}, {y_center:.2f})", (int(x), int(y) - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, BOX_COLOR, 2)
+    return image
+
+
+class AnnotatedImageWriter:
+    def __init__(self, workers: int = 2, image_format: str = "jpg", quality: int = 90,
+                 thumbnail_size: int = 0, skip_empty: bool = False, max_pending: int = 8):
+        """
+        Draws detections on captures and encodes them to disk, on a pool of background threads.
+
+        `submit` decides the output path up front and returns it immediately, so the caller can record it
+        in the metadata while the image is still being annotated and encoded. Submitted images are only
+        referenced, never copied, until a worker draws on its own copy.
+
+        :param workers: Encoding threads. 0 annotates and encodes synchronously inside `submit`.
+        :param image_format: Output format: "jpg", "webp" or "png".
+        :param quality: JPEG or WebP quality from 1 to 100. Ignored for PNG.
+        :param thumbnail_size: Longest side, in pixels, of an extra downscaled copy saved next to each image. 0 disables thumbnails.
+        :param skip_empty: Do not write images without any detection.
+        :param max_pending: Images that may wait for a worker before `submit` blocks, bounding the memory they hold.
+        """
+        image_format = image_format.lower().replace("jpeg", "jpg")
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format {image_format!r}, expected one of {IMAGE_FORMATS}")
+        self.workers = workers
+        self.image_format = image_format
+        self.quality = quality
+        self.thumbnail_size = thumbnail_size
+        self.skip_empty = skip_empty
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-writer") if workers else None
+        self._pending = threading.BoundedSemaphore(max(max_pending, 1))
+        self._skipped = default_metrics.counter("images_skipped_total", "Annotated images not written because they had no detections")
+
+    def _encode_params(self) -> List[int]:
+        import cv2
+
+        if self.image_format == "jpg":
+            return [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        if self.image_format == "webp":
+            return [cv2.IMWRITE_WEBP_QUALITY, self.quality]
+        return []
+
+    def output_path(self, save_dir: str, timestamp: Optional[datetime] = None) -> str:
+        """Path the next image saved to `save_dir` is written to."""
+        timestamp = timestamp or datetime.now()
+        # Microseconds keep captures that land in the same second from overwriting each other
+        return os.path.join(
+            save_dir,
+            f"detected_image_{timestamp.strftime(TIMESTAMP_FORMAT)}_{timestamp.microsecond:06d}.{self.image_format}"
+        )
+
+    @staticmethod
+    def thumbnail_path(image_path: str) -> str:
+        stem, extension = os.path.splitext(image_path)
+        return f"{stem}_thumb{extension}"
+
+    def submit(self, image: np.ndarray, coordinates: Sequence[Sequence[float]], save_dir: str,
+               on_saved: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """
+        Queue an image to be annotated and written.
+
+        :param image: The capture to annotate. It is not modified and must not be modified until it is written.
+        :param coordinates: Boxes in YOLO xywhn format.
+        :param save_dir: Directory the image is written to.
+        :param on_saved: Called with the path of every file once it is on disk: the image, then its thumbnail.
+        :return: The path the image is written to, or None if it is skipped because it has no detections.
+        """
+        if self.skip_empty and not len(coordinates):
+            self._skipped.inc()
+            return None
+        save_path = self.output_path(save_dir)
+        if self._executor is None:
+            self._write(image, coordinates, save_path, on_saved)
+            return save_path
+
+        self._pending.acquire()
+        try:
+            future = self._executor.submit(self._write, image, coordinates, save_path, on_saved)
+        except Exception:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return save_path
+
+    def _write(self, image: np.ndarray, coordinates: Sequence[Sequence[float]], save_path: str,
+               on_saved: Optional[Callable[[str], None]]) -> None:
+        import cv2
+
+        try:
+            with default_metrics.timer("annotate"):
+                annotated = draw_detections(image, coordinates)
+                params = self._encode_params()
+                if not cv2.imwrite(save_path, annotated, params):
+                    raise IOError(f"Could not encode {save_path}")
+                written = [save_path]
+                if self.thumbnail_size:
+                    height, width = annotated.shape[:2]
+                    scale = self.thumbnail_size / max(height, width)
+                    if scale < 1:
+                        annotated = cv2.resize(annotated, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                               interpolation=cv2.INTER_AREA)
+                    thumbnail_path = self.thumbnail_path(save_path)
+                    cv2.imwrite(thumbnail_path, annotated, params)
+                    written.append(thumbnail_path)
+            logging.debug(f"Image saved with final coordinates at: {save_path}")
+        except Exception as e:
+            logging.error(f"Error processing image: {e}")
+            return
+
+        if on_saved is not None:
+            for path in written:
+                try:
+                    on_saved(path)
+                except Exception as e:
+                    logging.error(f"Error handling saved image {path}: {e}")
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Stop the workers. Safe to call more than once.
+
+        :param wait: Finish writing every queued image first.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def __enter__(self) -> "AnnotatedImageWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def get_image_writer(config) -> AnnotatedImageWriter:
+    """Factory function to create the annotated image writer configured by the `image_output` section."""
+    output_config = config.get("image_output") or {}
+    return AnnotatedImageWriter(
+        workers=output_config.get("workers", 2),
+        image_format=output_config.get("format", "jpg"),
+        quality=output_config.get("quality", 90),
+        thumbnail_size=output_config.get("thumbnail_size", 0),
+        skip_empty=output_config.get("skip_empty", False),
+        max_pending=output_config.get("max_pending", 8),
+    )
@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .backends import InferenceBackend, create_backend, file_digest
+
+# (backend name, content digest or model name, backend options)
+ModelKey = Tuple[str, str, Tuple[Tuple[str, Any], ...]]
+
+
+class SharedBackend(InferenceBackend):
+    def __init__(self, key: ModelKey, backend: str, model_path: str, options: Optional[Dict[str, Any]] = None):
+        """
+        An inference backend shared by every detector that uses the same weights.
+
+        The underlying model is created on the first `load`, `warmup` or `predict` call. Predictions are
+        serialized by a lock, since neither an ultralytics predictor nor a single exported-model session
+        should be driven from several threads at once.
+
+        :param key: Registry key of the model.
+        :param backend: Inference backend name.
+        :param model_path: Path to the YOLO model file.
+        :param options: Backend-specific options.
+        """
+        self.key = key
+        self.name = backend
+        self.model_path = model_path
+        self.options = options
+        self.load_seconds: Optional[float] = None
+        self._backend: Optional[InferenceBackend] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._backend is not None
+
+    def load(self) -> InferenceBackend:
+        """Create the underlying backend if it does not exist yet, and return it."""
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    logging.info(f"Loading {self.name} model from {self.model_path}")
+                    start = time.perf_counter()
+                    self._backend = create_backend(self.name, self.model_path, self.options)
+                    self.load_seconds = time.perf_counter() - start
+        return self._backend
+
+    def warmup(self, imgsz: int = 640) -> None:
+        """
+        Load the model and run one inference on a blank frame, so that the first real frame does not pay
+        for lazy initialization inside the inference framework.
+
+        :param imgsz: Side of the blank square frame.
+        """
+        self.predict([np.zeros((imgsz, imgsz, 3), dtype=np.uint8)], conf=1.0)
+
+    def predict(self, images: List[np.ndarray], conf: float) -> List[np.ndarray]:
+        backend = self.load()
+        with self._lock:
+            return backend.predict(images, conf)
+
+
+class ModelRegistry:
+    def __init__(self):
+        """
+        Cache of loaded models keyed by backend, content hash and backend options, so that detectors
+        configured with identical weights share one model in memory, whatever path they reach them through.
+        """
+        self._models: Dict[ModelKey, SharedBackend] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def model_key(backend: str, model_path: str, options: Optional[Dict[str, Any]] = None) -> ModelKey:
+        """
+        Build the registry key of a model. Files are resolved through symlinks and identified by their SHA-256,
+        so copies of the same weights share a model while a file replaced on disk does not reuse the stale one.
+        Paths that do not exist locally (such as names ultralytics downloads on demand) are keyed by name.
+        """
+        resolved = os.path.realpath(model_path)
+        identity = "sha256:" + file_digest(resolved) if os.path.isfile(resolved) else model_path
+        return backend, identity, tuple(sorted((options or {}).items()))
+
+    def get(self, backend: str, model_path: str, options: Optional[Dict[str, Any]] = None,
+            lazy: bool = False) -> SharedBackend:
+        """
+        Return the shared model for these weights, registering it on first request.
+
+        :param backend: Inference backend name.
+        :param model_path: Path to the YOLO model file.
+        :param options: Backend-specific options.
+        :param lazy: Defer loading the model until its first use.
+        :return: The shared backend.
+        """
+        key = self.model_key(backend, model_path, options)
+        with self._lock:
+            shared = self._models.get(key)
+            if shared is None:
+                shared = self._models[key] = SharedBackend(key, backend, model_path, options)
+            else:
+                logging.info(f"Reusing the {backend} model loaded for {shared.model_path} for {model_path}")
+        if not lazy:
+            shared.load()
+        return shared
+
+    def warmup(self, imgsz: int = 640) -> None:
+        """Load and warm up every registered model."""
+        for shared in list(self._models.values()):
+            shared.warmup(imgsz)
+
+    def clear(self) -> None:
+        """Forget every registered model. Detectors still holding one keep it alive until they are released."""
+        with self._lock:
+            self._models.clear()
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+
+default_registry = ModelRegistry()
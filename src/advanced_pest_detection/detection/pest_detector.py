@@ -1,100 +1,268 @@
-import os
-from typing import List, Union
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
-import cv2
 import numpy as np
 # from advanced_pest_detection.detection.rgb_detector import RGBDetector
 # from advanced_pest_detection.detection.thermal_detector import ThermalDetector
 from .rgb_detector import RGBDetector
 from .thermal_detector import ThermalDetector
+from .frame import Frame
+from .image_writer import AnnotatedImageWriter
+from .model_registry import ModelRegistry
+from .tiling import TiledInference, get_tiled_inference
+from ..fusion.fusion_module import FusionModule
+from ..metrics import default_metrics
 
-from datetime import datetime
 
 class PestDetector:
-    def __init__(self, rgb_model_path: str, thermal_model_path: str):
+    def __init__(self, rgb_model_path: str, thermal_model_path: str, batch_size: int = 16, concurrent: bool = False,
+                 environmental_params: Optional[Dict[str, Any]] = None, fusion_iou_threshold: float = 0.55,
+                 backend: str = "ultralytics", backend_options: Optional[Dict[str, Any]] = None,
+                 lazy: bool = False, registry: Optional[ModelRegistry] = None,
+                 image_writer: Optional[AnnotatedImageWriter] = None, tiling: Optional[TiledInference] = None):
         """
         Initialize the PestDetector with paths to the RGB and Thermal models.
 
         :param rgb_model_path: Path to the RGB YOLO model.
         :param thermal_model_path: Path to the Thermal YOLO model.
+        :param batch_size: Maximum number of frames stacked into one forward pass by `detect_batch`.
+        :param concurrent: Run the RGB and Thermal models in parallel on a two-thread pool instead of back-to-back.
+            Both models stay loaded in this process; PyTorch releases the GIL during inference, so the passes overlap.
+        :param environmental_params: Environmental parameters used to weight the modalities during fusion.
+        :param fusion_iou_threshold: Minimum IoU for an RGB and a Thermal box to be fused into one detection.
+        :param backend: Inference backend for both models: "ultralytics" (PyTorch), "onnxruntime" or "openvino".
+        :param backend_options: Backend-specific options, such as intra_op_threads for onnxruntime.
+        :param lazy: Defer loading the models until the first detection or an explicit `warmup`.
+        :param registry: Registry the models are shared through. Defaults to the process-wide registry, so that
+            identical RGB and Thermal weights are loaded only once.
+        :param image_writer: Annotates and encodes the images passed to `save_detected_image`. Defaults to
+            synchronous full-quality JPEG encoding.
+        :param tiling: Tiled inference for both models, so that small insects on high-resolution captures are
+            not lost to downscaling. Images no larger than its `min_image_size` are still processed whole.
         """
-        self.rgb_detector = RGBDetector(rgb_model_path)
-        self.thermal_detector = ThermalDetector(thermal_model_path)
-        print("PestDetector initialized with RGB and Thermal models.")
+        self.rgb_detector = RGBDetector(rgb_model_path, backend=backend, backend_options=backend_options,
+                                        lazy=lazy, registry=registry, tiling=tiling)
+        self.thermal_detector = ThermalDetector(thermal_model_path, backend=backend, backend_options=backend_options,
+                                                lazy=lazy, registry=registry, tiling=tiling)
+        self.batch_size = batch_size
+        self.image_writer = image_writer or AnnotatedImageWriter(workers=0, quality=95)
+        self.environmental_params = environmental_params or {}
+        self.fusion_module = FusionModule(iou_threshold=fusion_iou_threshold)
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pest-detector") if concurrent else None
+        self.detections = default_metrics.counter("detections_total", "Boxes found, by modality")
+        logging.info(f"PestDetector initialized with RGB and Thermal models ({'concurrent' if concurrent else 'sequential'} mode).")
 
-    def rgb_detect(self, image: Union[str, np.ndarray]) -> List[List[float]]:
+    @property
+    def shares_model(self) -> bool:
         """
-        Perform inference for RGB images.
+        Whether the RGB and Thermal detectors run the same model with the same settings, in which case both
+        modalities are stacked into one forward pass instead of two.
+        """
+        return (self.rgb_detector.backend is self.thermal_detector.backend
+                and self.rgb_detector.conf_threshold == self.thermal_detector.conf_threshold
+                and self.rgb_detector.tiling is self.thermal_detector.tiling)
 
-        :param image: The input RGB image, either as a file path or a NumPy array.
-        :return: A list of bounding box coordinates.
+    def warmup(self, imgsz: int = 640) -> None:
         """
+        Load both models, if they are not loaded yet, and run one inference on a blank frame through each.
+
+        :param imgsz: Side of the blank square frame.
+        """
+        self.rgb_detector.backend.warmup(imgsz)
+        if not self.shares_model:
+            self.thermal_detector.backend.warmup(imgsz)
+
+    def __enter__(self) -> "PestDetector":
+        return self
 
-        return self.rgb_detector.detect(image)
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
 
-    def thermal_detect(self, image: Union[str, np.ndarray]) -> List[List[float]]:
+    def close(self) -> None:
+        """
+        Shut down the worker pool used in concurrent mode and wait for the image writer to finish every queued image.
+        Safe to call more than once.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.image_writer.close()
+
+    def rgb_detect(self, image: Union[str, np.ndarray, Frame], with_confidence: bool = False) -> List[List[float]]:
+        """
+        Perform inference for RGB images.
+
+        :param image: The input RGB image, either as a file path, a NumPy array or a shared Frame.
+        :param with_confidence: Append the detection confidence to every box, as used by fusion and tracking.
+        :return: A list of bounding box coordinates in xywhn format.
+        """
+        with default_metrics.timer("rgb_inference"):
+            return self.rgb_detector.detect(image, with_confidence=with_confidence)
+
+    def thermal_detect(self, image: Union[str, np.ndarray, Frame], with_confidence: bool = False) -> List[List[float]]:
         """
         Perform YOLOv8 inference for Thermal images.
 
-        :param image: The input Thermal image, either as a file path or a NumPy array.
-        :return: A list of bounding box coordinates.
+        :param image: The input Thermal image, either as a file path, a NumPy array or a shared Frame.
+        :param with_confidence: Append the detection confidence to every box, as used by fusion and tracking.
+        :return: A list of bounding box coordinates in xywhn format.
+        """
+        with default_metrics.timer("thermal_inference"):
+            return self.thermal_detector.detect(image, with_confidence=with_confidence)
+
+    def detect(self, rgb_image: Union[str, np.ndarray, Frame], thermal_image: Union[str, np.ndarray, Frame],
+               with_confidence: bool = False) -> Tuple[List[List[float]], List[List[float]]]:
+        """
+        Perform RGB and Thermal inference for one capture, in parallel when the detector runs in concurrent mode.
+
+        :param rgb_image: The input RGB image, either as a file path, a NumPy array or a shared Frame.
+        :param thermal_image: The input Thermal image, either as a file path, a NumPy array or a shared Frame.
+        :param with_confidence: Append the detection confidence to every box, as used by fusion and tracking.
+        :return: A tuple of RGB and Thermal bounding box coordinates in xywhn format.
         """
-        return self.thermal_detector.detect(image)
+        if self.shares_model:
+            if rgb_image is thermal_image:
+                # One image stands in for both modalities: the model would only find the same boxes twice
+                with default_metrics.timer("rgb_thermal_inference"):
+                    coordinates = self.rgb_detector.detect(rgb_image, with_confidence=with_confidence)
+                return coordinates, list(coordinates)
+            with default_metrics.timer("rgb_thermal_inference"):
+                rgb_coordinates, thermal_coordinates = self.rgb_detector.detect_batch(
+                    [rgb_image, thermal_image], batch_size=2, with_confidence=with_confidence
+                )
+            return rgb_coordinates, thermal_coordinates
 
-    def combine_coordinates(self, rgb_coordinates: List[List[float]], thermal_coordinates: List[List[float]]) -> List[List[float]]:
+        if self._executor is None:
+            return self.rgb_detect(rgb_image, with_confidence), self.thermal_detect(thermal_image, with_confidence)
+
+        thermal_future = self._executor.submit(self.thermal_detect, thermal_image, with_confidence)
+        rgb_future = self._executor.submit(self.rgb_detect, rgb_image, with_confidence)
+        return rgb_future.result(), thermal_future.result()
+
+    def detect_batch(self, rgb_images: Sequence[Union[str, np.ndarray, Frame]],
+                     thermal_images: Sequence[Union[str, np.ndarray, Frame]],
+                     strict: bool = False,
+                     with_confidence: bool = False) -> Tuple[List[List[List[float]]], List[List[List[float]]]]:
         """
-        Combine detection coordinates from RGB and Thermal images.
+        Perform batched RGB and Thermal inference over several captures.
+
+        :param rgb_images: The input RGB images, either as file paths, NumPy arrays or shared Frames.
+        :param thermal_images: The matching Thermal images, in the same order as `rgb_images`.
+        :param strict: Raise inference errors instead of reporting no detections for the images they affect.
+        :param with_confidence: Append the detection confidence to every box, as used by fusion and tracking.
+        :return: A tuple of per-capture RGB and per-capture Thermal bounding box coordinates in xywhn format.
+        """
+        if len(rgb_images) != len(thermal_images):
+            raise ValueError(f"Got {len(rgb_images)} RGB images but {len(thermal_images)} Thermal images.")
+
+        if self.shares_model:
+            if rgb_images is thermal_images:
+                # The same images stand in for both modalities, as in ingestion: run them through the model once
+                with default_metrics.timer("rgb_thermal_inference"):
+                    coordinates = self.rgb_detector.detect_batch(rgb_images, batch_size=self.batch_size, strict=strict,
+                                                               with_confidence=with_confidence)
+                return coordinates, [list(boxes) for boxes in coordinates]
+            # Interleave the modalities so that each forward pass holds complete captures
+            interleaved = [image for pair in zip(rgb_images, thermal_images) for image in pair]
+            with default_metrics.timer("rgb_thermal_inference"):
+                coordinates = self.rgb_detector.detect_batch(interleaved, batch_size=2 * self.batch_size, strict=strict,
+                                                           with_confidence=with_confidence)
+            return coordinates[0::2], coordinates[1::2]
+
+        if self._executor is None:
+            return (self._rgb_detect_batch(rgb_images, strict, with_confidence),
+                    self._thermal_detect_batch(thermal_images, strict, with_confidence))
+
+        thermal_future = self._executor.submit(self._thermal_detect_batch, thermal_images, strict, with_confidence)
+        rgb_future = self._executor.submit(self._rgb_detect_batch, rgb_images, strict, with_confidence)
+        return rgb_future.result(), thermal_future.result()
+
+    def _rgb_detect_batch(self, images: Sequence[Union[str, np.ndarray, Frame]],
+                          strict: bool = False, with_confidence: bool = False) -> List[List[List[float]]]:
+        with default_metrics.timer("rgb_inference"):
+            return self.rgb_detector.detect_batch(images, batch_size=self.batch_size, strict=strict,
+                                                  with_confidence=with_confidence)
+
+    def _thermal_detect_batch(self, images: Sequence[Union[str, np.ndarray, Frame]],
+                              strict: bool = False, with_confidence: bool = False) -> List[List[List[float]]]:
+        with default_metrics.timer("thermal_inference"):
+            return self.thermal_detector.detect_batch(images, batch_size=self.batch_size, strict=strict,
+                                                      with_confidence=with_confidence)
 
-        :param rgb_coordinates: Coordinates from RGB detection.
-        :param thermal_coordinates: Coordinates from Thermal detection.
+    def combine_coordinates(self, rgb_coordinates: List[List[float]], thermal_coordinates: List[List[float]],
+                            return_scores: bool = False) -> List[List[float]]:
+        """
+        Combine detection coordinates from RGB and Thermal images, fusing overlapping boxes of the same object.
+
+        :param rgb_coordinates: Coordinates from RGB detection, with confidences when detected `with_confidence`.
+        :param thermal_coordinates: Coordinates from Thermal detection, with confidences when detected `with_confidence`.
+        :param return_scores: Append the fused score to every box; it is highest for boxes both modalities found.
         :return: Combined coordinates.
         """
-        print("Combining coordinates from RGB and Thermal detections.")
-        # Placeholder implementation, should be replaced with actual logic
-        # Convert coordinates to tuples to use in a set for uniqueness
-        all_coordinates = set(tuple(coord) for coord in rgb_coordinates + thermal_coordinates)
-        combined_coordinates = [list(coord) for coord in all_coordinates]
-        # combined_coordinates = rgb_coordinates + thermal_coordinates
-        print(f"Combined coordinates: {combined_coordinates}")
+        with default_metrics.timer("fusion"):
+            combined_coordinates = self.fusion_module.fuse_detections(
+                rgb_coordinates, thermal_coordinates, self.environmental_params, return_scores=return_scores
+            )
+        self.detections.inc(len(rgb_coordinates), modality="rgb")
+        self.detections.inc(len(thermal_coordinates), modality="thermal")
+        self.detections.inc(len(combined_coordinates), modality="fused")
+        logging.debug("Combined coordinates: %s", combined_coordinates)
         return combined_coordinates
-    
-    def save_detected_image(self, image: Union[str, np.ndarray], final_coordinates: List[List[float]], save_dir: str):
+
+    def save_detected_image(self, image: Union[str, np.ndarray, Frame], final_coordinates: List[List[float]], save_dir: str,
+                            on_saved: Optional[Callable[[str], None]] = None) -> Optional[str]:
         """
-        Save the image with final coordinates drawn on it.
+        Save the image with final coordinates drawn on it, in the background when the image writer has workers.
 
-        :param image: The input image, either as a file path or a NumPy array.
+        :param image: The input image, either as a file path, a NumPy array or a shared Frame.
+            The input is never modified; boxes are drawn on a private copy.
         :param final_coordinates: The coordinates to display on the image.
         :param save_dir: Directory to save the output image.
+        :param on_saved: Called with the path of every written file (the image, then its thumbnail) once it is on disk.
+        :return: The path the image is written to, or None if it is not saved.
         """
-        print("Saving image with final coordinates.")
         try:
-            if isinstance(image, str):
-                image = cv2.imread(image)
+            if isinstance(image, Frame):
+                image = image.image
+            elif isinstance(image, str):
+                import cv2
+
+                image_path = image
+                image = cv2.imread(image_path)
                 if image is None:
-                    raise ValueError(f"Image at path {image} could not be loaded.")
-            
-            height, width = image.shape[:2]
-            
-            for coord in final_coordinates:
-                # YOLO format is [x_center, y_center, width, height] normalized
-                x_center, y_center, w, h = coord
-                
-                # Convert normalized coordinates to pixel values
-                x = int((x_center - w/2) * width)
-                y = int((y_center - h/2) * height)
-                w = int(w * width)
-                h = int(h * height)
-                
-                cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                
-                # Optionally, add text with coordinates
-                label = f"({x_center:.2f}, {y_center:.2f})"
-                cv2.putText(image, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-            # Save the image
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            save_path = os.path.join(save_dir, f"detected_image_{timestamp}.jpg")
-            cv2.imwrite(save_path, image)
-            print(f"Image saved with final coordinates at: {save_path}")
+                    raise ValueError(f"Image at path {image_path} could not be loaded.")
+            return self.image_writer.submit(image, final_coordinates, save_dir, on_saved=on_saved)
         except Exception as e:
-            print(f"Error processing image: {e}")
\ No newline at end of file
+            logging.error(f"Error processing image: {e}")
+            return None
+
+
+def get_pest_detector(config, batch_size: int = 16, concurrent: bool = False, lazy: Optional[bool] = None,
+                      image_writer: Optional[AnnotatedImageWriter] = None) -> PestDetector:
+    """
+    Factory function to create the PestDetector configured by the `rgb_model`, `thermal_model`, `inference`,
+    `fusion` and `environment` entries of the configuration.
+
+    :param lazy: Defer loading the models. Defaults to `inference.lazy_load`.
+    """
+    from omegaconf import OmegaConf
+
+    inference_config = config.get("inference") or {}
+    backend = inference_config.get("backend", "ultralytics")
+    backend_options = inference_config.get(backend)
+    if OmegaConf.is_config(backend_options):
+        backend_options = OmegaConf.to_container(backend_options)
+    return PestDetector(
+        rgb_model_path=config.rgb_model.path,
+        thermal_model_path=config.thermal_model.path,
+        batch_size=batch_size,
+        concurrent=concurrent,
+        environmental_params={"environment": config.get("environment")},
+        fusion_iou_threshold=(config.get("fusion") or {}).get("iou_threshold", 0.55),
+        backend=backend,
+        backend_options=backend_options or {},
+        lazy=inference_config.get("lazy_load", False) if lazy is None else lazy,
+        image_writer=image_writer,
+        tiling=get_tiled_inference(config),
+    )
@@ -1,53 +1,105 @@
-from ultralytics import YOLO
-from typing import List, Union
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Union
 import numpy as np
-import cv2
+
+from .model_registry import ModelRegistry, default_registry
+from .frame import Frame
+from .tiling import TiledInference
 
 class RGBDetector:
-    def __init__(self, model_path: str, conf_threshold: float = 0.3):
+    def __init__(self, model_path: str, conf_threshold: float = 0.3, backend: str = "ultralytics",
+                 backend_options: Optional[Dict[str, Any]] = None, lazy: bool = False,
+                 registry: Optional[ModelRegistry] = None, tiling: Optional[TiledInference] = None):
         """
         Initialize the RGBDetector with a YOLO model.
 
         :param model_path: Path to the YOLO model file.
         :param conf_threshold: Confidence threshold for detections.
+        :param backend: Inference backend: "ultralytics" (PyTorch), "onnxruntime" or "openvino".
+        :param backend_options: Backend-specific options, such as intra_op_threads for onnxruntime.
+        :param lazy: Defer loading the model until the first detection.
+        :param registry: Registry the model is shared through. Defaults to the process-wide registry.
+        :param tiling: Split large images into overlapping tiles instead of downscaling them to the model input.
         """
-        self.model = YOLO(model_path)
+        self.backend = (registry if registry is not None else default_registry).get(backend, model_path, backend_options, lazy=lazy)
         self.conf_threshold = conf_threshold
-        print(f"RGB Model loaded from {model_path} with confidence threshold {conf_threshold}")
+        self.tiling = tiling
+        logging.info(f"RGB Model {'registered' if lazy else 'loaded'} from {model_path} with confidence threshold {conf_threshold} ({backend} backend)")
 
-    def _load_image(self, image: Union[str, np.ndarray]) -> np.ndarray:
+    def _load_image(self, image: Union[str, np.ndarray, Frame]) -> np.ndarray:
         """
         Load an image from a file path or directly use an image array.
 
-        :param image: The input image, either as a file path or a NumPy array.
+        :param image: The input image, either as a file path, a NumPy array or a shared Frame.
         :return: The image as a NumPy array.
         """
-        if isinstance(image, str):
-            print(f"Loading image from path: {image}")
+        if isinstance(image, Frame):
+            image = image.image
+        elif isinstance(image, str):
+            logging.debug(f"Loading image from path: {image}")
+            import cv2
+
             image = cv2.imread(image)
             if image is None:
                 raise ValueError(f"Image at path {image} could not be loaded.")
-        else:
-            print("Using provided image array.")
         return image
 
-    def detect(self, image: Union[str, np.ndarray]) -> List[List[float]]:
+    def _predict(self, images: List[np.ndarray]) -> List[np.ndarray]:
+        if self.tiling is not None:
+            return self.tiling.predict(self.backend, images, self.conf_threshold)
+        return self.backend.predict(images, self.conf_threshold)
+
+    @staticmethod
+    def _columns(prediction: np.ndarray, with_confidence: bool) -> np.ndarray:
+        # Backends return [x, y, w, h, conf] rows
+        return prediction if with_confidence else prediction[:, :4]
+
+    def detect(self, image: Union[str, np.ndarray, Frame], with_confidence: bool = False) -> List[List[float]]:
         """
         Perform object detection on an RGB image using YOLO.
 
-        :param image: The input image, either as a file path or a NumPy array.
+        :param image: The input image, either as a file path, a NumPy array or a shared Frame.
+        :param with_confidence: Append the detection confidence to every box, as used by fusion and tracking.
         :return: A list of bounding box coordinates in xywhn format.
         """
         try:
             image = self._load_image(image)
-            print("Starting RGB detection...")
-            result_rgb = self.model.predict(source=image, conf=self.conf_threshold)
-            boxes_rgb = result_rgb[0].boxes.xywhn
-
-            rgb_coordinates = [box.tolist() for box in boxes_rgb]
-            print(f"RGB Detection completed. Found {len(rgb_coordinates)} objects.")
+            predictions = self._predict([image])
+            rgb_coordinates = self._columns(predictions[0], with_confidence).tolist()
+            logging.debug(f"RGB Detection completed. Found {len(rgb_coordinates)} objects.")
 
             return rgb_coordinates
         except Exception as e:
-            print(f"Error during detection: {e}")
+            logging.error(f"Error during RGB detection: {e}")
             return []
+
+    def detect_batch(self, images: Sequence[Union[str, np.ndarray, Frame]], batch_size: int = 16,
+                     strict: bool = False, with_confidence: bool = False) -> List[List[List[float]]]:
+        """
+        Perform object detection on several RGB images, stacking up to `batch_size` frames per forward pass.
+
+        :param images: The input images, each either a file path, a NumPy array or a shared Frame.
+        :param batch_size: Maximum number of frames passed to the model in a single call.
+        :param strict: Raise loading and inference errors instead of logging them and reporting no detections
+            for the images of the failed forward pass.
+        :param with_confidence: Append the detection confidence to every box, as used by fusion and tracking.
+        :return: One list of bounding box coordinates in xywhn format per input image, in input order.
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be a positive integer, got {batch_size}")
+
+        rgb_coordinates = []
+        for start in range(0, len(images), batch_size):
+            chunk = images[start:start + batch_size]
+            try:
+                frames = [self._load_image(image) for image in chunk]
+                predictions = self._predict(frames)
+                rgb_coordinates.extend(self._columns(prediction, with_confidence).tolist() for prediction in predictions)
+            except Exception as e:
+                if strict:
+                    raise
+                logging.error(f"Error during RGB batch detection: {e}")
+                rgb_coordinates.extend([] for _ in chunk)
+
+        logging.debug(f"RGB batch detection completed on {len(rgb_coordinates)} images.")
+        return rgb_coordinates
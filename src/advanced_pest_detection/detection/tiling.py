@@ -0,0 +1,189 @@
+import logging
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .backends import InferenceBackend
+from ..fusion.fusion_module import greedy_cluster, overlapping_pairs
+from ..metrics import default_metrics
+
+MERGE_METRICS = ("ios", "iou")
+
+# (x1, y1, x2, y2) pixel bounds of a tile
+Window = Tuple[int, int, int, int]
+
+
+def _axis_starts(length: int, tile_size: int, stride: int) -> List[int]:
+    if length <= tile_size:
+        return [0]
+    # The last tile is aligned with the far edge instead of running past it
+    return list(range(0, length - tile_size, stride)) + [length - tile_size]
+
+
+def tile_windows(height: int, width: int, tile_size: int = 640, overlap: float = 0.2) -> List[Window]:
+    """
+    Cover an image with square tiles that overlap their neighbours by at least `overlap` of their side.
+
+    :param height: Height of the image in pixels.
+    :param width: Width of the image in pixels.
+    :param tile_size: Side of the tiles in pixels. Tiles are clipped to images smaller than this.
+    :param overlap: Fraction of a tile shared with each neighbour, from 0 (inclusive) to 1 (exclusive).
+    :return: The (x1, y1, x2, y2) pixel bounds of every tile, row by row.
+    """
+    if tile_size < 1:
+        raise ValueError(f"tile_size must be a positive integer, got {tile_size}")
+    if not 0 <= overlap < 1:
+        raise ValueError(f"overlap must be in [0, 1), got {overlap}")
+    stride = max(1, int(tile_size * (1 - overlap)))
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in _axis_starts(height, tile_size, stride)
+        for x in _axis_starts(width, tile_size, stride)
+    ]
+
+
+def merge_detections(corners: np.ndarray, confidences: np.ndarray, threshold: float = 0.5,
+                     metric: str = "ios") -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge the duplicates that overlapping tiles produce for objects at their seams.
+
+    Boxes are clustered greedily by descending confidence; every cluster becomes the box enclosing all of
+    its members, with the confidence of its best member. Intersection over the smaller box pairs a complete
+    box with the truncated copy found in the neighbouring tile, which plain IoU would keep apart.
+
+    :param corners: Array of shape (N, 4) in xyxy format.
+    :param confidences: Array of shape (N,).
+    :param threshold: Minimum overlap for two boxes to be merged.
+    :param metric: "ios" (intersection over the smaller box) or "iou".
+    :return: The merged boxes in xyxy format and their confidences, by descending confidence.
+    """
+    if metric not in MERGE_METRICS:
+        raise ValueError(f"Unknown merge metric {metric!r}, expected one of {MERGE_METRICS}")
+    if not len(corners):
+        return corners.reshape(0, 4), confidences.reshape(0)
+
+    order = np.argsort(-confidences, kind="stable")
+    corners, confidences = corners[order], confidences[order]
+    first, second = overlapping_pairs(corners, threshold, metric=metric)
+    leaders = greedy_cluster(len(corners), first, second)
+
+    merged = corners.copy()
+    np.minimum.at(merged[:, 0], leaders, corners[:, 0])
+    np.minimum.at(merged[:, 1], leaders, corners[:, 1])
+    np.maximum.at(merged[:, 2], leaders, corners[:, 2])
+    np.maximum.at(merged[:, 3], leaders, corners[:, 3])
+    kept = np.flatnonzero(leaders == np.arange(len(corners)))
+    return merged[kept], confidences[kept]
+
+
+class TiledInference:
+    def __init__(self, tile_size: int = 640, overlap: float = 0.2, batch_size: int = 8, min_image_size: int = 0,
+                 full_frame: bool = True, merge_threshold: float = 0.5, merge_metric: str = "ios"):
+        """
+        Sliced inference for captures much larger than the model input: every large image is split into
+        overlapping tiles that are run through the model at close to native resolution, so that small insects
+        survive, and the boxes found in every tile are mapped back to the full frame and merged at the seams.
+
+        Tiles are slices of the decoded image, so they share its memory instead of copying it, and at most
+        `batch_size` of them are passed to the model at once. Peak memory therefore depends on the batch size,
+        not on the number of tiles.
+
+        :param tile_size: Side of the tiles in pixels, ideally the input size of the model.
+        :param overlap: Fraction of a tile shared with each neighbour; it should exceed the size of an insect.
+        :param batch_size: Maximum number of tiles per forward pass.
+        :param min_image_size: Longest side, in pixels, above which an image is tiled. 0 tiles every image
+            larger than a tile. Smaller images, like thermal captures, go through the model whole.
+        :param full_frame: Also run the whole image through the model, to find objects larger than a tile.
+        :param merge_threshold: Minimum overlap for two boxes to be merged.
+        :param merge_metric: "ios" (intersection over the smaller box) or "iou".
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be a positive integer, got {batch_size}")
+        if merge_metric not in MERGE_METRICS:
+            raise ValueError(f"Unknown merge metric {merge_metric!r}, expected one of {MERGE_METRICS}")
+        tile_windows(tile_size, tile_size, tile_size, overlap)
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.min_image_size = min_image_size or tile_size
+        self.full_frame = full_frame
+        self.merge_threshold = merge_threshold
+        self.merge_metric = merge_metric
+        self._tiles = default_metrics.counter("tiles_total", "Tiles passed to the model by tiled inference")
+
+    def applies(self, image: np.ndarray) -> bool:
+        """Whether `image` is large enough to be tiled."""
+        return max(image.shape[:2]) > self.min_image_size
+
+    def _slices(self, images: Sequence[np.ndarray]) -> Iterator[Tuple[int, Optional[Window], np.ndarray]]:
+        """Every input of the model: (image index, tile window or None for the whole image, pixels)."""
+        for index, image in enumerate(images):
+            if not self.applies(image):
+                yield index, None, image
+                continue
+            if self.full_frame:
+                yield index, None, image
+            height, width = image.shape[:2]
+            for window in tile_windows(height, width, self.tile_size, self.overlap):
+                x1, y1, x2, y2 = window
+                yield index, window, image[y1:y2, x1:x2]
+
+    def predict(self, backend: InferenceBackend, images: Sequence[np.ndarray], conf: float) -> List[np.ndarray]:
+        """
+        Run `backend` on `images`, tiling the large ones.
+
+        :param backend: The model.
+        :param images: The input images.
+        :param conf: Confidence threshold.
+        :return: One (N, 5) array of [x, y, w, h, confidence] detections normalized to the full frame per image.
+        """
+        corners: List[List[np.ndarray]] = [[] for _ in images]
+        confidences: List[List[np.ndarray]] = [[] for _ in images]
+        batch: List[Tuple[int, Optional[Window], np.ndarray]] = []
+
+        def flush() -> None:
+            predictions = backend.predict([pixels for _, _, pixels in batch], conf)
+            for (index, window, pixels), prediction in zip(batch, predictions):
+                height, width = pixels.shape[:2]
+                x1, y1 = window[:2] if window is not None else (0, 0)
+                boxes = prediction[:, :4] * [width, height, width, height]
+                centers = boxes[:, :2] + [x1, y1]
+                corners[index].append(np.column_stack([centers - boxes[:, 2:] / 2, centers + boxes[:, 2:] / 2]))
+                confidences[index].append(prediction[:, 4])
+            self._tiles.inc(sum(window is not None for _, window, _ in batch))
+            batch.clear()
+
+        for item in self._slices(images):
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                flush()
+        if batch:
+            flush()
+
+        results = []
+        with default_metrics.timer("tile_merge"):
+            for image, image_corners, image_confidences in zip(images, corners, confidences):
+                height, width = image.shape[:2]
+                merged, merged_confidences = merge_detections(
+                    np.concatenate(image_corners).reshape(-1, 4), np.concatenate(image_confidences).reshape(-1),
+                    self.merge_threshold, self.merge_metric)
+                xywhn = np.column_stack([(merged[:, :2] + merged[:, 2:]) / 2, merged[:, 2:] - merged[:, :2]])
+                results.append(np.column_stack([xywhn / [width, height, width, height], merged_confidences]).reshape(-1, 5))
+        logging.debug(f"Tiled inference completed on {len(images)} images.")
+        return results
+
+
+def get_tiled_inference(config) -> Optional[TiledInference]:
+    """Factory function to create the tiled inference configured by the `inference.tiling` section, if enabled."""
+    tiling_config = config.get("inference", {}).get("tiling") or {}
+    if not tiling_config.get("enabled", False):
+        return None
+    return TiledInference(
+        tile_size=tiling_config.get("tile_size", 640),
+        overlap=tiling_config.get("overlap", 0.2),
+        batch_size=tiling_config.get("batch_size", 8),
+        min_image_size=tiling_config.get("min_image_size", 0),
+        full_frame=tiling_config.get("full_frame", True),
+        merge_threshold=tiling_config.get("merge_threshold", 0.5),
+        merge_metric=tiling_config.get("merge_metric", "ios"),
+    )
@@ -1,7 +1,228 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Relative reliability of the (RGB, Thermal) modalities for the `environment` values used in config.yaml.
+# RGB degrades in low light, thermal contrast drops when the ground heats up during the day.
+ENVIRONMENT_MODALITY_WEIGHTS: Dict[str, Tuple[float, float]] = {
+    "morning": (1.0, 0.8),
+    "afternoon": (1.0, 0.6),
+    "evening": (0.8, 1.0),
+    "night": (0.3, 1.0),
+}
+DEFAULT_MODALITY_WEIGHTS = (1.0, 1.0)
+NUM_MODALITIES = 2
+
+
+def xywh_to_xyxy(boxes: np.ndarray) -> np.ndarray:
+    """
+    Convert boxes from [x_center, y_center, width, height] to [x1, y1, x2, y2].
+
+    :param boxes: Array of shape (N, 4).
+    :return: Array of shape (N, 4).
+    """
+    half_wh = boxes[:, 2:4] / 2
+    return np.concatenate([boxes[:, :2] - half_wh, boxes[:, :2] + half_wh], axis=1)
+
+
+def xyxy_to_xywh(boxes: np.ndarray) -> np.ndarray:
+    """
+    Convert boxes from [x1, y1, x2, y2] to [x_center, y_center, width, height].
+
+    :param boxes: Array of shape (N, 4).
+    :return: Array of shape (N, 4).
+    """
+    return np.concatenate([(boxes[:, :2] + boxes[:, 2:4]) / 2, boxes[:, 2:4] - boxes[:, :2]], axis=1)
+
+
+def box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """
+    Compute the pairwise IoU matrix between two sets of boxes in xyxy format.
+
+    :param boxes_a: Array of shape (N, 4).
+    :param boxes_b: Array of shape (M, 4).
+    :return: Array of shape (N, M) with the IoU of every pair.
+    """
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:4], boxes_b[None, :, 2:4])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def overlapping_pairs(boxes: np.ndarray, iou_threshold: float, metric: str = "iou") -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find every pair of boxes whose IoU reaches `iou_threshold`.
+
+    Boxes are swept in order of their left edge, so only pairs whose horizontal extents intersect are scored.
+    This only prunes on the x axis: the candidate pairs are proportional to the number of boxes times the
+    number of boxes sharing a vertical band with each, which is far below N² for insect-sized boxes spread
+    over a frame, but still O(N²) in the worst case, such as many boxes stacked in one column.
+
+    :param boxes: Array of shape (N, 4) in xyxy format.
+    :param iou_threshold: Minimum overlap for a pair to be returned.
+    :param metric: "iou" scores pairs by intersection over union; "ios" by intersection over the area of the
+        smaller box, which also pairs a box with a truncated copy of itself.
+    :return: Two index arrays (first, second) with first < second for every returned pair.
+    """
+    by_left = np.argsort(boxes[:, 0], kind="stable")
+    left = boxes[by_left, 0]
+    # For the box at sorted position i, candidates are the boxes starting before its right edge.
+    stops = np.searchsorted(left, boxes[by_left, 2], side="right")
+    counts = np.maximum(stops - np.arange(len(boxes)) - 1, 0)
+    if counts.sum() == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    sorted_first = np.repeat(np.arange(len(boxes)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    sorted_second = sorted_first + 1 + offsets
+    first, second = by_left[sorted_first], by_left[sorted_second]
+
+    top_left = np.maximum(boxes[first, :2], boxes[second, :2])
+    bottom_right = np.minimum(boxes[first, 2:4], boxes[second, 2:4])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=1)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if metric == "ios":
+        denominator = np.minimum(areas[first], areas[second])
+    else:
+        denominator = areas[first] + areas[second] - intersection
+    iou = np.divide(intersection, denominator, out=np.zeros_like(intersection), where=denominator > 0)
+
+    overlapping = iou >= iou_threshold
+    first, second = first[overlapping], second[overlapping]
+    return np.minimum(first, second), np.maximum(first, second)
+
+
+def greedy_cluster(num_boxes: int, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """
+    Assign score-sorted boxes to clusters exactly as greedy NMS would: a box leads a cluster unless a
+    higher-scoring cluster leader overlaps it, in which case it joins the highest-scoring such leader.
+
+    Leadership only depends on higher-scoring boxes, so it is resolved layer by layer over the overlap
+    graph; each pass is vectorized over the pairs, and the number of passes is the length of the longest
+    chain of overlapping boxes, which can approach N for a long row of boxes that each overlap the next.
+
+    :param num_boxes: Number of boxes, sorted by descending score.
+    :param first: Index of the higher-scoring box of every overlapping pair.
+    :param second: Index of the lower-scoring box of every overlapping pair.
+    :return: The index of the cluster leader of every box.
+    """
+    undecided, leader, suppressed = 0, 1, 2
+    state = np.full(num_boxes, undecided, dtype=np.int8)
+    while (state == undecided).any():
+        # A box is suppressed as soon as any higher-scoring leader overlaps it.
+        hit = second[state[first] == leader]
+        state[hit[state[hit] == undecided]] = suppressed
+        # A box leads once none of the higher-scoring boxes overlapping it can still become a leader.
+        blocked = np.bincount(second[state[first] == undecided], minlength=num_boxes) > 0
+        state[(state == undecided) & ~blocked] = leader
+
+    leaders = np.where(state == leader, np.arange(num_boxes), num_boxes)
+    joins = (state[first] == leader) & (state[second] == suppressed)
+    np.minimum.at(leaders, second[joins], first[joins])
+    return leaders
+
+
+def _as_detection_array(detections: Sequence[Sequence[float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Split xywhn detections, optionally carrying a fifth confidence column, into boxes and confidences.
+    Detections without a confidence column are treated as fully confident.
+    """
+    array = np.asarray(detections, dtype=np.float64)
+    if array.size == 0:
+        return np.empty((0, 4)), np.empty(0)
+    if array.ndim != 2 or array.shape[1] not in (4, 5):
+        raise ValueError(f"Expected detections of shape (N, 4) or (N, 5), got {array.shape}")
+    confidences = array[:, 4] if array.shape[1] == 5 else np.ones(len(array))
+    return array[:, :4], confidences
+
+
 class FusionModule:
-    def __init__(self):
-        pass
+    def __init__(self, iou_threshold: float = 0.55, skip_box_threshold: float = 0.0):
+        """
+        Fuse RGB and Thermal detections with confidence-weighted box fusion.
+
+        :param iou_threshold: Minimum IoU for two boxes to be treated as the same object.
+        :param skip_box_threshold: Weighted confidence below which boxes are dropped before fusion.
+        """
+        self.iou_threshold = iou_threshold
+        self.skip_box_threshold = skip_box_threshold
+
+    def modality_weights(self, environmental_params: Optional[Dict[str, Any]] = None) -> Tuple[float, float]:
+        """
+        Resolve the (RGB, Thermal) weights for the current conditions.
+
+        `rgb_weight` and `thermal_weight` in `environmental_params` take precedence over the
+        defaults for its `environment` entry (e.g. "morning", "night").
+
+        :param environmental_params: Environmental parameters, such as {"environment": "morning"}.
+        :return: The RGB and Thermal modality weights.
+        """
+        environmental_params = environmental_params or {}
+        rgb_weight, thermal_weight = ENVIRONMENT_MODALITY_WEIGHTS.get(
+            str(environmental_params.get("environment", "")).lower(), DEFAULT_MODALITY_WEIGHTS
+        )
+        rgb_weight = float(environmental_params.get("rgb_weight", rgb_weight))
+        thermal_weight = float(environmental_params.get("thermal_weight", thermal_weight))
+        return rgb_weight, thermal_weight
+
+    def fuse_detections(self, rgb_detections: Sequence[Sequence[float]], thermal_detections: Sequence[Sequence[float]],
+                        environmental_params: Optional[Dict[str, Any]] = None,
+                        return_scores: bool = False) -> List[List[float]]:
+        """
+        Merge overlapping RGB and Thermal detections of the same object into one box.
+
+        Boxes are scored by their confidence times the modality weight and clustered greedily around the
+        highest-scoring box, NMS-style, using IoU. Each cluster becomes one box whose coordinates are the
+        score-weighted mean of its members and whose score is the mean member score scaled by the fraction
+        of modalities that saw the object. Overlaps are found with a sweep over sorted box edges and every
+        step is vectorized, so there is no Python loop over boxes or pairs of boxes. The cost still grows
+        faster than linearly with dense detections, see `overlapping_pairs` and `greedy_cluster`.
+
+        :param rgb_detections: RGB boxes in xywhn format, optionally with a fifth confidence column.
+        :param thermal_detections: Thermal boxes in xywhn format, optionally with a fifth confidence column.
+        :param environmental_params: Environmental parameters used to weight the two modalities.
+        :param return_scores: Append the fused score to every returned box.
+        :return: The fused boxes in xywhn format, highest score first.
+        """
+        rgb_boxes, rgb_confidences = _as_detection_array(rgb_detections)
+        thermal_boxes, thermal_confidences = _as_detection_array(thermal_detections)
+        rgb_weight, thermal_weight = self.modality_weights(environmental_params)
+
+        boxes = xywh_to_xyxy(np.concatenate([rgb_boxes, thermal_boxes]))
+        scores = np.concatenate([rgb_confidences * rgb_weight, thermal_confidences * thermal_weight])
+        modalities = np.concatenate([np.zeros(len(rgb_boxes), dtype=np.intp), np.ones(len(thermal_boxes), dtype=np.intp)])
+
+        keep = scores >= self.skip_box_threshold
+        order = np.argsort(-scores[keep], kind="stable")
+        boxes, scores, modalities = boxes[keep][order], scores[keep][order], modalities[keep][order]
+
+        if not len(boxes):
+            return []
+
+        first, second = overlapping_pairs(boxes, self.iou_threshold)
+        leaders = greedy_cluster(len(boxes), first, second)
+        cluster_ids, clusters = np.unique(leaders, return_inverse=True)
+        num_clusters = len(cluster_ids)
+
+        score_sums = np.bincount(clusters, weights=scores, minlength=num_clusters)
+        sizes = np.bincount(clusters, minlength=num_clusters)
+        # Score-weighted mean of the member boxes; a plain mean for clusters whose scores are all zero.
+        safe_sums = np.where(score_sums > 0, score_sums, 1)
+        weights = np.where(score_sums[clusters] > 0, scores / safe_sums[clusters], 1 / sizes[clusters])
+        fused_boxes = np.stack(
+            [np.bincount(clusters, weights=boxes[:, column] * weights, minlength=num_clusters) for column in range(4)],
+            axis=1,
+        )
+        seen_by = (np.bincount(clusters * NUM_MODALITIES + modalities, minlength=num_clusters * NUM_MODALITIES)
+                   .reshape(num_clusters, NUM_MODALITIES) > 0).sum(axis=1)
+        fused_scores = score_sums / sizes * seen_by / NUM_MODALITIES
 
-    def fuse_detections(self, rgb_detections, thermal_detections, environmental_params):
-        # TODO: To be implemented.
-        pass
\ No newline at end of file
+        fused = xyxy_to_xywh(fused_boxes)
+        order = np.argsort(-fused_scores, kind="stable")
+        if return_scores:
+            return np.column_stack([fused[order], fused_scores[order]]).tolist()
+        return fused[order].tolist()
@@ -1,9 +1,30 @@
-import requests
+import logging
+import threading
+import time
 from datetime import datetime
 import json
+from typing import Any, Dict, Optional
+
+from .providers import IPInfoProvider, LocationProvider, get_location_provider
 
 class GPSLocator:
-    def __init__(self):
+    def __init__(self, provider: Optional[LocationProvider] = None, ttl: float = 300.0,
+                 refresh_interval: Optional[float] = None):
+        """
+        Location service that caches the last known fix.
+
+        Without a background refresher, `get_current_location` only queries the provider once the cached
+        fix is older than `ttl`. After `start()`, a background thread refreshes the fix every
+        `refresh_interval` seconds and `get_current_location` never blocks: it returns the last known fix.
+
+        :param provider: Where fixes come from. Defaults to IP-based lookup through ipinfo.io.
+        :param ttl: Seconds a fix is considered fresh.
+        :param refresh_interval: Seconds between background refreshes. Defaults to half the TTL.
+        """
+        self.provider = provider or IPInfoProvider()
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval if refresh_interval is not None else ttl / 2
+
         self.lat = None
         self.long = None
         self.city = None
@@ -13,39 +34,98 @@ class GPSLocator:
         self.timezone = None
         self.timestamp = None
 
-    def get_location_info(self):
+        self._location: Optional[Dict[str, Any]] = None
+        self._fetched_at = float('-inf')
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+
+    def get_location_info(self) -> Optional[Dict[str, Any]]:
+        """
+        Query the provider for a new fix and cache it. Blocks for at most the provider's timeout.
+
+        :return: The new location, or None if no fix could be obtained.
+        """
         try:
-            response = requests.get('https://ipinfo.io')
-            data = response.json()
-            
-            loc = data['loc'].split(',')
-            self.lat, self.long = float(loc[0]), float(loc[1])
-            self.city = data.get('city', 'Unknown')
-            self.state = data.get('region', 'Unknown')
-            self.country = data.get('country', 'Unknown')
-            self.ip = data.get('ip', 'Unknown')
-            self.timezone = data.get('timezone', 'Unknown')
-            self.timestamp = datetime.now().isoformat()
-
-            return {
-                'latitude': self.lat,
-                'longitude': self.long,
-                'city': self.city,
-                'state': self.state,
-                'country': self.country,
-                'ip': self.ip,
-                'timezone': self.timezone,
-                'timestamp': self.timestamp
-            }
-        except:
-            print("Internet Not available or error in fetching location data")
+            location_info = self.provider.get_fix()
+        except Exception as e:
+            logging.warning(f"Internet Not available or error in fetching location data: {e}")
+            return None
+        if not location_info:
             return None
 
-    def get_current_location(self):
-        location_info = self.get_location_info()
-        if location_info:
-            print(f"Location Info:")
-            print(json.dumps(location_info, indent=2))
-            return location_info
-        else:
-            return None
\ No newline at end of file
+        with self._lock:
+            self._location = location_info
+            self._fetched_at = time.monotonic()
+            self.lat = location_info.get('latitude')
+            self.long = location_info.get('longitude')
+            self.city = location_info.get('city', 'Unknown')
+            self.state = location_info.get('state', 'Unknown')
+            self.country = location_info.get('country', 'Unknown')
+            self.ip = location_info.get('ip', 'Unknown')
+            self.timezone = location_info.get('timezone', 'Unknown')
+            self.timestamp = location_info.get('timestamp', datetime.now().isoformat())
+        logging.debug(f"Location Info: {json.dumps(location_info)}")
+        return location_info
+
+    @property
+    def is_fresh(self) -> bool:
+        """Whether the cached fix is younger than the TTL."""
+        return time.monotonic() - self._fetched_at < self.ttl
+
+    def get_current_location(self) -> Optional[Dict[str, Any]]:
+        """
+        Return the last known location.
+
+        While the background refresher runs this is a plain cache read. Otherwise an expired fix is
+        refreshed synchronously first; if that fails, the stale fix is returned.
+
+        :return: The location, or None if no fix has ever been obtained.
+        """
+        if self._refresher is None and not self.is_fresh:
+            self.get_location_info()
+        with self._lock:
+            return dict(self._location) if self._location else None
+
+    def start(self) -> "GPSLocator":
+        """
+        Start refreshing the fix on a background thread, beginning immediately.
+        """
+        if self._refresher is None:
+            self._stop_event.clear()
+            self._refresher = threading.Thread(target=self._refresh_loop, name="gps-refresher", daemon=True)
+            self._refresher.start()
+        return self
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """
+        Stop the background refresher and release the provider.
+
+        :param timeout: Maximum seconds to wait for a refresh in progress. A refresher still stuck in its
+            provider after that is abandoned; it is a daemon thread and does not keep the process alive.
+        """
+        if self._refresher is not None:
+            self._stop_event.set()
+            self._refresher.join(timeout)
+            if self._refresher.is_alive():
+                logging.warning(f"GPS refresher did not stop within {timeout} s, abandoning it")
+                self._refresher = None
+                return
+            self._refresher = None
+        self.provider.close()
+
+    def _refresh_loop(self) -> None:
+        while not self._stop_event.is_set():
+            self.get_location_info()
+            # Retry sooner while there is no fix yet, so the first fix lands quickly
+            self._stop_event.wait(self.refresh_interval if self._location else min(self.refresh_interval, 10.0))
+
+
+def get_gps_locator(config) -> GPSLocator:
+    """Factory function to create and return a GPSLocator configured by the `gps` section of the configuration."""
+    gps_config = config.get('gps') or {}
+    return GPSLocator(
+        provider=get_location_provider(config),
+        ttl=gps_config.get('ttl', 300.0),
+        refresh_interval=gps_config.get('refresh_interval'),
+    )
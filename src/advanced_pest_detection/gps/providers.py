@@ -0,0 +1,241 @@
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+
+class LocationProvider:
+    """
+    Source of location fixes for GPSLocator.
+
+    Subclasses return a location dictionary with at least 'latitude', 'longitude' and 'timestamp',
+    or None when no fix is available. `get_fix` may block, but must do so for a bounded time.
+    """
+
+    name = "base"
+
+    def get_fix(self) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class IPInfoProvider(LocationProvider):
+    name = "ipinfo"
+
+    def __init__(self, url: str = 'https://ipinfo.io', timeout: float = 5.0, retries: int = 2):
+        """
+        Approximate location from the public IP address, using a pooled keep-alive HTTP session.
+
+        :param url: The ipinfo endpoint.
+        :param timeout: Connect and read timeout for each request, in seconds.
+        :param retries: Retries with exponential backoff on connection errors and 5xx responses.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get_fix(self) -> Optional[Dict[str, Any]]:
+        response = self.session.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+
+        loc = data['loc'].split(',')
+        return {
+            'latitude': float(loc[0]),
+            'longitude': float(loc[1]),
+            'city': data.get('city', 'Unknown'),
+            'state': data.get('region', 'Unknown'),
+            'country': data.get('country', 'Unknown'),
+            'ip': data.get('ip', 'Unknown'),
+            'timezone': data.get('timezone', 'Unknown'),
+            'timestamp': datetime.now().isoformat()
+        }
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def _nmea_checksum_ok(sentence: str) -> bool:
+    """Verify the XOR checksum of a '$...*hh' NMEA sentence. Sentences without a checksum are accepted."""
+    if '*' not in sentence:
+        return True
+    body, checksum = sentence[1:].split('*', 1)
+    calculated = 0
+    for char in body:
+        calculated ^= ord(char)
+    try:
+        return calculated == int(checksum[:2], 16)
+    except ValueError:
+        return False
+
+
+def _nmea_coordinate(value: str, hemisphere: str) -> float:
+    """Convert an NMEA (d)ddmm.mmmm value and its hemisphere to signed decimal degrees."""
+    degrees_length = value.index('.') - 2
+    degrees = float(value[:degrees_length]) + float(value[degrees_length:]) / 60
+    return -degrees if hemisphere in ('S', 'W') else degrees
+
+
+def parse_nmea_sentence(sentence: str) -> Optional[Tuple[float, float]]:
+    """
+    Extract (latitude, longitude) from a GGA or RMC sentence that carries a valid fix.
+
+    :param sentence: One NMEA sentence, e.g. "$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47".
+    :return: The position in decimal degrees, or None if the sentence is not a valid fix.
+    """
+    sentence = sentence.strip()
+    if not sentence.startswith('$') or not _nmea_checksum_ok(sentence):
+        return None
+    fields = sentence.split('*')[0].split(',')
+    kind = fields[0][3:]
+    try:
+        if kind == 'GGA' and len(fields) > 6 and fields[6] not in ('', '0'):
+            return _nmea_coordinate(fields[2], fields[3]), _nmea_coordinate(fields[4], fields[5])
+        if kind == 'RMC' and len(fields) > 6 and fields[2] == 'A':
+            return _nmea_coordinate(fields[3], fields[4]), _nmea_coordinate(fields[5], fields[6])
+    except ValueError:
+        return None
+    return None
+
+
+class NMEAProvider(LocationProvider):
+    name = "nmea"
+
+    def __init__(self, path: str, max_lines: int = 50, timeout: float = 2.0, baudrate: int = 0):
+        """
+        Read fixes from a GPS receiver's NMEA output, either a serial device (e.g. /dev/ttyUSB0) or a log file
+        that a GPS daemon appends to.
+
+        :param path: The serial device or NMEA log file.
+        :param max_lines: Maximum number of sentences read from a device per fix.
+        :param timeout: Maximum seconds spent waiting on a device per fix, so a silent receiver never blocks.
+        :param baudrate: Serial speed the device is set to in raw mode, such as 9600. 0 keeps its current settings.
+        """
+        self.path = path
+        self.max_lines = max_lines
+        self.timeout = timeout
+        self.baudrate = baudrate
+        self._fd: Optional[int] = None
+        self._partial = b''
+
+    def _open_device(self) -> int:
+        fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK | getattr(os, 'O_NOCTTY', 0))
+        if self.baudrate:
+            try:
+                import termios
+                import tty
+
+                tty.setraw(fd)
+                attributes = termios.tcgetattr(fd)
+                speed = getattr(termios, f"B{self.baudrate}")
+                attributes[4] = attributes[5] = speed
+                termios.tcsetattr(fd, termios.TCSANOW, attributes)
+            except Exception:
+                os.close(fd)
+                raise
+        return fd
+
+    def _read_device(self) -> Optional[Tuple[float, float]]:
+        import select
+
+        if self._fd is None:
+            self._fd = self._open_device()
+            self._partial = b''
+        deadline = time.monotonic() + self.timeout
+        lines_read = 0
+        while lines_read < self.max_lines:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if not readable:
+                break
+            try:
+                chunk = os.read(self._fd, 4096)
+            except BlockingIOError:
+                continue
+            if not chunk:
+                break
+            *lines, self._partial = (self._partial + chunk).split(b'\n')
+            # Guard against a stream that never sends a newline
+            self._partial = self._partial[-4096:]
+            for line in lines:
+                lines_read += 1
+                position = parse_nmea_sentence(line.decode('ascii', errors='ignore'))
+                if position is not None:
+                    return position
+        return None
+
+    def _read_log(self) -> Optional[Tuple[float, float]]:
+        # Only the tail of the log matters: read its last few kilobytes and use the most recent fix.
+        with open(self.path, 'rb') as log:
+            log.seek(0, os.SEEK_END)
+            log.seek(max(0, log.tell() - 8192))
+            lines = log.read().decode('ascii', errors='ignore').splitlines()
+        for line in reversed(lines):
+            position = parse_nmea_sentence(line)
+            if position is not None:
+                return position
+        return None
+
+    def get_fix(self) -> Optional[Dict[str, Any]]:
+        position = self._read_log() if os.path.isfile(self.path) else self._read_device()
+        if position is None:
+            return None
+        return {
+            'latitude': position[0],
+            'longitude': position[1],
+            'source': self.name,
+            'timestamp': datetime.now().isoformat()
+        }
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class StaticProvider(LocationProvider):
+    name = "static"
+
+    def __init__(self, latitude: float, longitude: float, **fields: Any):
+        """
+        Always report the same position. Useful for fixed installations and for running without a network.
+
+        :param latitude: Latitude in decimal degrees.
+        :param longitude: Longitude in decimal degrees.
+        :param fields: Extra fields to include in every fix, such as city or country.
+        """
+        self.latitude = latitude
+        self.longitude = longitude
+        self.fields = fields
+
+    def get_fix(self) -> Optional[Dict[str, Any]]:
+        fix = {'latitude': self.latitude, 'longitude': self.longitude}
+        fix.update(self.fields)
+        fix['timestamp'] = datetime.now().isoformat()
+        return fix
+
+
+def get_location_provider(config) -> LocationProvider:
+    """Factory function to create the location provider selected by the `gps` section of the configuration."""
+    gps_config = config.get('gps') or {}
+    provider = gps_config.get('provider', 'ipinfo')
+    if provider == 'ipinfo':
+        return IPInfoProvider(timeout=gps_config.get('timeout', 5.0))
+    if provider == 'nmea':
+        return NMEAProvider(gps_config['nmea_path'], timeout=gps_config.get('timeout', 2.0),
+                            baudrate=gps_config.get('nmea_baudrate', 0))
+    if provider == 'static':
+        return StaticProvider(gps_config['latitude'], gps_config['longitude'])
+    raise ValueError(f"Unknown location provider: {provider}")
@@ -0,0 +1,135 @@
+import logging
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .ingest import iter_image_paths
+
+
+class CameraSource:
+    """
+    A camera that CameraSupervisor runs in its own worker process.
+
+    `read` returns the next BGR frame, or None when no frame is available. Sources are created inside the
+    worker process from their keyword arguments, so `open` is where devices and heavy imports belong.
+    """
+
+    name = "base"
+
+    def open(self) -> None:
+        pass
+
+    def read(self) -> Optional[np.ndarray]:
+        raise NotImplementedError
+
+    def capture(self) -> Optional[Tuple[np.ndarray, float]]:
+        """Read a frame and the wall-clock time it was taken at, or None when no frame is available."""
+        image = self.read()
+        if image is None:
+            return None
+        return image, time.time()
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "CameraSource":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+class FileCamera(CameraSource):
+    name = "file"
+
+    def __init__(self, source: str, loop: bool = True, recursive: bool = False):
+        """
+        Fake camera that plays back the images of a directory, glob pattern or file, in name order.
+
+        Pointing the RGB and Thermal cameras of a pair at two directories of recorded captures replays a site
+        without any hardware.
+
+        :param source: A directory, a glob pattern or a path to one image.
+        :param loop: Start over after the last image instead of running dry.
+        :param recursive: Also play back the images of sub-directories when `source` is a directory.
+        """
+        self.source = source
+        self.loop = loop
+        self.recursive = recursive
+        self._paths: List[str] = []
+        self._index = 0
+
+    def open(self) -> None:
+        self._paths = sorted(iter_image_paths(self.source, recursive=self.recursive))
+        if not self._paths:
+            raise ValueError(f"No image files found in {self.source}")
+        self._index = 0
+
+    def read(self) -> Optional[np.ndarray]:
+        import cv2
+
+        if self._index >= len(self._paths):
+            if not self.loop:
+                return None
+            self._index = 0
+        path = self._paths[self._index]
+        self._index += 1
+        image = cv2.imread(path)
+        if image is None:
+            logging.error(f"Image at path {path} could not be loaded.")
+        return image
+
+
+class VideoCaptureCamera(CameraSource):
+    name = "video"
+
+    def __init__(self, device=0, width: int = 0, height: int = 0, fps: float = 0, backend: int = 0):
+        """
+        Camera read through OpenCV's VideoCapture: a device index, a video file or a stream URL.
+
+        :param device: Device index, or a path or URL such as an RTSP stream or a GStreamer pipeline.
+        :param width: Requested frame width in pixels. 0 keeps the device default.
+        :param height: Requested frame height in pixels. 0 keeps the device default.
+        :param fps: Requested frame rate. 0 keeps the device default.
+        :param backend: OpenCV capture API preference, such as cv2.CAP_V4L2. 0 lets OpenCV pick.
+        """
+        self.device = device
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.backend = backend
+        self._capture = None
+
+    def _configure(self, capture) -> None:
+        import cv2
+
+        if self.width:
+            capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        if self.height:
+            capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.fps:
+            capture.set(cv2.CAP_PROP_FPS, self.fps)
+        # Keep only the newest frame in the driver, so that a capture is never a stale buffered frame
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    def open(self) -> None:
+        import cv2
+
+        capture = cv2.VideoCapture(self.device, self.backend)
+        if not capture.isOpened():
+            raise IOError(f"Could not open camera {self.device}")
+        self._configure(capture)
+        self._capture = capture
+
+    def read(self) -> Optional[np.ndarray]:
+        if self._capture is None:
+            raise IOError(f"Camera {self.device} is not open")
+        ok, image = self._capture.read()
+        return image if ok else None
+
+    def close(self) -> None:
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
@@ -0,0 +1,184 @@
+import glob
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional, TypeVar
+
+from advanced_pest_detection.detection.frame import Frame
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+T = TypeVar("T")
+
+
+def is_image_file(path: str) -> bool:
+    """Check whether a path has one of the supported image extensions."""
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _scan_directory(directory: str, recursive: bool) -> Iterator[str]:
+    """Stream image paths from a directory with os.scandir, without building the full listing."""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    yield from _scan_directory(entry.path, recursive)
+            elif entry.is_file() and is_image_file(entry.name):
+                yield entry.path
+
+
+def iter_image_paths(source: str, recursive: bool = False) -> Iterator[str]:
+    """
+    Lazily yield the image files of a directory, a glob pattern or a single file.
+
+    Paths are yielded in filesystem order as they are found, so archives with tens of thousands of images
+    start processing immediately and the listing is never held in memory.
+
+    :param source: A directory, a glob pattern such as "archive/**/*.jpg", or a path to one image.
+    :param recursive: Descend into sub-directories when `source` is a directory.
+    :return: An iterator over image paths.
+    """
+    if os.path.isdir(source):
+        yield from _scan_directory(source, recursive)
+    elif glob.has_magic(source):
+        for path in glob.iglob(source, recursive=True):
+            if os.path.isfile(path) and is_image_file(path):
+                yield path
+    elif os.path.isfile(source):
+        yield source
+    else:
+        raise ValueError(f"No directory, file or glob pattern matches {source}")
+
+
+def watch_directory(directory: str, poll_interval: float = 1.0, settle_time: float = 1.0,
+                    include_existing: bool = True, stop_event: Optional[threading.Event] = None,
+                    recursive: bool = False) -> Iterator[str]:
+    """
+    Yield image files as they land in a directory, polling it every `poll_interval` seconds.
+
+    A file is only yielded once it has not been modified for `settle_time` seconds, so partially written
+    captures are not picked up. The names already yielded are remembered for the lifetime of the watch.
+
+    :param directory: The directory to watch.
+    :param poll_interval: Seconds between directory scans.
+    :param settle_time: Seconds a file must stay unmodified before it is yielded.
+    :param include_existing: Also yield the images already present when the watch starts.
+    :param stop_event: Optional event that ends the watch when set.
+    :param recursive: Also watch the sub-directories of `directory`.
+    :return: An iterator over new image paths.
+    """
+    seen = set()
+    if not include_existing:
+        seen.update(_scan_directory(directory, recursive))
+
+    while stop_event is None or not stop_event.is_set():
+        now = time.time()
+        for path in _scan_directory(directory, recursive):
+            if path in seen:
+                continue
+            try:
+                if now - os.path.getmtime(path) < settle_time:
+                    continue
+            except OSError:
+                continue  # Removed between the scan and the stat
+            seen.add(path)
+            yield path
+
+        if stop_event is not None:
+            stop_event.wait(poll_interval)
+        else:
+            time.sleep(poll_interval)
+
+
+def _decode(path: str, on_error: Optional[Callable[[str, Exception], None]] = None) -> Optional[Frame]:
+    frame = Frame(path=path)
+    try:
+        frame.image
+    except ValueError as e:
+        logging.error(f"Skipping {path}: {e}")
+        if on_error is not None:
+            on_error(path, e)
+        return None
+    return frame
+
+
+def prefetch_frames(paths: Iterable[str], workers: int = 4, prefetch: int = 8,
+                    on_error: Optional[Callable[[str, Exception], None]] = None) -> Iterator[Frame]:
+    """
+    Decode images on a pool of worker threads ahead of the consumer, yielding frames in input order.
+
+    A producer thread pulls paths and submits decodes, so a slow path source such as `watch_directory`
+    never holds back frames that are already decoded. At most `prefetch` frames are decoded or waiting
+    at any time, which bounds memory no matter how many paths the input yields. OpenCV releases the GIL
+    while decoding, so the workers decode in parallel. Images that cannot be decoded are logged and skipped.
+
+    :param paths: Image paths, typically from `iter_image_paths` or `watch_directory`.
+    :param workers: Number of decode threads.
+    :param prefetch: Maximum number of frames decoded ahead of the consumer.
+    :param on_error: Called from a decode thread with the path and the error of every skipped image.
+    :return: An iterator over decoded frames.
+    """
+    pending: queue.Queue = queue.Queue(maxsize=max(prefetch, 1))
+    stop = threading.Event()
+    end_of_input = object()
+
+    def produce(executor: ThreadPoolExecutor) -> None:
+        try:
+            for path in paths:
+                if stop.is_set():
+                    return
+                try:
+                    future = executor.submit(_decode, path, on_error)
+                except RuntimeError:
+                    # The consumer closed the iterator and the pool shut down between the check and the submit
+                    if stop.is_set():
+                        return
+                    raise
+                while not stop.is_set():
+                    try:
+                        pending.put(future, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        except Exception as e:
+            logging.error(f"Error listing images: {e}")
+        if not stop.is_set():
+            pending.put(end_of_input)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode") as executor:
+        producer = threading.Thread(target=produce, args=(executor,), name="ingest-producer", daemon=True)
+        producer.start()
+        try:
+            while True:
+                future = pending.get()
+                if future is end_of_input:
+                    break
+                frame = future.result()
+                if frame is not None:
+                    yield frame
+        finally:
+            stop.set()
+            # Unblock the producer if it is waiting on a full queue
+            while not pending.empty():
+                pending.get_nowait()
+
+
+def batched(items: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+    """
+    Group an iterable into lists of at most `batch_size` items.
+
+    :param items: The items to group.
+    :param batch_size: Maximum number of items per batch.
+    :return: An iterator over batches.
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be a positive integer, got {batch_size}")
+    items = iter(items)
+    batch = list(islice(items, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(items, batch_size))
@@ -0,0 +1,17 @@
+from .camera_source import VideoCaptureCamera
+
+
+class RGBCamera(VideoCaptureCamera):
+    name = "rgb"
+
+    def __init__(self, device=0, width: int = 0, height: int = 0, fps: float = 0, backend: int = 0):
+        """
+        Colour camera producing BGR frames, read through OpenCV's VideoCapture.
+
+        :param device: Device index, or a path or URL such as an RTSP stream or a GStreamer pipeline.
+        :param width: Requested frame width in pixels, such as 4000 for a 12 MP sensor. 0 keeps the device default.
+        :param height: Requested frame height in pixels. 0 keeps the device default.
+        :param fps: Requested frame rate. 0 keeps the device default.
+        :param backend: OpenCV capture API preference, such as cv2.CAP_V4L2. 0 lets OpenCV pick.
+        """
+        super().__init__(device, width=width, height=height, fps=fps, backend=backend)
@@ -0,0 +1,588 @@
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .camera_source import CameraSource, FileCamera, VideoCaptureCamera
+from .rgb_camera import RGBCamera
+from .thermal_camera import ThermalCamera
+from ..detection.frame import Frame
+from ..metrics import default_metrics
+
+CAMERA_TYPES = {
+    FileCamera.name: FileCamera,
+    VideoCaptureCamera.name: VideoCaptureCamera,
+    RGBCamera.name: RGBCamera,
+    ThermalCamera.name: ThermalCamera,
+}
+MODALITIES = ("rgb", "thermal")
+# Seconds a frame may take from being captured to reaching the supervisor
+FRAME_LATENCY = 0.1
+
+
+def create_camera(spec: Dict[str, Any]) -> CameraSource:
+    """
+    Create a camera source from its configuration.
+
+    :param spec: The camera `type` ("file", "video", "rgb" or "thermal") and the keyword arguments of its class.
+    :return: The camera, not opened yet.
+    """
+    spec = dict(spec)
+    camera_type = spec.pop("type", FileCamera.name)
+    if camera_type not in CAMERA_TYPES:
+        raise ValueError(f"Unknown camera type {camera_type!r}, expected one of {sorted(CAMERA_TYPES)}")
+    return CAMERA_TYPES[camera_type](**spec)
+
+
+class SharedFrameRing:
+    def __init__(self, memory: shared_memory.SharedMemory, slots: int, slot_bytes: int):
+        """
+        Fixed number of frame-sized slots in one shared memory block, written by a camera worker process
+        and read in place by the supervisor.
+
+        :param memory: The shared memory block, at least `slots * slot_bytes` bytes long.
+        :param slots: Number of frames the ring holds.
+        :param slot_bytes: Size of one slot in bytes.
+        """
+        self.memory = memory
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.outstanding = 0
+
+    @classmethod
+    def create(cls, slots: int, slot_bytes: int) -> "SharedFrameRing":
+        return cls(shared_memory.SharedMemory(create=True, size=slots * slot_bytes), slots, slot_bytes)
+
+    @classmethod
+    def attach(cls, name: str, slots: int, slot_bytes: int) -> "SharedFrameRing":
+        return cls(shared_memory.SharedMemory(name=name), slots, slot_bytes)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def _array(self, slot: int, shape: Tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+        if not 0 <= slot < self.slots:
+            raise IndexError(f"Slot {slot} out of range for a ring of {self.slots}")
+        return np.ndarray(shape, dtype=dtype, buffer=self.memory.buf, offset=slot * self.slot_bytes)
+
+    def write(self, slot: int, image: np.ndarray) -> None:
+        if image.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of {image.nbytes} bytes does not fit a {self.slot_bytes}-byte slot")
+        self._array(slot, image.shape, image.dtype)[...] = image
+
+    def view(self, slot: int, shape: Tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+        """The frame in `slot`, in place and read-only."""
+        view = self._array(slot, shape, dtype)
+        view.flags.writeable = False
+        return view
+
+    def close(self, unlink: bool = False) -> None:
+        try:
+            self.memory.close()
+        except BufferError:
+            pass  # A frame still references the block; the mapping goes away with it
+        if unlink:
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class SharedFrame(Frame):
+    def __init__(self, image: np.ndarray, camera: str, timestamp: float, on_release: Callable[[], None]):
+        """
+        A capture that lives in a camera's shared memory ring. Releasing it hands its slot back to the camera.
+
+        :param image: Read-only view of the slot.
+        :param camera: Name of the camera, "<pair>/<modality>".
+        :param timestamp: Wall-clock time the frame was taken at.
+        :param on_release: Called once, when the frame is released.
+        """
+        super().__init__(image=image)
+        self.camera = camera
+        self.timestamp = timestamp
+        self._on_release: Optional[Callable[[], None]] = on_release
+
+    @property
+    def name(self) -> str:
+        """Identifies the capture in metadata, in place of a file path."""
+        return f"{self.camera}@{datetime.fromtimestamp(self.timestamp).isoformat()}"
+
+    def detach(self) -> None:
+        """Copy the pixels out of shared memory and release the slot, for consumers that outlive the capture."""
+        if self._image is not None and self._on_release is not None:
+            self._image = self._image.copy()
+            self._release_slot()
+
+    def _release_slot(self) -> None:
+        on_release, self._on_release = self._on_release, None
+        if on_release is not None:
+            on_release()
+
+    def release(self) -> None:
+        super().release()
+        self._release_slot()
+
+
+class PairedCapture:
+    def __init__(self, pair: str, rgb: SharedFrame, thermal: SharedFrame):
+        """An RGB and a Thermal frame of one camera pair, taken at the same time."""
+        self.pair = pair
+        self.rgb = rgb
+        self.thermal = thermal
+
+    @property
+    def timestamp(self) -> float:
+        return min(self.rgb.timestamp, self.thermal.timestamp)
+
+    @property
+    def skew(self) -> float:
+        return abs(self.rgb.timestamp - self.thermal.timestamp)
+
+    def release(self) -> None:
+        self.rgb.release()
+        self.thermal.release()
+
+    def __enter__(self) -> "PairedCapture":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.release()
+
+
+def _camera_worker(camera: str, generation: int, spec: Dict[str, Any], interval: float, slots: int,
+                   messages, free_slots, stop_event) -> None:
+    """
+    Body of a camera worker process: capture on the shared schedule, write each frame into a free slot of the
+    ring and tell the supervisor where it is. Captures are dropped when every slot is still in use.
+
+    The ring is sized for the first frame, and replaced by a larger one when a frame does not fit, such as
+    a replayed archive of mixed resolutions or a device that renegotiates a larger mode. Slot numbers are
+    shared by the old and new ring, so frames still held in the old one keep their slots until released.
+    """
+    # Ctrl-C reaches the whole process group; the supervisor decides when the workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ring = None
+
+    def send(kind: str, payload: Any = None) -> None:
+        messages.put((kind, camera, generation, payload))
+
+    try:
+        with create_camera(spec) as source:
+            while not stop_event.is_set():
+                if interval:
+                    # Every worker fires on the same wall-clock grid, so the cameras of a pair capture together
+                    if stop_event.wait(interval - time.time() % interval):
+                        break
+                    try:
+                        slot = free_slots.get_nowait()
+                    except queue.Empty:
+                        send("dropped")
+                        continue
+                else:
+                    try:
+                        slot = free_slots.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+
+                captured = source.capture()
+                if captured is None:
+                    free_slots.put(slot)
+                    if isinstance(source, FileCamera) and not source.loop:
+                        send("finished")
+                        return
+                    send("dropped")
+                    continue
+                image, timestamp = captured
+                if ring is None or image.nbytes > ring.slot_bytes:
+                    if ring is not None:
+                        # The supervisor unlinks the old ring once its last frame is released
+                        ring.close()
+                    ring = SharedFrameRing.create(slots, image.nbytes)
+                    send("ring", (ring.name, ring.slot_bytes))
+                ring.write(slot, image)
+                send("frame", (ring.name, slot, timestamp, image.shape, image.dtype.str))
+    except Exception as e:
+        send("error", f"{type(e).__name__}: {e}")
+    finally:
+        if ring is not None:
+            ring.close()
+        messages.close()
+        messages.join_thread()
+
+
+class _CameraWorker:
+    def __init__(self, camera: str):
+        self.camera = camera
+        self.process = None
+        self.free_slots = None
+        self.generation = 0
+        self.finished = False
+        self.restart_at: Optional[float] = None
+
+
+class CameraSupervisor:
+    def __init__(self, pairs: Dict[str, Dict[str, Dict[str, Any]]], interval: float = 60.0, slots: int = 8,
+                 max_skew: Optional[float] = None, queue_size: int = 4, restart_delay: float = 5.0,
+                 start_method: str = "spawn"):
+        """
+        Runs every camera of several RGB/Thermal camera pairs in its own worker process and fans their
+        frames in to one queue of time-matched captures.
+
+        Workers write frames into shared memory rings, so frames reach the supervisor without being pickled
+        or copied; a slot is handed back to its camera when the frame is released. Every frame is matched with
+        the frame of the other camera of its pair nearest to it in time, once no closer frame can still arrive.
+        A frame with no partner within `max_skew` seconds is dropped, as is the oldest capture waiting for
+        inference when the queue is full. Workers that die are restarted after `restart_delay` seconds.
+
+        :param pairs: Camera pair name -> {"rgb": camera spec, "thermal": camera spec}, see `create_camera`.
+        :param interval: Seconds between captures, on a wall-clock grid shared by every camera. 0 captures
+            continuously, as fast as the slots are released.
+        :param slots: Frames each camera may have in flight before it drops captures.
+        :param max_skew: Largest time difference, in seconds, between the two frames of a capture. Defaults to
+            half the interval, capped at one second. When capturing continuously, it defaults to half the longer
+            frame period of the two cameras of a pair, or one second until both periods are known.
+        :param queue_size: Captures that may wait for inference before the oldest is dropped.
+        :param restart_delay: Seconds before a dead camera worker is restarted.
+        :param start_method: multiprocessing start method of the workers.
+        """
+        for pair, cameras in pairs.items():
+            missing = [modality for modality in MODALITIES if modality not in cameras]
+            if missing:
+                raise ValueError(f"Camera pair {pair!r} has no {' or '.join(missing)} camera")
+        self.pairs = pairs
+        self.interval = interval
+        self.slots = slots
+        self.max_skew = max_skew
+        self.restart_delay = restart_delay
+        self._context = multiprocessing.get_context(start_method)
+        self._captures: queue.Queue = queue.Queue(maxsize=max(queue_size, 1))
+        self._workers: Dict[str, _CameraWorker] = {}
+        self._rings: Dict[str, SharedFrameRing] = {}
+        self._current_rings: Dict[Tuple[str, int], str] = {}
+        # Frames waiting for a partner, oldest first, per pair and modality
+        self._pending: Dict[str, Dict[str, List[SharedFrame]]] = {
+            pair: {modality: [] for modality in MODALITIES} for pair in pairs}
+        self._last_timestamps: Dict[str, float] = {}
+        self._periods: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._messages = None
+        self._stop_event = None
+        self._collector: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self._frames = default_metrics.counter("camera_frames_total", "Frames received from each camera")
+        self._camera_drops = default_metrics.counter(
+            "camera_frames_dropped_total", "Camera frames dropped because no slot was free or they found no partner")
+        self._restarts = default_metrics.counter("camera_restarts_total", "Camera worker processes restarted")
+        self._captured = default_metrics.counter("frames_captured_total", "Captures taken")
+        self._dropped = default_metrics.counter(
+            "frames_dropped_total", "Captures dropped because inference fell behind")
+        default_metrics.gauge("queue_depth", "Items waiting between pipeline stages, by queue").set_function(
+            self._captures.qsize, queue="cameras")
+
+    @property
+    def cameras(self) -> List[str]:
+        return [f"{pair}/{modality}" for pair in self.pairs for modality in MODALITIES]
+
+    def start(self) -> "CameraSupervisor":
+        """Start a worker process per camera and the thread collecting their frames."""
+        if self._collector is not None:
+            return self
+        self._stopping = False
+        self._messages = self._context.Queue()
+        self._stop_event = self._context.Event()
+        for camera in self.cameras:
+            self._workers[camera] = _CameraWorker(camera)
+            self._spawn(self._workers[camera])
+        self._collector = threading.Thread(target=self._collect, name="camera-supervisor", daemon=True)
+        self._collector.start()
+        logging.info(f"Camera supervisor started {len(self._workers)} cameras in {len(self.pairs)} pairs")
+        return self
+
+    def _spawn(self, worker: _CameraWorker) -> None:
+        pair, modality = worker.camera.split("/")
+        worker.generation += 1
+        worker.free_slots = self._context.Queue()
+        for slot in range(self.slots):
+            worker.free_slots.put(slot)
+        worker.process = self._context.Process(
+            target=_camera_worker, name=f"camera-{worker.camera}", daemon=True,
+            args=(worker.camera, worker.generation, self.pairs[pair][modality], self.interval, self.slots,
+                  self._messages, worker.free_slots, self._stop_event),
+        )
+        worker.process.start()
+        worker.restart_at = None
+
+    def _collect(self) -> None:
+        while True:
+            # Wake up sooner while frames wait for a partner, so that they are paired once no closer one can arrive
+            try:
+                kind, camera, generation, payload = self._messages.get(timeout=0.05 if self._waiting() else 0.25)
+            except queue.Empty:
+                if self._stopping:
+                    return
+            except (EOFError, OSError):
+                return
+            else:
+                try:
+                    self._handle(kind, camera, generation, payload)
+                except Exception as e:
+                    logging.error(f"Error handling a frame from camera {camera}: {e}")
+            if not self._stopping:
+                now = time.time()
+                for pair in self._pending:
+                    self._match(pair, now)
+                self._supervise()
+
+    def _handle(self, kind: str, camera: str, generation: int, payload: Any) -> None:
+        worker = self._workers[camera]
+        if kind == "ring":
+            name, slot_bytes = payload
+            with self._lock:
+                self._rings[name] = SharedFrameRing.attach(name, self.slots, slot_bytes)
+                previous = self._current_rings.get((camera, generation))
+                self._current_rings[(camera, generation)] = name
+                if previous in self._rings and self._rings[previous].outstanding <= 0:
+                    self._close_ring(previous)
+        elif kind == "frame":
+            ring_name, slot, timestamp, shape, dtype = payload
+            with self._lock:
+                ring = self._rings.get(ring_name)
+                if ring is None:
+                    return
+                ring.outstanding += 1
+            frame = SharedFrame(ring.view(slot, shape, np.dtype(dtype)), camera, timestamp,
+                                lambda: self._release(camera, generation, ring_name, slot))
+            self._frames.inc(camera=camera)
+            self._pair(frame)
+        elif kind == "dropped":
+            self._camera_drops.inc(camera=camera)
+        elif kind == "finished":
+            worker.finished = True
+            logging.info(f"Camera {camera} has no more frames")
+        elif kind == "error":
+            logging.error(f"Camera {camera}: {payload}")
+
+    def _pair(self, frame: SharedFrame) -> None:
+        """Queue a frame until it can be matched with the nearest frame of the other camera of its pair."""
+        last = self._last_timestamps.get(frame.camera)
+        if last is not None and frame.timestamp > last:
+            period = frame.timestamp - last
+            previous = self._periods.get(frame.camera)
+            self._periods[frame.camera] = period if previous is None else previous + 0.2 * (period - previous)
+        self._last_timestamps[frame.camera] = frame.timestamp
+
+        pair, modality = frame.camera.split("/")
+        self._pending[pair][modality].append(frame)
+        self._match(pair, time.time())
+
+    def _skew(self, pair: str) -> float:
+        """Largest time difference between the two frames of a capture of `pair`."""
+        if self.max_skew is not None:
+            return self.max_skew
+        if self.interval:
+            return min(self.interval / 2, 1.0)
+        periods = [self._periods.get(f"{pair}/{modality}") for modality in MODALITIES]
+        if None in periods:
+            return 1.0
+        return max(periods) / 2
+
+    def _match(self, pair: str, now: float) -> None:
+        """
+        Pair up the waiting frames of `pair`. Each camera delivers its frames in capture order, so the oldest
+        waiting frame can only be matched with the oldest waiting frame of the other camera, and only if the
+        next frame of its own camera is not closer to that partner. When that next frame has not arrived yet,
+        the pairing waits until it could no longer be closer.
+
+        :param now: Current wall-clock time, which frame timestamps are taken on.
+        """
+        pending = self._pending[pair]
+        skew = self._skew(pair)
+        while True:
+            rgb, thermal = pending["rgb"], pending["thermal"]
+            if not rgb or not thermal:
+                waiting = rgb or thermal
+                # Any partner still to arrive would be more than `skew` apart
+                if waiting and now > waiting[0].timestamp + skew + FRAME_LATENCY:
+                    self._drop(waiting.pop(0))
+                    continue
+                return
+
+            first, second = (rgb, thermal) if rgb[0].timestamp <= thermal[0].timestamp else (thermal, rgb)
+            gap = second[0].timestamp - first[0].timestamp
+            if gap > skew:
+                # Every other frame of the other camera is later still
+                self._drop(first.pop(0))
+            elif len(first) > 1:
+                if abs(first[1].timestamp - second[0].timestamp) < gap:
+                    self._drop(first.pop(0))  # Its successor is the better match
+                else:
+                    self._enqueue(PairedCapture(pair, rgb.pop(0), thermal.pop(0)))
+            elif now >= second[0].timestamp + gap + FRAME_LATENCY:
+                self._enqueue(PairedCapture(pair, rgb.pop(0), thermal.pop(0)))
+            else:
+                return
+
+    def _drop(self, frame: SharedFrame) -> None:
+        """Release a frame that found no partner."""
+        frame.release()
+        self._camera_drops.inc(camera=frame.camera)
+
+    def _enqueue(self, capture: PairedCapture) -> None:
+        """Queue a capture without waiting, dropping the oldest waiting capture if the queue is full."""
+        self._captured.inc()
+        while True:
+            try:
+                self._captures.put_nowait(capture)
+                return
+            except queue.Full:
+                pass
+            try:
+                self._captures.get_nowait().release()
+                self._dropped.inc()
+                logging.warning("Inference is falling behind the cameras, dropped a capture")
+            except queue.Empty:
+                pass
+
+    def _release(self, camera: str, generation: int, ring_name: str, slot: int) -> None:
+        with self._lock:
+            ring = self._rings.get(ring_name)
+            if ring is None:
+                return
+            ring.outstanding -= 1
+            worker = self._workers[camera]
+            live = generation == worker.generation and worker.process.is_alive()
+            if live:
+                worker.free_slots.put(slot)
+            if ring.outstanding <= 0 and not (live and self._current_rings.get((camera, generation)) == ring_name):
+                # The ring was replaced, or its worker is gone, and no frame references it anymore
+                self._close_ring(ring_name)
+
+    def _close_ring(self, name: str) -> None:
+        """Unmap and unlink a ring that no worker writes to anymore. Called with the lock held."""
+        self._rings.pop(name).close(unlink=True)
+        for key in [key for key, current in self._current_rings.items() if current == name]:
+            del self._current_rings[key]
+
+    def _supervise(self) -> None:
+        """Restart dead camera workers after `restart_delay`."""
+        now = time.monotonic()
+        for worker in self._workers.values():
+            if worker.finished or worker.process.is_alive():
+                continue
+            if worker.restart_at is None:
+                logging.warning(f"Camera worker {worker.camera} exited with code {worker.process.exitcode}, "
+                                f"restarting in {self.restart_delay:g}s")
+                worker.restart_at = now + self.restart_delay
+                with self._lock:
+                    name = self._current_rings.get((worker.camera, worker.generation))
+                    if name in self._rings and self._rings[name].outstanding <= 0:
+                        self._close_ring(name)
+            elif now >= worker.restart_at:
+                self._restarts.inc(camera=worker.camera)
+                self._spawn(worker)
+
+    @property
+    def finished(self) -> bool:
+        """Whether every camera ran out of frames and every capture was handed out."""
+        return bool(self._workers) and all(worker.finished for worker in self._workers.values()) \
+            and not self._waiting() and self._captures.empty()
+
+    def _waiting(self) -> bool:
+        """Whether any frame is still waiting for its partner."""
+        return any(frames for pending in self._pending.values() for frames in pending.values())
+
+    def get(self, timeout: Optional[float] = None) -> Optional[PairedCapture]:
+        """The oldest waiting capture, or None if none arrives within `timeout` seconds."""
+        try:
+            return self._captures.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def batches(self, batch_size: int) -> Iterator[List[PairedCapture]]:
+        """
+        Yield the captures of every camera pair in batches of up to `batch_size`, without waiting for a batch
+        to fill up: each batch holds the captures waiting when the first one arrived. Runs until `stop` is
+        called or every camera has run out of frames.
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be a positive integer, got {batch_size}")
+        while not self._stopping and not self.finished:
+            capture = self.get(timeout=0.25)
+            if capture is None:
+                continue
+            batch = [capture]
+            while len(batch) < batch_size:
+                capture = self.get(timeout=0)
+                if capture is None:
+                    break
+                batch.append(capture)
+            yield batch
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the camera workers, release every waiting frame and free the shared memory."""
+        if self._collector is None:
+            return
+        self._stopping = True
+        self._stop_event.set()
+        deadline = time.monotonic() + timeout
+        for worker in self._workers.values():
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+        self._collector.join()
+        self._collector = None
+
+        while True:
+            capture = self.get(timeout=0)
+            if capture is None:
+                break
+            capture.release()
+        for pending in self._pending.values():
+            for frames in pending.values():
+                for frame in frames:
+                    frame.release()
+                frames.clear()
+        with self._lock:
+            for ring in self._rings.values():
+                ring.close(unlink=True)
+            self._rings.clear()
+            self._current_rings.clear()
+        self._messages.close()
+        logging.info("Camera supervisor stopped")
+
+    def __enter__(self) -> "CameraSupervisor":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+
+def get_camera_supervisor(config, queue_size: int = 4) -> Optional[CameraSupervisor]:
+    """Factory function to create the supervisor of the camera pairs listed in the `cameras` section, if any."""
+    from omegaconf import OmegaConf
+
+    cameras_config = config.get("cameras") or {}
+    pairs = cameras_config.get("pairs") or []
+    if not pairs:
+        return None
+    pairs = OmegaConf.to_container(pairs) if OmegaConf.is_config(pairs) else pairs
+    return CameraSupervisor(
+        {pair["name"]: {modality: pair[modality] for modality in MODALITIES if modality in pair} for pair in pairs},
+        interval=cameras_config.get("interval", config.image_capture.interval),
+        slots=cameras_config.get("slots", 8),
+        max_skew=cameras_config.get("max_skew"),
+        queue_size=queue_size,
+        restart_delay=cameras_config.get("restart_delay", 5.0),
+        start_method=cameras_config.get("start_method", "spawn"),
+    )
@@ -0,0 +1,75 @@
+from typing import Optional
+
+import numpy as np
+
+from .camera_source import VideoCaptureCamera
+
+
+def to_display_range(image: np.ndarray, low: Optional[float] = None, high: Optional[float] = None,
+                     percentile: float = 1.0) -> np.ndarray:
+    """
+    Map a radiometric thermal frame to an 8-bit BGR image the detection models accept.
+
+    :param image: A single-channel frame of raw sensor counts, such as a 16-bit Y16 frame.
+    :param low: Raw value mapped to black. Defaults to the `percentile` lowest value of the frame.
+    :param high: Raw value mapped to white. Defaults to the `percentile` highest value of the frame.
+    :param percentile: Percentile of outliers clipped at both ends when `low` or `high` is automatic.
+    :return: An 8-bit, three-channel image.
+    """
+    import cv2
+
+    if image.ndim == 3:
+        image = image[..., 0]
+    if low is None or high is None:
+        auto_low, auto_high = np.percentile(image, (percentile, 100 - percentile))
+        low = auto_low if low is None else low
+        high = auto_high if high is None else high
+    scale = 255.0 / max(high - low, 1e-6)
+    gray = np.clip((image.astype(np.float32) - low) * scale, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+class ThermalCamera(VideoCaptureCamera):
+    name = "thermal"
+
+    def __init__(self, device=0, width: int = 0, height: int = 0, fps: float = 0, backend: int = 0,
+                 raw: bool = False, low: Optional[float] = None, high: Optional[float] = None):
+        """
+        Thermal camera read through OpenCV's VideoCapture, such as a UVC radiometric core.
+
+        :param device: Device index, or a path or URL such as an RTSP stream or a GStreamer pipeline.
+        :param width: Requested frame width in pixels. 0 keeps the device default.
+        :param height: Requested frame height in pixels. 0 keeps the device default.
+        :param fps: Requested frame rate. 0 keeps the device default.
+        :param backend: OpenCV capture API preference, such as cv2.CAP_V4L2. 0 lets OpenCV pick.
+        :param raw: Read 16-bit Y16 frames and map them to 8 bits here, instead of the camera's own colour mapping.
+        :param low: raw: sensor value mapped to black. Defaults to a per-frame percentile.
+        :param high: raw: sensor value mapped to white. Defaults to a per-frame percentile.
+        """
+        super().__init__(device, width=width, height=height, fps=fps, backend=backend)
+        self.raw = raw
+        self.low = low
+        self.high = high
+
+    def _configure(self, capture) -> None:
+        import cv2
+
+        super()._configure(capture)
+        if self.raw:
+            capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"Y16 "))
+            capture.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+
+    def read(self) -> Optional[np.ndarray]:
+        image = super().read()
+        if image is None:
+            return None
+        if self.raw:
+            if image.dtype == np.uint8 and self.height and self.width and image.size == self.height * self.width * 2:
+                # Some drivers hand Y16 frames over as a flat byte buffer
+                image = image.view(np.uint16).reshape(self.height, self.width)
+            return to_display_range(image, self.low, self.high)
+        if image.ndim == 2:
+            import cv2
+
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        return image
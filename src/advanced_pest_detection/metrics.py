@@ -0,0 +1,308 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds, in seconds, of the stage duration histogram buckets
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelValues:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels: LabelValues) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        """A monotonically increasing count, optionally split by labels."""
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str):
+        """A value that goes up and down, such as a queue depth, optionally split by labels."""
+        super().__init__(name, help_text)
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        """Read the value from `function` whenever the gauge is exported, instead of storing it."""
+        with self._lock:
+            self._functions[_label_key(labels)] = function
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        samples = super().samples()
+        with self._lock:
+            functions = sorted(self._functions.items())
+        for labels, function in functions:
+            try:
+                samples.append((self.name, labels, float(function())))
+            except Exception:
+                continue
+        return samples
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """Distribution of observed values in cumulative buckets, optionally split by labels."""
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> Dict[LabelValues, Tuple[List[int], float, int]]:
+        with self._lock:
+            return {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+
+    def quantile(self, q: float, **labels: str) -> Optional[float]:
+        """
+        Estimate a quantile by linear interpolation inside the bucket that holds it,
+        the same way Prometheus' histogram_quantile does. Returns None before the first observation.
+        """
+        series = self.snapshot().get(_label_key(labels))
+        if series is None or not series[2]:
+            return None
+        counts, _, count = series
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        samples = []
+        for labels, (counts, total, count) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((f"{self.name}_bucket", labels + (("le", le),), cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self, namespace: str = "pest"):
+        """
+        Collection of the counters, gauges and histograms of one process.
+
+        Every stage of the detection loop is timed into the `<namespace>_stage_seconds` histogram through `timer`.
+        Recording a value takes a lock and a few arithmetic operations, so instrumentation is cheap enough to
+        stay on in the hot path.
+
+        :param namespace: Prefix of every metric name.
+        """
+        self.namespace = namespace
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self.stage_seconds = self.histogram("stage_seconds", "Duration of each detection loop stage in seconds")
+
+    def _get_or_create(self, cls, name: str, *args):
+        full_name = f"{self.namespace}_{name}"
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = self._metrics[full_name] = cls(full_name, *args)
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric {full_name} is already registered as a {metric.kind}")
+        return metric
+
+    def counter(self, name: str, help_text: str = "") -> Counter:
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, buckets)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """Time the body of a `with` block into the stage histogram, whether or not it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - start, stage=stage)
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for name, metric in metrics:
+            lines.append(f"# HELP {name} {metric.help_text}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for sample_name, labels, value in metric.samples():
+                lines.append(f"{sample_name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """One-line-per-stage human readable summary: call count, mean, p50 and p95 durations, then counters and gauges."""
+        lines = []
+        for labels, (_, total, count) in sorted(self.stage_seconds.snapshot().items()):
+            stage = dict(labels).get("stage", "")
+            p50 = self.stage_seconds.quantile(0.5, **dict(labels))
+            p95 = self.stage_seconds.quantile(0.95, **dict(labels))
+            lines.append(f"  {stage:<22} n={count:<7} mean={1000 * total / count:8.1f}ms "
+                         f"p50={1000 * p50:8.1f}ms p95={1000 * p95:8.1f}ms")
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        for name, metric in metrics:
+            if isinstance(metric, Counter):
+                for _, labels, value in metric.samples():
+                    lines.append(f"  {name}{_format_labels(labels)} = {value:g}")
+        return "\n".join(lines)
+
+
+class MetricsService:
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9108,
+                 summary_interval: float = 60.0):
+        """
+        Exports a MetricsRegistry: a Prometheus endpoint at http://host:port/metrics and a periodic summary log.
+
+        :param registry: The metrics to export.
+        :param host: Interface the endpoint listens on. The default only accepts local scrapers.
+        :param port: Port of the endpoint. 0 disables it.
+        :param summary_interval: Seconds between summary log entries. 0 disables them.
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.summary_interval = summary_interval
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._threads: List[threading.Thread] = []
+        self._stop_event = threading.Event()
+
+    def start(self) -> "MetricsService":
+        """
+        Start serving the endpoint and logging summaries on background threads. If the endpoint cannot be bound,
+        for example because the port is taken, the error is logged and only the summaries run.
+        """
+        if self._threads:
+            return self
+        self._stop_event.clear()
+        if self.port:
+            registry = self.registry
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self) -> None:
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = registry.render_prometheus().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args) -> None:
+                    logging.debug(f"Metrics endpoint: {format % args}")
+
+            try:
+                self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+            except OSError as e:
+                # Telemetry is optional: a taken port must not keep detection from starting
+                logging.error(f"Cannot serve metrics on {self.host}:{self.port}, continuing without the endpoint: {e}")
+            else:
+                self._server.daemon_threads = True
+                self._threads.append(threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True))
+                logging.info(f"Serving metrics at http://{self.host}:{self._server.server_address[1]}/metrics")
+        if self.summary_interval:
+            self._threads.append(threading.Thread(target=self._summary_loop, name="metrics-summary", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the endpoint and the summary log, logging one last summary."""
+        if not self._threads:
+            return
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.log_summary()
+
+    def log_summary(self) -> None:
+        summary = self.registry.summary()
+        if summary:
+            logging.info(f"Metrics summary:\n{summary}")
+
+    def _summary_loop(self) -> None:
+        while not self._stop_event.wait(self.summary_interval):
+            self.log_summary()
+
+
+default_metrics = MetricsRegistry()
+
+
+def get_metrics_service(config, registry: Optional[MetricsRegistry] = None) -> Optional[MetricsService]:
+    """Factory function to create the metrics exporter configured by the `metrics` section, if enabled."""
+    metrics_config = config.get("metrics") or {}
+    if not metrics_config.get("enabled", False):
+        return None
+    return MetricsService(
+        registry if registry is not None else default_metrics,
+        host=metrics_config.get("host", "127.0.0.1"),
+        port=metrics_config.get("port", 9108),
+        summary_interval=metrics_config.get("summary_interval", 60.0),
+    )
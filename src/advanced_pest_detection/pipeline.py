@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+from advanced_pest_detection.image_capture.icm import ImageCaptureModule
+from advanced_pest_detection.metrics import default_metrics
+
+
+class CapturePipeline:
+    def __init__(self, image_capture_module: ImageCaptureModule,
+                 inference_fn: Callable[[str, str], Any],
+                 persistence_fn: Callable[[Any], Any],
+                 inference_queue_size: int = 2,
+                 persistence_queue_size: int = 8):
+        """
+        Event-driven capture pipeline with separate capture, inference and persistence stages.
+
+        Captures fire on fixed deadlines (`capture_interval` apart, measured from the first capture) instead of
+        sleeping a fixed time after each loop iteration, so processing time never makes the schedule drift.
+        The stages are joined by bounded queues. When inference falls behind, the oldest waiting capture
+        is dropped so the next capture is never delayed; when persistence falls behind, inference waits.
+
+        :param image_capture_module: Source of (RGB, Thermal) captures and of the capture interval.
+        :param inference_fn: Called with the RGB and Thermal image paths of a capture; its return value is persisted.
+        :param persistence_fn: Called with every inference result.
+        :param inference_queue_size: Number of captures that may wait for inference before the oldest is dropped.
+        :param persistence_queue_size: Number of results that may wait for persistence before inference blocks.
+        """
+        self.image_capture_module = image_capture_module
+        self.inference_fn = inference_fn
+        self.persistence_fn = persistence_fn
+        self.inference_queue_size = inference_queue_size
+        self.persistence_queue_size = persistence_queue_size
+
+        self.captured_frames = 0
+        self.dropped_frames = 0
+        self.missed_deadlines = 0
+        self.processed_frames = 0
+        self._stop_event: Optional[asyncio.Event] = None
+
+        self._captured_counter = default_metrics.counter("frames_captured_total", "Captures taken")
+        self._dropped_counter = default_metrics.counter(
+            "frames_dropped_total", "Captures dropped because inference fell behind")
+        self._missed_counter = default_metrics.counter(
+            "missed_deadlines_total", "Capture deadlines skipped because a capture overran")
+        self._errors_counter = default_metrics.counter("stage_errors_total", "Failed pipeline stage runs, by stage")
+        self._queue_depth = default_metrics.gauge("queue_depth", "Items waiting between pipeline stages, by queue")
+        # Export the counters as 0 before their first event, so that rate() and alerts see them from the start
+        for counter in (self._captured_counter, self._dropped_counter, self._missed_counter):
+            counter.inc(0)
+
+    def stop(self) -> None:
+        """
+        Ask a running pipeline to finish: no new captures are taken and queued work is drained.
+        """
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    async def run(self, max_captures: Optional[int] = None) -> None:
+        """
+        Run the pipeline until `stop` is called or `max_captures` captures have been taken.
+
+        :param max_captures: Optional number of captures after which the pipeline drains and returns.
+        """
+        self._stop_event = asyncio.Event()
+        inference_queue: asyncio.Queue = asyncio.Queue(maxsize=self.inference_queue_size)
+        persistence_queue: asyncio.Queue = asyncio.Queue(maxsize=self.persistence_queue_size)
+        self._queue_depth.set_function(inference_queue.qsize, queue="inference")
+        self._queue_depth.set_function(persistence_queue.qsize, queue="persistence")
+
+        # One thread per stage: the models are not shared between threads, and persistence stays ordered.
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture") as capture_executor, \
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference") as inference_executor, \
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix="persistence") as persistence_executor:
+            inference_task = asyncio.ensure_future(
+                self._inference_stage(inference_queue, persistence_queue, inference_executor))
+            persistence_task = asyncio.ensure_future(self._persistence_stage(persistence_queue, persistence_executor))
+            try:
+                await self._capture_stage(inference_queue, capture_executor, max_captures)
+                await inference_queue.put(None)
+                await inference_task
+                await persistence_task
+            finally:
+                inference_task.cancel()
+                persistence_task.cancel()
+        logging.info(
+            f"Capture pipeline stopped: {self.captured_frames} captured, {self.processed_frames} processed, "
+            f"{self.dropped_frames} dropped, {self.missed_deadlines} missed deadlines"
+        )
+
+    async def _capture_stage(self, inference_queue: asyncio.Queue, executor: ThreadPoolExecutor,
+                             max_captures: Optional[int]) -> None:
+        loop = asyncio.get_event_loop()
+        interval = self.image_capture_module.capture_interval
+        deadline = loop.time()
+        while not self._stop_event.is_set():
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=max(0.0, deadline - loop.time()))
+                break
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                capture = await loop.run_in_executor(executor, self._timed_capture)
+            except Exception as e:
+                logging.error(f"Error capturing images: {e}")
+                self._errors_counter.inc(stage="capture")
+                capture = (None, None)
+
+            if capture[0] and capture[1]:
+                self.captured_frames += 1
+                self._captured_counter.inc()
+                self._enqueue_latest(inference_queue, capture)
+            if max_captures is not None and self.captured_frames >= max_captures:
+                break
+
+            # Advance to the next deadline on the original grid, skipping any ticks the capture overran.
+            deadline += interval
+            now = loop.time()
+            if now > deadline:
+                missed = math.ceil((now - deadline) / interval)
+                self.missed_deadlines += missed
+                self._missed_counter.inc(missed)
+                deadline += missed * interval
+
+    def _timed_capture(self) -> Tuple[str, str]:
+        with default_metrics.timer("capture"):
+            return self.image_capture_module.capture_images()
+
+    def _enqueue_latest(self, queue: asyncio.Queue, item: Tuple[str, str]) -> None:
+        """Queue a capture without waiting, dropping the oldest waiting capture if the queue is full."""
+        if queue.full():
+            queue.get_nowait()
+            queue.task_done()
+            self.dropped_frames += 1
+            self._dropped_counter.inc()
+            logging.warning(f"Inference is falling behind, dropped a capture ({self.dropped_frames} so far)")
+        queue.put_nowait(item)
+
+    async def _inference_stage(self, inference_queue: asyncio.Queue, persistence_queue: asyncio.Queue,
+                               executor: ThreadPoolExecutor) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            capture = await inference_queue.get()
+            inference_queue.task_done()
+            if capture is None:
+                await persistence_queue.put(None)
+                return
+            try:
+                result = await loop.run_in_executor(executor, self.inference_fn, *capture)
+            except Exception as e:
+                logging.error(f"Error during inference: {e}")
+                self._errors_counter.inc(stage="inference")
+                continue
+            await persistence_queue.put(result)
+
+    async def _persistence_stage(self, persistence_queue: asyncio.Queue, executor: ThreadPoolExecutor) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            result = await persistence_queue.get()
+            persistence_queue.task_done()
+            if result is None:
+                return
+            try:
+                await loop.run_in_executor(executor, self.persistence_fn, result)
+                self.processed_frames += 1
+            except Exception as e:
+                logging.error(f"Error persisting results: {e}")
+                self._errors_counter.inc(stage="persist")
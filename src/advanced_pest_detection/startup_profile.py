@@ -0,0 +1,88 @@
+import builtins
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+
+class StartupProfile:
+    def __init__(self, enabled: bool = False):
+        """
+        Records how long start-up takes: every first-time module import and named stages such as model loads.
+
+        Imports are timed by wrapping `builtins.__import__`, so only the outermost import of a chain is
+        recorded and its time includes everything it pulls in, like `python -X importtime` cumulative times.
+        Imports deferred into functions are recorded when they finally happen, on whichever thread runs them.
+        When disabled, `start` installs nothing and `stage` only runs its body.
+
+        :param enabled: Whether to record anything at all.
+        """
+        self.enabled = enabled
+        self.started_at = time.perf_counter()
+        self.imports: List[Tuple[str, float, str]] = []
+        self.stages: List[Tuple[str, float]] = []
+        self._original_import = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self) -> "StartupProfile":
+        """Begin timing imports."""
+        if self.enabled and self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._timed_import
+        return self
+
+    def stop(self) -> None:
+        """Stop timing imports."""
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or getattr(self._local, "depth", 0) or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        self._local.depth = 1
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            self._local.depth = 0
+            with self._lock:
+                self.imports.append((name, time.perf_counter() - start, threading.current_thread().name))
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the body of a `with` block as a named start-up stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: Optional[float]) -> None:
+        """Record a stage timed elsewhere. Stages that never ran (`seconds` is None) are skipped."""
+        if self.enabled and seconds is not None:
+            with self._lock:
+                self.stages.append((name, seconds))
+
+    def report(self, title: str = "Startup profile", top: int = 15) -> None:
+        """
+        Log the slowest imports and every recorded stage.
+
+        :param title: Heading of the report.
+        :param top: Number of imports listed, slowest first.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            imports = sorted(self.imports, key=lambda item: item[1], reverse=True)
+            stages = list(self.stages)
+        lines = [f"{title}: {time.perf_counter() - self.started_at:.3f}s since start"]
+        lines.append(f"  imports ({len(imports)} first-time, {sum(item[1] for item in imports):.3f}s total), slowest:")
+        lines.extend(f"    {seconds * 1000:9.1f} ms  {name}  [{thread}]" for name, seconds, thread in imports[:top])
+        lines.append("  stages:")
+        lines.extend(f"    {seconds * 1000:9.1f} ms  {name}" for name, seconds in stages)
+        logging.info("\n".join(lines))
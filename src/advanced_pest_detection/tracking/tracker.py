@@ -0,0 +1,254 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..fusion.fusion_module import box_iou, xywh_to_xyxy
+from ..metrics import default_metrics
+from ..utils import TIMESTAMP_FORMAT
+
+STATE_SIZE = 8
+MEASUREMENT_SIZE = 4
+
+
+class KalmanBoxFilter:
+    # Process and measurement noise standard deviations, relative to the box size
+    position_weight = 1.0 / 20
+    velocity_weight = 1.0 / 160
+
+    def __init__(self):
+        """
+        Constant-velocity Kalman filter over [x_center, y_center, width, height] boxes, as in SORT and ByteTrack.
+
+        The state is the box followed by its velocity, one step per capture. Every method works on the stacked
+        states of all tracks at once: means of shape (N, 8) and covariances of shape (N, 8, 8).
+        """
+        self.transition = np.eye(STATE_SIZE)
+        self.transition[:MEASUREMENT_SIZE, MEASUREMENT_SIZE:] = np.eye(MEASUREMENT_SIZE)
+        self.projection = np.eye(MEASUREMENT_SIZE, STATE_SIZE)
+
+    @staticmethod
+    def _box_scale(boxes: np.ndarray) -> np.ndarray:
+        # Width for the horizontal terms, height for the vertical ones
+        return np.column_stack([boxes[:, 2], boxes[:, 3], boxes[:, 2], boxes[:, 3]])
+
+    def initiate(self, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Start tracks at `boxes` of shape (N, 4), at rest."""
+        mean = np.concatenate([boxes, np.zeros_like(boxes)], axis=1)
+        scale = self._box_scale(boxes)
+        std = np.concatenate([2 * self.position_weight * scale, 10 * self.velocity_weight * scale], axis=1)
+        covariance = np.zeros((len(boxes), STATE_SIZE, STATE_SIZE))
+        covariance[:, np.arange(STATE_SIZE), np.arange(STATE_SIZE)] = std ** 2
+        return mean, covariance
+
+    def predict(self, mean: np.ndarray, covariance: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Advance every track by one capture."""
+        scale = self._box_scale(mean[:, :MEASUREMENT_SIZE])
+        std = np.concatenate([self.position_weight * scale, self.velocity_weight * scale], axis=1)
+        mean = mean @ self.transition.T
+        covariance = self.transition @ covariance @ self.transition.T
+        covariance[:, np.arange(STATE_SIZE), np.arange(STATE_SIZE)] += std ** 2
+        return mean, covariance
+
+    def update(self, mean: np.ndarray, covariance: np.ndarray, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Correct tracks with the boxes of shape (N, 4) they were matched to."""
+        std = self.position_weight * self._box_scale(mean[:, :MEASUREMENT_SIZE])
+        projected_covariance = self.projection @ covariance @ self.projection.T
+        projected_covariance[:, np.arange(MEASUREMENT_SIZE), np.arange(MEASUREMENT_SIZE)] += std ** 2
+        # Kalman gain K = P H^T S^-1, solved as S K^T = H P
+        gain = np.linalg.solve(projected_covariance, self.projection @ covariance).transpose(0, 2, 1)
+        innovation = boxes - mean[:, :MEASUREMENT_SIZE]
+        mean = mean + (gain @ innovation[:, :, None])[:, :, 0]
+        covariance = covariance - gain @ self.projection @ covariance
+        return mean, covariance
+
+
+def greedy_match(iou: np.ndarray, iou_threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Match rows to columns of an IoU matrix, best pairs first, each row and column at most once.
+
+    :param iou: Array of shape (tracks, detections).
+    :param iou_threshold: Minimum IoU of a match.
+    :return: The row and column index of every match.
+    """
+    rows, columns = np.nonzero(iou >= iou_threshold)
+    order = np.argsort(-iou[rows, columns], kind="stable")
+    row_used = np.zeros(iou.shape[0], dtype=bool)
+    column_used = np.zeros(iou.shape[1], dtype=bool)
+    matched_rows, matched_columns = [], []
+    for row, column in zip(rows[order], columns[order]):
+        if not row_used[row] and not column_used[column]:
+            row_used[row] = column_used[column] = True
+            matched_rows.append(row)
+            matched_columns.append(column)
+    return np.array(matched_rows, dtype=np.intp), np.array(matched_columns, dtype=np.intp)
+
+
+class PestTracker:
+    def __init__(self, iou_threshold: float = 0.3, low_iou_threshold: float = 0.3, high_score: float = 0.6,
+                 min_hits: int = 1, max_age: int = 5):
+        """
+        Multi-object tracker that follows fused detections from capture to capture, in the style of ByteTrack,
+        so that a pest sitting still is counted once instead of in every capture.
+
+        Every track carries a Kalman-filtered box. Each capture, the tracks are predicted forward and matched to
+        the detections by IoU in two rounds: first to the high-score detections (seen by both modalities), then
+        the tracks left over to the remaining low-score ones. Unmatched detections start new tracks. A track
+        that goes unmatched for more than `max_age` captures ends and is summarized.
+
+        :param iou_threshold: Minimum IoU to match a track to a high-score detection.
+        :param low_iou_threshold: Minimum IoU to match a track to a low-score detection.
+        :param high_score: Fused score from which a detection is matched in the first round.
+        :param min_hits: Matched captures after which a track is confirmed. Tracks that are lost before they are
+            confirmed are discarded as flicker; 1 confirms every track on its first detection.
+        :param max_age: Captures a confirmed track survives without a match.
+        """
+        self.iou_threshold = iou_threshold
+        self.low_iou_threshold = low_iou_threshold
+        self.high_score = high_score
+        self.min_hits = min_hits
+        self.max_age = max_age
+        self.kalman_filter = KalmanBoxFilter()
+
+        self._next_id = 1
+        self._ids = np.empty(0, dtype=np.int64)
+        self._mean = np.empty((0, STATE_SIZE))
+        self._covariance = np.empty((0, STATE_SIZE, STATE_SIZE))
+        self._box = np.empty((0, 4))
+        self._hits = np.empty(0, dtype=np.int64)
+        self._misses = np.empty(0, dtype=np.int64)
+        self._first_seen = np.empty(0)
+        self._last_seen = np.empty(0)
+        self._score_sum = np.empty(0)
+        self._max_score = np.empty(0)
+        self._finished: List[Dict[str, Any]] = []
+        self._tracks_counter = default_metrics.counter("tracks_total", "Confirmed pest tracks")
+        self._tracks_counter.inc(0)
+
+    def __len__(self) -> int:
+        """Number of live tracks, confirmed or not."""
+        return len(self._ids)
+
+    def update(self, detections: Sequence[Sequence[float]],
+               timestamp: Optional[datetime] = None) -> Tuple[List[int], List[int]]:
+        """
+        Advance the tracks by one capture.
+
+        :param detections: Fused boxes in xywhn format, optionally with a fifth score column. Boxes without a
+            score are treated as high-score.
+        :param timestamp: Time of the capture. Defaults to now.
+        :return: The track ID of every detection, in input order, and the IDs of the tracks confirmed by this capture.
+        """
+        timestamp = (timestamp or datetime.now()).timestamp()
+        detections = np.asarray(detections, dtype=np.float64)
+        if not len(detections):
+            detections = np.empty((0, 4))
+        boxes = detections[:, :4]
+        scores = detections[:, 4] if detections.shape[1] == 5 else np.ones(len(boxes))
+
+        if len(self):
+            self._mean, self._covariance = self.kalman_filter.predict(self._mean, self._covariance)
+        iou = box_iou(xywh_to_xyxy(self._mean[:, :4]), xywh_to_xyxy(boxes))
+
+        # First round on the high-score detections, second round between the leftovers and the low-score ones
+        track_of = np.full(len(boxes), -1, dtype=np.intp)
+        high = scores >= self.high_score
+        for detection_mask, iou_threshold in ((high, self.iou_threshold), (~high, self.low_iou_threshold)):
+            free_tracks = np.setdiff1d(np.arange(len(self)), track_of[track_of >= 0])
+            candidates = np.flatnonzero(detection_mask)
+            rows, columns = greedy_match(iou[np.ix_(free_tracks, candidates)], iou_threshold)
+            track_of[candidates[columns]] = free_tracks[rows]
+
+        matched = track_of >= 0
+        tracks = track_of[matched]
+        detection_ids = np.empty(len(boxes), dtype=np.int64)
+        detection_ids[matched] = self._ids[tracks]
+        if len(tracks):
+            self._mean[tracks], self._covariance[tracks] = self.kalman_filter.update(
+                self._mean[tracks], self._covariance[tracks], boxes[matched])
+        was_confirmed = self._hits >= self.min_hits
+        self._misses += 1
+        self._misses[tracks] = 0
+        self._hits[tracks] += 1
+        self._last_seen[tracks] = timestamp
+        self._score_sum[tracks] += scores[matched]
+        self._max_score[tracks] = np.maximum(self._max_score[tracks], scores[matched])
+        self._box[tracks] = self._mean[tracks, :4]
+        confirmed = self._hits >= self.min_hits
+        newly_confirmed = self._ids[confirmed & ~was_confirmed]
+        self._end_tracks(confirmed)
+
+        # Every unmatched detection starts a track
+        new_boxes, new_scores = boxes[~matched], scores[~matched]
+        new_ids = np.arange(self._next_id, self._next_id + len(new_boxes), dtype=np.int64)
+        self._next_id += len(new_boxes)
+        detection_ids[~matched] = new_ids
+        mean, covariance = self.kalman_filter.initiate(new_boxes)
+        self._ids = np.concatenate([self._ids, new_ids])
+        self._mean = np.concatenate([self._mean, mean])
+        self._covariance = np.concatenate([self._covariance, covariance])
+        self._box = np.concatenate([self._box, new_boxes])
+        self._hits = np.concatenate([self._hits, np.ones(len(new_boxes), dtype=np.int64)])
+        self._misses = np.concatenate([self._misses, np.zeros(len(new_boxes), dtype=np.int64)])
+        self._first_seen = np.concatenate([self._first_seen, np.full(len(new_boxes), timestamp)])
+        self._last_seen = np.concatenate([self._last_seen, np.full(len(new_boxes), timestamp)])
+        self._score_sum = np.concatenate([self._score_sum, new_scores])
+        self._max_score = np.concatenate([self._max_score, new_scores])
+        if self.min_hits <= 1:
+            newly_confirmed = np.concatenate([newly_confirmed, new_ids])
+        self._tracks_counter.inc(len(newly_confirmed))
+        logging.debug(f"Tracking {len(self)} pests, {len(newly_confirmed)} new")
+        return detection_ids.tolist(), newly_confirmed.tolist()
+
+    def _end_tracks(self, confirmed: np.ndarray) -> None:
+        """Summarize the confirmed tracks lost for more than `max_age` captures, and drop the unconfirmed lost ones."""
+        lost = np.where(confirmed, self._misses > self.max_age, self._misses > 0)
+        self._finished.extend(self._summary(index) for index in np.flatnonzero(lost & confirmed))
+        self._keep(~lost)
+
+    def _keep(self, mask: np.ndarray) -> None:
+        for name in ("_ids", "_mean", "_covariance", "_box", "_hits", "_misses", "_first_seen", "_last_seen",
+                     "_score_sum", "_max_score"):
+            setattr(self, name, getattr(self, name)[mask])
+
+    def _summary(self, index: int) -> Dict[str, Any]:
+        return {
+            "track_id": int(self._ids[index]),
+            "first_seen": datetime.fromtimestamp(self._first_seen[index]).strftime(TIMESTAMP_FORMAT),
+            "last_seen": datetime.fromtimestamp(self._last_seen[index]).strftime(TIMESTAMP_FORMAT),
+            "observations": int(self._hits[index]),
+            "box": [round(float(value), 6) for value in self._box[index]],
+            "mean_score": round(float(self._score_sum[index] / self._hits[index]), 4),
+            "max_score": round(float(self._max_score[index]), 4),
+        }
+
+    def pop_finished(self) -> List[Dict[str, Any]]:
+        """
+        Summaries of the confirmed tracks that ended since the last call: track_id, first_seen and last_seen
+        capture times, the number of captures the pest was observed in, its last filtered xywhn box, and its
+        mean and maximum fused score.
+        """
+        finished, self._finished = self._finished, []
+        return finished
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """End every live track, for example at shutdown, and return the summaries of all unreported tracks."""
+        confirmed = self._hits >= self.min_hits
+        self._finished.extend(self._summary(index) for index in np.flatnonzero(confirmed))
+        self._keep(np.zeros(len(self), dtype=bool))
+        return self.pop_finished()
+
+
+def get_tracker(config) -> Optional[PestTracker]:
+    """Factory function to create the tracker configured by the `tracking` section, if enabled."""
+    tracking_config = config.get("tracking") or {}
+    if not tracking_config.get("enabled", False):
+        return None
+    return PestTracker(
+        iou_threshold=tracking_config.get("iou_threshold", 0.3),
+        low_iou_threshold=tracking_config.get("low_iou_threshold", 0.3),
+        high_score=tracking_config.get("high_score", 0.6),
+        min_hits=tracking_config.get("min_hits", 1),
+        max_age=tracking_config.get("max_age", 5),
+    )
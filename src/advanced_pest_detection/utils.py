@@ -1,6 +1,6 @@
 
 import logging
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
 from datetime import datetime
 
@@ -8,41 +8,102 @@ import json
 import os
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
 
 def prepare_inference_results(rgb_coordinates: Dict[str, Any], thermal_coordinates: Dict[str, Any], 
-                              final_coordinates: Dict[str, Any], rgb_image_path: str, thermal_image_path: str) -> Dict[str, Any]:
-    """Prepare inference results dictionary."""
-    return {
-        'rgb_coordinates': rgb_coordinates,
-        'thermal_coordinates': thermal_coordinates,
+                              final_coordinates: Dict[str, Any], rgb_image_path: str, thermal_image_path: str,
+                              reused_previous: bool = False, track_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    Prepare inference results dictionary. `reused_previous` marks results copied from an earlier, unchanged capture;
+    `track_ids`, when tracking is enabled, holds the track of every final box. The confidence column of boxes detected
+    `with_confidence` is dropped, so the recorded coordinates stay in xywhn format.
+    """
+    results = {
+        'rgb_coordinates': [box[:4] for box in rgb_coordinates],
+        'thermal_coordinates': [box[:4] for box in thermal_coordinates],
         'final_coordinates': final_coordinates,
         'rgb_image_path': rgb_image_path,
-        'thermal_image_path': thermal_image_path
+        'thermal_image_path': thermal_image_path,
+        'reused_previous': reused_previous
     }
+    if track_ids is not None:
+        results['track_ids'] = track_ids
+    return results
 
-def save_inference_metadata(inference_results: dict, location_info: dict, save_dir: str, image_path: str) -> str:
+def build_inference_metadata(inference_results: dict, location_info: dict, image_path: str,
+                             timestamp: Optional[datetime] = None) -> Dict[str, Any]:
     """
-    Save the complete metadata of the inference as a JSON file.
+    Build the complete metadata record of an inference.
 
     :param inference_results: Dictionary containing inference results.
     :param location_info: Dictionary containing location information.
-    :param save_dir: Directory to save the JSON file.
     :param image_path: Path to the saved image with detections.
-    :return: Path to the saved JSON file.
+    :param timestamp: Time of the inference. Defaults to now.
+    :return: The metadata dictionary.
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    metadata = {
-        "timestamp": timestamp,
+    timestamp = timestamp or datetime.now()
+    return {
+        "timestamp": timestamp.strftime(TIMESTAMP_FORMAT),
         "location_info": location_info,
         "inference_results": inference_results,
         "detected_image_path": image_path
     }
 
-    json_filename = f"inference_metadata_{timestamp}.json"
+def build_track_metadata(track: Dict[str, Any], location_info: dict) -> Dict[str, Any]:
+    """
+    Build the metadata record of a finished pest track, which stands in for the per-capture records of its pest.
+
+    :param track: Track summary from `PestTracker`.
+    :param location_info: Dictionary containing location information.
+    :return: The metadata dictionary, timestamped with the last capture the pest was seen in.
+    """
+    return {
+        "timestamp": track["last_seen"],
+        "record_type": "track",
+        "location_info": location_info,
+        "track": track
+    }
+
+def build_capture_metadata(inference_results: dict, location_info: dict,
+                           timestamp: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Build the small metadata record that stands in for a capture whose full record is deduplicated by tracking,
+    so that a capture without new pests can still be told apart from a device that stopped capturing.
+
+    :param inference_results: Dictionary containing inference results.
+    :param location_info: Dictionary containing location information.
+    :param timestamp: Time of the capture. Defaults to now.
+    :return: The metadata dictionary, without coordinates or an image.
+    """
+    timestamp = timestamp or datetime.now()
+    return {
+        "timestamp": timestamp.strftime(TIMESTAMP_FORMAT),
+        "record_type": "capture",
+        "location_info": location_info,
+        "detections": len(inference_results["final_coordinates"]),
+        "track_ids": inference_results.get("track_ids", [])
+    }
+
+def save_inference_metadata(inference_results: dict, location_info: dict, save_dir: str, image_path: str) -> str:
+    """
+    Save the complete metadata of the inference as a JSON file.
+
+    :param inference_results: Dictionary containing inference results.
+    :param location_info: Dictionary containing location information.
+    :param save_dir: Directory to save the JSON file.
+    :param image_path: Path to the saved image with detections.
+    :return: Path to the saved JSON file.
+    """
+    now = datetime.now()
+    metadata = build_inference_metadata(inference_results, location_info, image_path, now)
+
+    # Microseconds keep inferences that land in the same second from overwriting each other
+    json_filename = f"inference_metadata_{now.strftime(TIMESTAMP_FORMAT)}_{now.microsecond:06d}.json"
     json_path = os.path.join(save_dir, json_filename)
 
     with open(json_path, 'w') as json_file:
         json.dump(metadata, json_file, indent=4)
 
-    print(f"Inference metadata saved to: {json_path}")
-    return json_path
\ No newline at end of file
+    logging.debug(f"Inference metadata saved to: {json_path}")
+    return json_path
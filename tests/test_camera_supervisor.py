@@ -0,0 +1,97 @@
+import glob
+import time
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from advanced_pest_detection.image_capture.supervisor import FRAME_LATENCY, CameraSupervisor, SharedFrame
+
+# Height and width of the recorded captures, by index: the third is far larger than the first ring
+SIZES = [(24, 32), (24, 32), (600, 800), (24, 32)]
+INTERVAL = 1.0
+
+
+def write_captures(directory, offset):
+    """Record one capture per entry of SIZES, each filled with `offset` plus its index."""
+    directory.mkdir()
+    for index, (height, width) in enumerate(SIZES):
+        image = np.full((height, width, 3), offset + index, dtype=np.uint8)
+        cv2.imwrite(str(directory / f"capture_{index:02d}.png"), image)
+    return str(directory)
+
+
+def shared_memory_blocks():
+    return set(glob.glob("/dev/shm/psm_*"))
+
+
+def test_file_cameras_are_paired_by_capture(tmp_path):
+    pairs = {"plot": {
+        "rgb": {"type": "file", "source": write_captures(tmp_path / "rgb", 10), "loop": False},
+        "thermal": {"type": "file", "source": write_captures(tmp_path / "thermal", 100), "loop": False},
+    }}
+    supervisor = CameraSupervisor(pairs, interval=INTERVAL, slots=2)
+
+    rings = []
+    handle = supervisor._handle
+
+    def record_rings(kind, camera, generation, payload):
+        if kind == "ring":
+            rings.append(camera)
+        handle(kind, camera, generation, payload)
+
+    supervisor._handle = record_rings
+
+    # Start just after a tick of the capture grid, so that both workers are up before the first capture
+    time.sleep(INTERVAL - time.time() % INTERVAL + 0.05)
+    blocks = shared_memory_blocks()
+    captured = []
+    with supervisor:
+        deadline = time.monotonic() + (len(SIZES) + 5) * INTERVAL
+        while not supervisor.finished and time.monotonic() < deadline:
+            capture = supervisor.get(timeout=0.25)
+            if capture is None:
+                continue
+            with capture:
+                assert capture.pair == "plot"
+                assert capture.skew <= supervisor._skew("plot")
+                rgb, thermal = capture.rgb.image, capture.thermal.image
+                assert np.all(rgb == rgb.flat[0]) and np.all(thermal == thermal.flat[0])
+                captured.append((int(rgb.flat[0]) - 10, rgb.shape, int(thermal.flat[0]) - 100, thermal.shape))
+        assert supervisor.finished, "the supervisor did not finish replaying the captures"
+
+    expected = [(index, (height, width, 3)) for index, (height, width) in enumerate(SIZES)]
+    assert [(rgb_index, rgb_shape) for rgb_index, rgb_shape, _, _ in captured] == expected
+    assert [(thermal_index, thermal_shape) for _, _, thermal_index, thermal_shape in captured] == expected
+    # Every camera replaced its first ring when the large capture did not fit
+    assert sorted(rings) == ["plot/rgb", "plot/rgb", "plot/thermal", "plot/thermal"]
+    assert shared_memory_blocks() - blocks == set()
+
+
+def test_frames_wait_for_their_nearest_partner():
+    supervisor = CameraSupervisor({"plot": {"rgb": {}, "thermal": {}}}, interval=0, max_skew=0.5)
+    paired = []
+    supervisor._enqueue = lambda capture: paired.append((capture.rgb.timestamp, capture.thermal.timestamp))
+
+    def receive(modality, timestamp):
+        supervisor._pending["plot"][modality].append(
+            SharedFrame(np.zeros(1), f"plot/{modality}", timestamp, lambda: None))
+        supervisor._match("plot", now=timestamp)
+
+    receive("rgb", 0.0)
+    receive("thermal", 0.3)
+    # A later RGB frame may still be closer to the thermal one
+    assert paired == []
+    receive("rgb", 0.35)
+    assert paired == []
+    # ... until it could no longer arrive
+    supervisor._match("plot", now=0.35 + 0.05 + FRAME_LATENCY)
+    assert paired == [(0.35, 0.3)]
+    assert supervisor._pending["plot"] == {"rgb": [], "thermal": []}
+
+    # Frames without a partner within the skew are dropped
+    receive("thermal", 2.0)
+    supervisor._match("plot", now=2.0 + 0.5 + FRAME_LATENCY + 0.01)
+    assert supervisor._pending["plot"] == {"rgb": [], "thermal": []}
+    assert paired == [(0.35, 0.3)]
@@ -0,0 +1,150 @@
+import io
+import sqlite3
+import tarfile
+import time
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from advanced_pest_detection.data_handling.cloud_storage import CloudStorage
+from advanced_pest_detection.data_handling.upload_queue import UploadQueue
+
+BUCKET = "pest-records"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    for name, value in [("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                        ("AWS_SESSION_TOKEN", "testing"), ("AWS_DEFAULT_REGION", "us-east-1")]:
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        yield boto3.client("s3", region_name="us-east-1")
+
+
+def make_storage(s3, tmp_path, **options):
+    options = {"bundle_max_size": 1024, "bundle_max_age": 0.0, "base_backoff": 0.2, "max_backoff": 1.0,
+               "poll_interval": 0.05, **options}
+    return CloudStorage(BUCKET, queue_path=str(tmp_path / "queue.sqlite3"), client=s3, **options)
+
+
+def write_file(path, size):
+    path.write_bytes(bytes(range(256)) * (size // 256) + b"x" * (size % 256))
+    return str(path)
+
+
+def wait_until_uploaded(storage, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while storage.pending() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert storage.pending() == 0, "uploads did not finish in time"
+
+
+def bucket_keys(s3):
+    return sorted(item["Key"] for item in s3.list_objects_v2(Bucket=BUCKET).get("Contents", []))
+
+
+def bundle_members(s3, key):
+    body = s3.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+    with tarfile.open(fileobj=io.BytesIO(body), mode="r:gz") as bundle:
+        return sorted(bundle.getnames())
+
+
+def test_queued_files_are_uploaded(s3, tmp_path):
+    s3.create_bucket(Bucket=BUCKET)
+    image = write_file(tmp_path / "capture.jpg", 4096)
+    metadata = [write_file(tmp_path / f"result_{index}.json", 100) for index in range(3)]
+
+    storage = make_storage(s3, tmp_path, prefix="site/")
+    try:
+        storage.upload_data(image, "images/capture.jpg")
+        for path in metadata:
+            storage.upload_data(path)
+        storage.start()
+        wait_until_uploaded(storage)
+    finally:
+        storage.close()
+
+    keys = bucket_keys(s3)
+    assert "site/images/capture.jpg" in keys
+    uploaded = s3.get_object(Bucket=BUCKET, Key="site/images/capture.jpg")["Body"].read()
+    assert uploaded == (tmp_path / "capture.jpg").read_bytes()
+    # The small files travel together in one bundle
+    bundles = [key for key in keys if key.startswith("site/bundles/")]
+    assert len(bundles) == 1
+    assert bundle_members(s3, bundles[0]) == [f"site/result_{index}.json" for index in range(3)]
+
+
+def test_failed_uploads_are_retried_with_backoff(s3, tmp_path):
+    image = write_file(tmp_path / "capture.jpg", 4096)
+    storage = make_storage(s3, tmp_path)
+    try:
+        # The bucket does not exist yet, so the first attempt fails
+        storage.upload_data(image, "capture.jpg")
+        storage.start()
+        deadline = time.monotonic() + 5.0
+        while time.monotonic() < deadline:
+            with sqlite3.connect(storage.queue.db_path) as connection:
+                attempts, created_at, due_at, last_error = connection.execute(
+                    "SELECT attempts, created_at, due_at, last_error FROM uploads").fetchone()
+            if attempts:
+                break
+            time.sleep(0.02)
+        assert attempts >= 1
+        assert "NoSuchBucket" in last_error
+        # The retry waits at least half the base backoff
+        assert due_at >= created_at + storage.base_backoff / 2
+
+        s3.create_bucket(Bucket=BUCKET)
+        wait_until_uploaded(storage)
+    finally:
+        storage.close()
+    assert bucket_keys(s3) == ["capture.jpg"]
+
+
+def test_backoff_doubles_with_jitter_up_to_the_cap(s3, tmp_path):
+    storage = make_storage(s3, tmp_path, base_backoff=2.0, max_backoff=30.0)
+    try:
+        for attempts, ceiling in [(0, 2.0), (1, 4.0), (3, 16.0), (10, 30.0)]:
+            for _ in range(20):
+                assert ceiling / 2 <= storage._backoff(attempts) <= ceiling
+    finally:
+        storage.close()
+
+
+def test_expired_leases_are_claimed_again(tmp_path):
+    path = write_file(tmp_path / "capture.jpg", 100)
+    queue = UploadQueue(str(tmp_path / "queue.sqlite3"), lease_timeout=0.2)
+    try:
+        job_id = queue.put(path, "capture.jpg")
+        assert [job[0] for job in queue.claim(10)] == [job_id]
+        # A leased job is hidden from other claims until its lease runs out
+        assert queue.claim(10) == []
+        time.sleep(0.3)
+        assert [job[0] for job in queue.claim(10)] == [job_id]
+        queue.complete([job_id])
+        assert len(queue) == 0
+    finally:
+        queue.close()
+
+
+def test_uploads_resume_after_a_restart(s3, tmp_path):
+    s3.create_bucket(Bucket=BUCKET)
+    paths = [write_file(tmp_path / f"capture_{index}.jpg", 4096) for index in range(3)]
+
+    # A first run queues the files and dies with one upload in flight; its lease would only expire much later
+    storage = make_storage(s3, tmp_path)
+    for index, path in enumerate(paths):
+        storage.upload_data(path, f"images/capture_{index}.jpg")
+    assert len(storage.queue.claim(1)) == 1
+    storage.queue.close()
+
+    storage = make_storage(s3, tmp_path)
+    try:
+        assert storage.pending() == 3
+        storage.start()
+        wait_until_uploaded(storage)
+    finally:
+        storage.close()
+    assert bucket_keys(s3) == [f"images/capture_{index}.jpg" for index in range(3)]